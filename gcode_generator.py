@@ -14,23 +14,30 @@ app = marimo.App(
 @app.cell
 def import_libraries():
     import marimo as mo
-    from src.sketch import Sketch
     from src.gcode import GCodeGenerator
     from src.plotter import plotting_functions
-    from src.printer import Nozzle,Printer
+    from src import estimator
+    from src.pipeline import GeometryCache, OutputCache, body_key, format_validation, job_layers, print_layers, validate_layers
+    from src.profiling import environment_profile, format_report, profiler, report_file, save_report
     from src.settings import SettingsManager
-    from src.shapes import Segment, Serpentine, set_position
     return (
         GCodeGenerator,
-        Nozzle,
-        Printer,
-        Segment,
-        Serpentine,
+        GeometryCache,
+        OutputCache,
         SettingsManager,
-        Sketch,
+        body_key,
+        environment_profile,
+        estimator,
+        format_report,
+        format_validation,
+        job_layers,
         mo,
         plotting_functions,
-        set_position,
+        print_layers,
+        profiler,
+        report_file,
+        save_report,
+        validate_layers,
     )
 
 
@@ -356,6 +363,7 @@ def input_cell(
 @app.cell
 def plot_sketch(
     mo,
+    plot_renderer,
     plotting_functions,
     printer_settings,
     purge_segment,
@@ -369,7 +377,7 @@ def plot_sketch(
     )
     segment_coords = [segment.x_coords,segment.y_coords] if sketch_settings.value['print_segment'] else None
     purge_segment_coords = [purge_segment.x_coords,purge_segment.y_coords] if printer_settings.value['purge_nozzle'] else None
-    plot = plotting_functions.plot_data(
+    plot = plot_renderer.render(
         plate=[plate_x,plate_y],
         nozzle_home=[printer_settings.value['x_home'],printer_settings.value['y_home']],
         serpentine_area=[serpentine.x_pos,serpentine.y_pos,serpentine.x_width,serpentine.y_width],
@@ -414,123 +422,121 @@ def _(mo, plot_area, segments_info_area):
 
 
 @app.cell
-def serpentine_instantiation(
-    Serpentine,
-    printer_settings,
-    serpentine_settings,
-    set_position,
-):
-    actual_serpentine_x_pos, actual_serpentine_y_pos = set_position(
-        printer_settings.value['plate_shape'],
-        printer_settings.value['plate_size'],
-        serpentine_settings.value['centered_serpentine'],
-        serpentine_settings.value['x_pos'],
-        serpentine_settings.value['y_pos'],
-        serpentine_settings.value['x_width'],
-        serpentine_settings.value['y_width'],
-        )
-
-    serpentine = Serpentine(
-        x_pos=actual_serpentine_x_pos,
-        y_pos=actual_serpentine_y_pos,
-        x_width=serpentine_settings.value['x_width'],
-        y_width=serpentine_settings.value['y_width'],
-        constant_pitch=serpentine_settings.value['constant_pitch'],
-        min_pitch=serpentine_settings.value['min_pitch'],
-        first_inlet_diameter=printer_settings.value['first_inlet_diameter'],
-        last_inlet_diameter=printer_settings.value['last_inlet_diameter'],
-        )
-    return (serpentine,)
+def caches_instantiation(GeometryCache, OutputCache, plotting_functions):
+    geometry_cache = GeometryCache()
+    output_cache = OutputCache()
+    plot_renderer = plotting_functions.PlotRenderer()
+    return geometry_cache, output_cache, plot_renderer
 
 
 @app.cell
-def segment_instantiation(
-    Segment,
+def geometry_settings(
     printer_settings,
+    purge_segment_settings,
     segment_settings,
-    serpentine,
     serpentine_settings,
+    sketch_settings,
 ):
-    shift = 0.5 if segment_settings.value['centered_segment'] is True else segment_settings.value['segment_y_pos']
-    segment = Segment(
-        x_position = serpentine.x_pos,
-        y_position=serpentine.y_pos + serpentine_settings.value['y_width']*shift,
-        length=serpentine.width,
-        inlet_diameter=printer_settings.value['first_inlet_diameter']
+    # without the file name, head and tail of the g-code: editing them only changes what is saved,
+    # not the instructions, the validation or the estimate
+    geometry_settings = (
+        sketch_settings.value
+        | serpentine_settings.value
+        | segment_settings.value
+        | printer_settings.value
+        | purge_segment_settings.value
     )
-    return (segment,)
+    return (geometry_settings,)
 
 
 @app.cell
-def purge_segment_instantiation(Segment, purge_segment_settings):
-    purge_segment = Segment(
-        x_position = purge_segment_settings.value['purge_x'],
-        y_position = purge_segment_settings.value['purge_y'],
-        length=purge_segment_settings.value['length'],
-        inlet_diameter=purge_segment_settings.value['purge_inlet_diameter'],
-        is_vertical=purge_segment_settings.value['is_vertical']
-    )
-    return (purge_segment,)
+def serpentine_instantiation(geometry_cache, geometry_settings):
+    serpentine = geometry_cache.serpentine(geometry_settings)
+    return (serpentine,)
 
 
 @app.cell
-def purge_sketch_instantiation(Sketch, purge_segment, sketch_settings):
-    purge_sketch = Sketch(
-        layer_height=sketch_settings.value['layer_height'],
-        number_of_layers=1,
-        )
-    purge_sketch.gen_segment_layer(purge_segment.trace_info)
-    purge_sketch.gen_coordinates()
-    return (purge_sketch,)
+def segment_instantiation(geometry_cache, geometry_settings):
+    segment = geometry_cache.segment(geometry_settings)
+    return (segment,)
 
 
 @app.cell
-def sketch_instantiation(Sketch, sketch_settings):
-    sketch = Sketch(
-        layer_height=sketch_settings.value['layer_height'],
-        number_of_layers=sketch_settings.value['number_of_layers'],
-        )
-    return (sketch,)
+def purge_segment_instantiation(geometry_cache, geometry_settings):
+    purge_segment = geometry_cache.purge_segment(geometry_settings)
+    return (purge_segment,)
 
 
 @app.cell
-def gen_serpentine_layers(serpentine, sketch):
-    sketch.gen_serpentine_layers(serpentine.trace_info)
-    return
+def purge_sketch_instantiation(geometry_cache, geometry_settings):
+    purge_sketch = geometry_cache.purge_sketch(geometry_settings)
+    return (purge_sketch,)
 
 
 @app.cell
-def gen_segment_layer(segment, sketch, sketch_settings):
-    if sketch_settings.value['print_segment'] is True:
-        sketch.gen_segment_layer(segment.trace_info)
-    return
+def sketch_instantiation(geometry_cache, geometry_settings):
+    sketch = geometry_cache.sketch(geometry_settings)
+    return (sketch,)
 
 
 @app.cell
-def gen_sketch_coordinates(sketch):
-    sketch.gen_coordinates()
+def geometry_cache_info(geometry_cache, mo, purge_sketch, segment, sketch):
+    cache_info = geometry_cache.cache_info()
+    mo.md(f'geometry cache: {cache_info.hits} hits, {cache_info.misses} misses, {cache_info.size}/{cache_info.max_size} entries')
     return
 
 
 @app.cell
-def nozzle_instantiation():
-    """nozzle = Nozzle(
-            x_home=printer_settings.value['x_home'],
-            y_home=printer_settings.value['y_home'],
-            z_home=printer_settings.value['z_home'],
-            layer_width=sketch_settings.value['layer_width'],
-            layer_height=sketch_settings.value['layer_height'],
-            retraction=printer_settings.value['retraction'],
-            lift_distance=printer_settings.value['lift_distance'],
-            moving_speed=printer_settings.value['moving_speed'],
-            printing_speed=printer_settings.value['printing_speed'],
-        )"""
-    return
+def print_instructions(
+    geometry_settings,
+    job_layers,
+    print_layers,
+    purge_sketch,
+    sketch,
+    validate_layers,
+):
+    layers = job_layers(geometry_settings, sketch, purge_sketch)
+    validation = validate_layers(geometry_settings, layers)
+    instructions = print_layers(geometry_settings, layers)
+    return instructions, validation
 
 
 @app.cell
-def printer_instantiation():
-    # printer = Printer(nozzle)
+def print_estimate(
+    environment_profile,
+    estimator,
+    format_report,
+    format_validation,
+    geometry_settings,
+    instructions,
+    mo,
+    profiler,
+    report_file,
+    save_report,
+    validation,
+):
+    estimate = estimator.estimate(
+        instructions,
+        layer_width=geometry_settings['layer_width'],
+        layer_height=geometry_settings['layer_height'],
+    )
+    validation_lines = '\n'.join(f'- {line}' for line in format_validation(validation).splitlines())
+    panels = [
+        mo.md("""**Estimate**"""),
+        mo.md('\n'.join(f'- {line}' for line in estimator.format_report(estimate).splitlines())),
+        mo.callout(
+            mo.md(f"""**Validation**\n\n{validation_lines}"""),
+            kind='success' if validation['valid'] and not validation['warnings'] else 'danger' if not validation['valid'] else 'warn',
+        ),
+    ]
+    if profiler.enabled:
+        # the work done since the previous update, when GCODE_PROFILE is set
+        profile_report = profiler.report()
+        profiler.reset()
+        if report_file(environment_profile() or '') is not None:
+            save_report(profile_report, report_file(environment_profile()))
+        panels.append(mo.md(f"""**Profile**\n\n```\n{format_report(profile_report)}\n```"""))
+    mo.vstack(panels)
     return
 
 
@@ -548,44 +554,28 @@ def save_gcode_file_button(mo):
 @app.cell
 def _(
     GCodeGenerator,
-    Nozzle,
-    Printer,
+    body_key,
     gcode_settings,
-    printer_settings,
-    purge_sketch,
-    sketch,
-    sketch_settings,
+    geometry_settings,
+    instructions,
+    output_cache,
 ):
     def save_gcode_function():
-        nozzle = Nozzle(
-            x_home=printer_settings.value['x_home'],
-            y_home=printer_settings.value['y_home'],
-            z_home=printer_settings.value['z_home'],
-            layer_width=sketch_settings.value['layer_width'],
-            layer_height=sketch_settings.value['layer_height'],
-            retraction=printer_settings.value['retraction'],
-            lift_distance=printer_settings.value['lift_distance'],
-            moving_speed=printer_settings.value['moving_speed'],
-            printing_speed=printer_settings.value['printing_speed'],
-        )
-        printer = Printer(nozzle)
-        instructions = []
-        if printer_settings.value['purge_nozzle'] is True:
-            instructions.append(printer.print_cad(purge_sketch.coordinates))
-        instructions.append(printer.print_cad(sketch.coordinates))
         gcode_generator = GCodeGenerator(
             filename=gcode_settings.value['filename'],
             gcode_head=gcode_settings.value['gcode_head'],
             gcode_tail=gcode_settings.value['gcode_tail'],
         )
-        gcode_generator.gen_gcode(instructions)
-        gcode_generator.save_gcode()
+        # the body saved before for the same settings, here or by the command, is copied between the current head and tail
+        with output_cache.body(body_key(geometry_settings), lambda: gcode_generator.iter_body(instructions)) as body:
+            gcode_generator.save_gcode(body)
     return (save_gcode_function,)
 
 
 @app.cell
-def save_gcode(mo, save_file_button, save_gcode_function):
+def save_gcode(mo, save_file_button, save_gcode_function, validation):
     mo.stop(not save_file_button.value)
+    mo.stop(not validation['valid'], mo.md('G-Code file not saved: fix the validation errors first'))
     save_gcode_function()
     mo.md('G-Code file saved')
     return
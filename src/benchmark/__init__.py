@@ -0,0 +1,3 @@
+from src.benchmark.benchmark import compare_results, run_suite, run_workload, workloads
+
+__all__ = ['compare_results', 'run_suite', 'run_workload', 'workloads']
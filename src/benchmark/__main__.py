@@ -0,0 +1,3 @@
+from src.benchmark.benchmark import main
+
+main()
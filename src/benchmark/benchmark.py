@@ -0,0 +1,278 @@
+import argparse
+from itertools import product
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable
+from src.gcode import GCodeGenerator, package_version
+from src.pipeline import build_serpentine, build_sketch, print_sketches
+
+BASE_SETTINGS = {
+    'filename': 'benchmark',
+    'plate_shape': 'rounded',
+    'plate_size': 200,
+    'printing_speed': 3600,
+    'first_inlet_diameter': 10,
+    'last_inlet_diameter': 20,
+    'moving_speed': 4200,
+    'retraction': 0,
+    'lift_distance': 5,
+    'x_home': 0,
+    'y_home': 0,
+    'z_home': 20,
+    'purge_nozzle': True,
+    'purge_x': -70,
+    'purge_y': -25,
+    'is_vertical': True,
+    'length': 50,
+    'purge_inlet_diameter': 30,
+    'x_width': 100,
+    'y_width': 100,
+    'constant_pitch': True,
+    'min_pitch': 10,
+    'centered_serpentine': True,
+    'x_pos': 0,
+    'y_pos': 0,
+    'centered_segment': True,
+    'segment_y_pos': 0.5,
+    'layer_height': 0.5,
+    'layer_width': 1,
+    'number_of_layers': 10,
+    'print_segment': True,
+}
+
+PITCHES = {
+    'tiny': 10,
+    'medium': 2,
+    'fine': 0.5,
+    'extreme': 0.1,
+}
+
+SUITES = {
+    'quick': {
+        'pitches': ['tiny', 'medium', 'fine'],
+        'layers': [1, 10, 100],
+        'purge': [True, False],
+    },
+    'full': {
+        'pitches': list(PITCHES),
+        'layers': [1, 10, 100, 1000, 10000],
+        'purge': [True, False],
+    },
+}
+
+STAGES = ['serpentine', 'sketch', 'print_cad', 'gen_gcode']
+
+# time differences below this many seconds are considered noise when comparing with a baseline
+NOISE_FLOOR = 0.005
+
+
+class _CharacterCounter:
+
+    def __init__(self) -> None:
+        """Text sink counting the characters written to it"""
+        self.count = 0
+
+    def write(
+            self,
+            text:str
+            ) -> int:
+        self.count += len(text)
+        return len(text)
+
+
+def workloads(
+        suite:str='quick',
+        max_points:int=5_000_000,
+        ) -> list[dict[str,Any]]:
+    """Lists the workloads of a suite, skipping the ones printing more than max_points points.
+
+    Args:
+        suite (str): the name of the suite (quick, full)
+        max_points (int): the largest number of printed points of a workload
+
+    Returns:
+        list[dict[str,Any]]: the name and settings of each workload
+    """
+    grid = SUITES[suite]
+    selected = []
+    for pitch, layers, purge in product(grid['pitches'], grid['layers'], grid['purge']):
+        settings = BASE_SETTINGS | {
+            'min_pitch': PITCHES[pitch],
+            'number_of_layers': layers,
+            'purge_nozzle': purge,
+        }
+        points_per_layer = 2*settings['x_width']/PITCHES[pitch]
+        if points_per_layer*layers > max_points:
+            continue
+        selected.append({
+            'name': f'{pitch}-{layers}-{"purge" if purge else "nopurge"}',
+            'settings': settings,
+        })
+    return selected
+
+
+def run_workload(
+        settings:dict[str,Any],
+        repeat:int=1,
+        measure_memory:bool=True,
+        ) -> dict[str,Any]:
+    """Runs the pipeline stage by stage, measuring wall time, peak memory and output size.
+    The time of each stage is the best of repeat runs; the peak memory is measured in a
+    separate run, since tracing the allocations slows the stages down.
+
+    Args:
+        settings (dict[str,Any]): the settings of the workload
+        repeat (int): the number of timed runs
+        measure_memory (bool): whether to measure the peak memory of each stage
+
+    Returns:
+        dict[str,Any]: the 'stages' measures, the number of 'points' printed and the 'output_bytes'
+    """
+    stages = {stage: {'seconds': float('inf')} for stage in STAGES}
+    for _ in range(repeat):
+        results = _run_stages(settings, lambda stage, seconds, peak: stages[stage].update(seconds=min(stages[stage]['seconds'], seconds)))
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            _run_stages(settings, lambda stage, seconds, peak: stages[stage].update(peak_bytes=peak))
+        finally:
+            tracemalloc.stop()
+    return {
+        'stages': stages,
+        'points': results['points'],
+        'output_bytes': results['output_bytes'],
+    }
+
+
+def _run_stages(
+        settings:dict[str,Any],
+        record:Callable[[str,float,int|None],None],
+        ) -> dict[str,int]:
+    """Runs the stages once, calling record(stage, seconds, peak_bytes) after each of them"""
+    results = {}
+
+    def measure(stage:str, function:Callable[[],Any]) -> Any:
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        value = function()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - start_memory if tracing else None
+        record(stage, seconds, peak)
+        return value
+
+    serpentine = measure('serpentine', lambda: build_serpentine(settings))
+    sketch = measure('sketch', lambda: build_sketch(settings, serpentine))
+    instructions = measure('print_cad', lambda: print_sketches(settings, sketch))
+    sink = _CharacterCounter()
+    generator = GCodeGenerator(settings['filename'], '', '')
+    measure('gen_gcode', lambda: generator.write_gcode(instructions, sink))
+    results['points'] = len(instructions)
+    results['output_bytes'] = sink.count
+    return results
+
+
+def run_suite(
+        suite:str='quick',
+        repeat:int=1,
+        measure_memory:bool=True,
+        max_points:int=5_000_000,
+        progress:Callable[[str],None]|None=None,
+        ) -> dict[str,Any]:
+    """Runs every workload of a suite.
+
+    Args:
+        suite (str): the name of the suite (quick, full)
+        repeat (int): the number of timed runs of each workload
+        measure_memory (bool): whether to measure the peak memory of each stage
+        max_points (int): the largest number of printed points of a workload
+        progress (Callable[[str],None] | None): called with the name of each workload before running it
+
+    Returns:
+        dict[str,Any]: the environment and the results, indexed by workload name
+    """
+    results = {}
+    for workload in workloads(suite, max_points):
+        if progress is not None:
+            progress(workload['name'])
+        results[workload['name']] = run_workload(workload['settings'], repeat, measure_memory)
+    return {
+        'suite': suite,
+        'version': package_version(),
+        'python': sys.version.split()[0],
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare_results(
+        current:dict[str,Any],
+        baseline:dict[str,Any],
+        threshold:float=0.2,
+        ) -> list[str]:
+    """Compares a run with a stored baseline.
+
+    Args:
+        current (dict[str,Any]): the results of run_suite
+        baseline (dict[str,Any]): the stored results of a previous run_suite
+        threshold (float): the relative increase considered a regression
+
+    Returns:
+        list[str]: a description of each regression (time, peak memory or output size) beyond the threshold
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            continue
+        for stage, measures in result['stages'].items():
+            reference_measures = reference['stages'].get(stage, {})
+            for measure, floor in [('seconds', NOISE_FLOOR), ('peak_bytes', 0)]:
+                value = measures.get(measure)
+                reference_value = reference_measures.get(measure)
+                if value is None or reference_value is None:
+                    continue
+                if value > reference_value*(1 + threshold) and value - reference_value > floor:
+                    regressions.append(f'{name} {stage} {measure}: {reference_value:.4g} -> {value:.4g}')
+        if result['output_bytes'] > reference['output_bytes']*(1 + threshold):
+            regressions.append(f'{name} output_bytes: {reference["output_bytes"]} -> {result["output_bytes"]}')
+    return regressions
+
+
+def main(argv:list[str]|None=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m src.benchmark',
+        description='Measures how geometry, kinematics and emission scale with the pitch and the number of layers',
+    )
+    parser.add_argument('--suite', choices=list(SUITES), default='quick', help='the set of workloads to run')
+    parser.add_argument('--repeat', type=int, default=3, help='the number of timed runs of each workload')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    parser.add_argument('--max-points', type=int, default=5_000_000, help='skip the workloads printing more points')
+    parser.add_argument('--output', default='benchmark.json', help='the JSON file the results are saved to')
+    parser.add_argument('--baseline', help='a JSON file of stored results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='the relative increase considered a regression')
+    arguments = parser.parse_args(argv)
+    results = run_suite(
+        arguments.suite,
+        arguments.repeat,
+        not arguments.no_memory,
+        arguments.max_points,
+        progress=lambda name: print(f'running {name}', file=sys.stderr),
+    )
+    with open(arguments.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    for name, result in results['results'].items():
+        timings = ' '.join(f'{stage}={measures["seconds"]*1000:.1f}ms' for stage, measures in result['stages'].items())
+        print(f'{name:<24} {timings} output={result["output_bytes"]}B')
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            regressions = compare_results(results, json.load(file), arguments.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,37 @@
+from src.benchmark import compare_results, run_workload, workloads
+from src.benchmark.benchmark import BASE_SETTINGS, STAGES
+
+
+def _results(seconds:float, peak_bytes:int, output_bytes:int) -> dict:
+    return {'results': {'tiny-1-purge': {
+        'stages': {'print_cad': {'seconds': seconds, 'peak_bytes': peak_bytes}},
+        'points': 10,
+        'output_bytes': output_bytes,
+    }}}
+
+
+def test_workloads_skip_large_ones():
+    names = [workload['name'] for workload in workloads('full', max_points=10_000)]
+    assert 'tiny-1-purge' in names
+    assert 'extreme-10000-purge' not in names
+
+
+def test_run_workload_measures_every_stage():
+    result = run_workload(BASE_SETTINGS | {'number_of_layers': 2}, repeat=1)
+    assert list(result['stages']) == STAGES
+    for measures in result['stages'].values():
+        assert measures['seconds'] >= 0
+        assert measures['peak_bytes'] >= 0
+    assert result['points'] > 0
+    assert result['output_bytes'] > 0
+
+
+def test_compare_results_flags_regressions():
+    baseline = _results(0.1, 1000, 500)
+    assert compare_results(_results(0.11, 1100, 500), baseline, threshold=0.2) == []
+    regressions = compare_results(_results(0.2, 2000, 700), baseline, threshold=0.2)
+    assert len(regressions) == 3
+
+
+def test_compare_results_ignores_noise():
+    assert compare_results(_results(0.002, 1000, 500), _results(0.001, 1000, 500)) == []
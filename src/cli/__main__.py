@@ -0,0 +1,3 @@
+from src.cli.cli import main
+
+main()
@@ -0,0 +1,295 @@
+import argparse
+import functools
+import sys
+from typing import Any, Iterator
+from src.pipeline import (
+    DEFAULT_SPACING,
+    OutputCache,
+    ValidationError,
+    build_serpentine,
+    build_sketch,
+    format_validation,
+    generate_gcode,
+    generate_layout_gcode,
+    layers_travel_savings,
+    layout_layers,
+    place_specimens,
+    sketch_layers,
+)
+from src.pipeline.output_cache import DEFAULT_CACHE_DIRECTORY
+from src.profiling import environment_profile
+from src.settings import SettingsManager
+
+# the defaults of --debounce and --window, those of src.cli.watch.DEBOUNCE and src.sender.sender.DEFAULT_WINDOW:
+# the watcher and the sender (and asyncio) are only imported by the runs using them
+DEBOUNCE = 0.3
+DEFAULT_WINDOW = 4
+
+
+def parse_overrides(
+        items:list[str],
+        settings:SettingsManager,
+        ) -> dict[str,Any]:
+    """Parses the --set key=value overrides, converting and checking each value as the settings file values are.
+
+    Args:
+        items (list[str]): the key=value overrides
+        settings (SettingsManager): the settings the overrides apply to
+
+    Returns:
+        dict[str,Any]: the overridden values, indexed by setting name
+    """
+    known = {option for options in settings.settings_model.values() for option in options}
+    overrides = {}
+    for item in items:
+        key, separator, value = item.partition('=')
+        key = key.strip()
+        if not separator:
+            raise ValueError(f'--set expects KEY=VALUE, got {item}')
+        if key not in known:
+            raise ValueError(f'unknown setting {key}')
+        overrides[key] = settings.parse_value(key, value.strip())
+    return overrides
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='gcode-generator',
+        description='Generates the g-code of the testing shape from the settings files, without the user interface',
+    )
+    parser.add_argument('--settings', help='the settings file (default: settings.ini)')
+    parser.add_argument('--head', help='the g-code head file (default: gcode_head.ini)')
+    parser.add_argument('--tail', help='the g-code tail file (default: gcode_tail.ini)')
+    parser.add_argument(
+        '--set',
+        dest='overrides',
+        action='append',
+        default=[],
+        metavar='KEY=VALUE',
+        help='overrides a setting of the settings file. Can be repeated',
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help="the output file, or '-' for the standard output (default: {filename}.gcode, or .bgcode with --binary)",
+    )
+    parser.add_argument('--binary', action='store_true', help='write binary g-code (.bgcode)')
+    parser.add_argument('--modal', action='store_true', help='leave out the words whose value did not change since the previous line')
+    parser.add_argument(
+        '--fixed-point',
+        action='store_true',
+        help='compute the positions and the extruded volume in integers, for an exactly reproducible extrusion',
+    )
+    parser.add_argument(
+        '--plan-travel',
+        action='store_true',
+        help='print every layer in the direction starting closest to where the previous one ended, and report the travel saved',
+    )
+    parser.add_argument(
+        '--unlifted-travel',
+        type=float,
+        default=0.0,
+        metavar='MM',
+        help='with --plan-travel, the longest travel to the next layer made without retracting and lifting (default: 0)',
+    )
+    parser.add_argument(
+        '--specimen',
+        dest='specimens',
+        action='append',
+        default=[],
+        metavar='KEY=VALUE,...',
+        help=(
+            'adds a specimen to a multi-specimen plate, with the settings it overrides (x_width, y_width, min_pitch, '
+            "first_inlet_diameter, ...), comma separated; '' for the settings file ones. Can be repeated"
+        ),
+    )
+    parser.add_argument(
+        '--spacing',
+        type=float,
+        default=DEFAULT_SPACING,
+        metavar='MM',
+        help=f'with --specimen, the gap between the specimens and from the edge of the plate (default: {DEFAULT_SPACING:g})',
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='keep running, and regenerate the output whenever the settings, head or tail file changes. Only the stages affected by the change run again',
+    )
+    parser.add_argument(
+        '--debounce',
+        type=float,
+        metavar='SECONDS',
+        help=f'with --watch, how long the files must be left unchanged before regenerating (default: {DEBOUNCE:g})',
+    )
+    parser.add_argument(
+        '--cache',
+        nargs='?',
+        const=DEFAULT_CACHE_DIRECTORY,
+        metavar='DIR',
+        help=(
+            f'reuse the g-code body generated before for the same settings, from this folder (default: {DEFAULT_CACHE_DIRECTORY}), '
+            'splicing the current head and tail around it'
+        ),
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=float,
+        default=256,
+        metavar='MB',
+        help='with --cache, the size of the cache; the least recently used bodies are removed beyond it (default: 256)',
+    )
+    parser.add_argument(
+        '--send',
+        metavar='PORT',
+        help='stream the g-code to the printer on this serial port (e.g. /dev/ttyACM0) as it is generated, instead of writing a file',
+    )
+    parser.add_argument('--baudrate', type=int, default=115200, help='with --send, the speed of the port (default: 115200)')
+    parser.add_argument(
+        '--window',
+        type=int,
+        help=f'with --send, the commands sent ahead of the acknowledgements of the printer (default: {DEFAULT_WINDOW})',
+    )
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const='1',
+        metavar='REPORT.json',
+        help=(
+            'report the time, calls and peak memory of each stage and the points, moves, lines and bytes produced, '
+            'on the standard error and in this JSON file if given. Tracing the memory slows the stages down, so compare '
+            'their times with each other only. Also turned on by the GCODE_PROFILE environment variable, set to 1 or to the JSON file'
+        ),
+    )
+    return parser
+
+
+def main(argv:list[str]|None=None) -> None:
+    """Entry point of the gcode-generator command"""
+    parser = build_parser()
+    arguments = parser.parse_args(argv)
+    try:
+        settings = SettingsManager(arguments.settings, arguments.head, arguments.tail)
+        overrides = parse_overrides(arguments.overrides, settings)
+        values = settings.as_dict() | overrides
+        specimens = [parse_overrides([item for item in specimen.split(',') if item.strip()], settings) for specimen in arguments.specimens]
+    except ValueError as error:
+        parser.error(str(error))
+    if arguments.send is not None:
+        if arguments.watch or arguments.binary or arguments.output is not None:
+            parser.error('--send cannot be combined with --watch, --binary or --output')
+        if arguments.window is not None and arguments.window < 1:
+            parser.error('the window must hold at least one command')
+    if arguments.cache_size <= 0:
+        parser.error('--cache-size must be greater than 0')
+    if arguments.profile is not None:
+        from src.profiling import report_file
+        if arguments.watch:
+            parser.error('--profile cannot be combined with --watch, which reports the time of each rebuild')
+        if arguments.profile != '1' and report_file(arguments.profile) is None:
+            parser.error('the profile report must be a .json file')
+    profile = environment_profile() if arguments.profile is None else arguments.profile
+    if arguments.watch:
+        if arguments.output == '-':
+            parser.error('--watch needs an output file')
+        from src.cli.watch import IncrementalBuild, watch
+        build = IncrementalBuild(
+            settings,
+            overrides,
+            specimens,
+            arguments.spacing,
+            output=arguments.output,
+            binary=arguments.binary,
+            modal=arguments.modal,
+            fixed_point=arguments.fixed_point,
+            plan_travel=arguments.plan_travel,
+            unlifted_travel=arguments.unlifted_travel,
+        )
+        try:
+            watch(build, debounce=DEBOUNCE if arguments.debounce is None else arguments.debounce)
+        except KeyboardInterrupt:
+            pass
+        return
+    if profile is None:
+        _generate(parser, arguments, settings, values, specimens)
+        return
+    from src.profiling import format_report, profiler, report_file, save_report
+    profiler.enable()
+    try:
+        _generate(parser, arguments, settings, values, specimens)
+    finally:
+        # also reported when the generation stops on an error, e.g. invalid layers
+        report = profiler.report()
+        profiler.disable()
+        print(format_report(report), file=sys.stderr)
+        if report_file(profile) is not None:
+            save_report(report, report_file(profile))
+
+
+def _generate(
+        parser:argparse.ArgumentParser,
+        arguments:argparse.Namespace,
+        settings:SettingsManager,
+        values:dict[str,Any],
+        specimens:list[dict[str,Any]],
+        ) -> None:
+    """Generates and writes or sends the g-code of a single run, exiting on errors"""
+    cache = None
+    if arguments.cache is not None:
+        cache = OutputCache(arguments.cache, int(arguments.cache_size*(1 << 20)))
+    options = {
+        'output': arguments.output if arguments.send is None else functools.partial(_send, arguments),
+        'binary': arguments.binary,
+        'modal': arguments.modal,
+        'fixed_point': arguments.fixed_point,
+        'plan_travel': arguments.plan_travel,
+        'unlifted_travel': arguments.unlifted_travel,
+        'cache': cache,
+        'validation': _show_validation,
+    }
+    try:
+        if specimens:
+            generate_layout_gcode(values, specimens, settings.gcode_head, settings.gcode_tail, spacing=arguments.spacing, **options)
+        else:
+            generate_gcode(values, settings.gcode_head, settings.gcode_tail, **options)
+    except ValidationError:
+        print('nothing written: fix the errors above', file=sys.stderr)
+        sys.exit(1)
+    except ValueError as error:
+        # e.g. the specimens do not fit on the plate
+        parser.error(str(error))
+    if cache is not None and cache.hits:
+        print('g-code body reused from the cache', file=sys.stderr)
+    elif arguments.plan_travel:
+        if specimens:
+            layers = layout_layers(values, place_specimens(values, specimens, arguments.spacing))
+        else:
+            layers = sketch_layers(values, build_sketch(values, build_serpentine(values)))
+        savings = layers_travel_savings(values, layers, arguments.unlifted_travel)
+        print(
+            f"travel: {savings['before']['distance']:.1f} mm -> {savings['after']['distance']:.1f} mm, "
+            f"lifts: {savings['before']['lifts']} -> {savings['after']['lifts']}, "
+            f"about {savings['seconds_saved']:.1f} s saved",
+            file=sys.stderr,
+        )
+
+
+def _show_validation(report:dict[str,Any]) -> None:
+    """Prints the errors and warnings of the validation"""
+    if report['errors'] or report['warnings']:
+        print(format_validation(report), file=sys.stderr)
+
+
+def _send(
+        arguments:argparse.Namespace,
+        pieces:Iterator[str],
+        ) -> int:
+    """Streams the g-code to the printer on the --send port as it is generated, exiting if the transfer fails"""
+    import asyncio
+    from src.sender import format_stats, send_gcode
+    window = DEFAULT_WINDOW if arguments.window is None else arguments.window
+    try:
+        stats = asyncio.run(send_gcode(arguments.send, pieces, arguments.baudrate, window))
+    except (OSError, TimeoutError, ValueError) as error:
+        print(f'sending failed: {error}', file=sys.stderr)
+        sys.exit(1)
+    print(format_stats(stats), file=sys.stderr)
+    return stats['bytes']
@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+from src.cli import main
+from src.cli.cli import parse_overrides
+from src.profiling import profiler
+from src.settings import SettingsManager
+import pytest
+
+SETTINGS_FILES = ['--settings', 'defaults/settings.ini', '--head', 'defaults/gcode_head.ini', '--tail', 'defaults/gcode_tail.ini']
+
+def test_parse_overrides():
+    settings = SettingsManager('defaults/settings.ini', 'defaults/gcode_head.ini', 'defaults/gcode_tail.ini')
+    assert parse_overrides(['number_of_layers=3', 'plate_shape = squared'], settings) == {'number_of_layers': 3, 'plate_shape': 'squared'}
+    with pytest.raises(ValueError):
+        parse_overrides(['unknown=3'], settings)
+
+def test_main(tmp_path):
+    output = tmp_path/'test.gcode'
+    main([*SETTINGS_FILES, '--set', 'printing_speed=1234', '-o', str(output)])
+    assert 'F1234' in output.read_text()
+
+def test_no_ui_imports():
+    code = 'import sys, src.cli; print(any(name in sys.modules for name in ("marimo", "matplotlib")))'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+
+def test_no_optional_imports():
+    # the watcher, the sender and the memory tracing are only imported by the runs using them
+    modules = ('asyncio', 'tracemalloc', 'src.sender', 'src.cli.watch', 'src.service')
+    code = f'import sys, src.cli; print([name for name in {modules!r} if name in sys.modules])'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+def test_lazy_defaults():
+    from src.cli import cli, watch
+    from src.sender import sender
+    assert (cli.DEBOUNCE, cli.DEFAULT_WINDOW) == (watch.DEBOUNCE, sender.DEFAULT_WINDOW)
+
+def _last_e(gcode:str) -> float:
+    line = next(line for line in reversed(gcode.splitlines()) if ' E' in line)
+    return float(line.split(' E')[1].split()[0])
+
+def test_main_fixed_point(tmp_path):
+    floating = tmp_path/'floating.gcode'
+    fixed = tmp_path/'fixed.gcode'
+    main([*SETTINGS_FILES, '-o', str(floating)])
+    main([*SETTINGS_FILES, '--fixed-point', '-o', str(fixed)])
+    assert len(fixed.read_text().splitlines()) == len(floating.read_text().splitlines())
+    assert abs(_last_e(fixed.read_text()) - _last_e(floating.read_text())) < 0.01
+
+def test_main_plan_travel(tmp_path, capsys):
+    output = tmp_path/'test.gcode'
+    main([*SETTINGS_FILES, '--plan-travel', '--set', 'number_of_layers=4', '-o', str(output)])
+    assert 's saved' in capsys.readouterr().err
+    assert 'G1 Z1 F4200' in output.read_text().splitlines()
+
+def test_main_specimens(tmp_path, monkeypatch, capsys):
+    settings_files = [os.path.abspath(item) if item.endswith('.ini') else item for item in SETTINGS_FILES]
+    monkeypatch.chdir(tmp_path)
+    specimen = 'x_width=40,y_width=30'
+    main([*settings_files, '--set', 'filename=plate', '--specimen', specimen, '--specimen', f'{specimen},min_pitch=2', '--plan-travel'])
+    assert (tmp_path/'plate.gcode').exists() and (tmp_path/'plate_layout.csv').exists()
+    assert 's saved' in capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        main([*settings_files, '--specimen', 'plate_size=10'])
+
+def test_main_refuses_invalid_job(tmp_path, capsys):
+    output = tmp_path/'test.gcode'
+    with pytest.raises(SystemExit) as error:
+        main([*SETTINGS_FILES, '--set', 'purge_x=-700', '-o', str(output)])
+    assert error.value.code == 1
+    assert 'purge segment lie off' in capsys.readouterr().err
+    assert not output.exists()
+
+def test_main_profile(tmp_path, capsys):
+    output = tmp_path/'test.gcode'
+    report = tmp_path/'profile.json'
+    main([*SETTINGS_FILES, '-o', str(output), '--profile', str(report)])
+    profile = json.loads(report.read_text())
+    assert {'serpentine', 'sketch', 'validation', 'print_cad', 'gen_gcode', 'write'} <= set(profile['stages'])
+    assert profile['counters']['bytes'] == len(output.read_text())
+    assert 'gen_gcode' in capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        main([*SETTINGS_FILES, '--profile', 'profile.txt'])
+
+def test_main_profile_on_error(tmp_path, capsys):
+    output = tmp_path/'test.gcode'
+    report = tmp_path/'profile.json'
+    with pytest.raises(SystemExit):
+        main([*SETTINGS_FILES, '--set', 'purge_x=-700', '-o', str(output), '--profile', str(report)])
+    # reported up to the failed validation, nothing written
+    assert 'validation' in json.loads(report.read_text())['stages']
+    assert 'validation' in capsys.readouterr().err
+    assert not output.exists() and not profiler.enabled
+    report.unlink()
+    with pytest.raises(SystemExit):
+        main([*SETTINGS_FILES, '--specimen', 'plate_size=10', '--profile', str(report)])
+    assert report.exists() and not profiler.enabled
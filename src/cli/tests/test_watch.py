@@ -0,0 +1,119 @@
+import os
+import shutil
+from src.cli.watch import IncrementalBuild, format_rebuild, watch
+from src.settings import SettingsManager
+import pytest
+
+@pytest.fixture
+def build(tmp_path) -> IncrementalBuild:
+    for name in ['settings.ini', 'gcode_head.ini', 'gcode_tail.ini']:
+        shutil.copy(os.path.join('defaults', name), tmp_path/name)
+    settings = SettingsManager(*(str(tmp_path/name) for name in ['settings.ini', 'gcode_head.ini', 'gcode_tail.ini']))
+    return IncrementalBuild(settings, output=str(tmp_path/'test.gcode'))
+
+def _edit(file_name:str, old:str, new:str) -> None:
+    """Edits a file, moving its modification time forward even if the clock is coarse"""
+    status = os.stat(file_name)
+    with open(file_name) as file:
+        text = file.read()
+    if old not in text:
+        return
+    with open(file_name, 'w') as file:
+        file.write(text.replace(old, new))
+    os.utime(file_name, ns=(status.st_atime_ns, status.st_mtime_ns + 1_000_000))
+
+def test_rebuild_reruns_changed_stages(build:IncrementalBuild):
+    first = build.rebuild()
+    assert list(first['timings']) == ['settings', 'geometry', 'validation', 'kinematics', 'body', 'write']
+    assert first['reused'] == [] and first['output'] == build.output
+    gcode = open(build.output).read()
+    body = gcode[gcode.index('\n\n'):]
+
+    _edit(build.settings.GCODE_HEAD_FILE_NAME, 'G28', 'G28 X Y')
+    head = build.rebuild()
+    assert head['changed'] == ['gcode_head']
+    assert list(head['timings']) == ['settings', 'write']
+    gcode = open(build.output).read()
+    assert gcode.startswith(build.settings.gcode_head) and gcode.endswith(body)
+
+    _edit(build.settings.SETTINGS_FILE_NAME, 'printing_speed = 3600', 'printing_speed = 1234')
+    speed = build.rebuild()
+    assert speed['changed'] == ['printing_speed']
+    assert speed['reused'] == ['geometry']
+    assert 'F1234' in open(build.output).read()
+
+    nothing = build.rebuild()
+    assert list(nothing['timings']) == ['settings'] and nothing['output'] is None
+    assert format_rebuild(nothing, 4).endswith('-> up to date')
+
+def test_rebuild_specimens_on_layer_width(build:IncrementalBuild, tmp_path, monkeypatch):
+    # the layout is saved in the working directory
+    monkeypatch.chdir(tmp_path)
+    build.specimens = [{'x_width': 20, 'y_width': 20}, {'x_width': 30, 'y_width': 20}]
+    build.rebuild()
+    placed = build._results['geometry'][1]
+    # the margin of the placement depends on the layer width, not on the speeds
+    _edit(build.settings.SETTINGS_FILE_NAME, 'printing_speed = 3600', 'printing_speed = 1234')
+    assert 'geometry' in build.rebuild()['reused']
+    _edit(build.settings.SETTINGS_FILE_NAME, 'layer_width = 1', 'layer_width = 2')
+    width = build.rebuild()
+    assert width['reused'] == [] and 'layer_width' in build.geometry_inputs
+    assert build._results['geometry'][1] != placed
+
+def test_rebuild_skips_invalid_jobs(build:IncrementalBuild):
+    build.rebuild()
+    os.remove(build.output)
+    _edit(build.settings.SETTINGS_FILE_NAME, 'purge_x = -80', 'purge_x = -700')
+    invalid = build.rebuild()
+    assert not invalid['report']['valid'] and invalid['output'] is None
+    assert not os.path.exists(build.output)
+    assert 'nothing written' in format_rebuild(invalid, 2)
+    _edit(build.settings.SETTINGS_FILE_NAME, 'purge_x = -700', 'purge_x = -80')
+    assert build.rebuild()['output'] == build.output
+    assert os.path.exists(build.output)
+
+def test_watch_debounces_bursts(build:IncrementalBuild, capsys):
+    # the files are written at every poll of the debounce, then left alone
+    writes = iter(range(1, 4))
+    def sleep(seconds:float):
+        write = next(writes, None)
+        if write is not None:
+            _edit(build.settings.SETTINGS_FILE_NAME, f'number_of_layers = {write + 9}', f'number_of_layers = {write + 10}')
+    watch(build, rebuilds=2, sleep=sleep)
+    log = capsys.readouterr().err.splitlines()
+    assert [line.split(':')[0] for line in log] == ['rebuild 1', 'rebuild 2 [number_of_layers]']
+    assert build.settings.value('number_of_layers') == 13
+
+def test_watch_logs_setting_errors(build:IncrementalBuild, capsys):
+    def sleep(seconds:float):
+        _edit(build.settings.SETTINGS_FILE_NAME, 'number_of_layers = 10', 'number_of_layers = -1')
+    watch(build, rebuilds=2, sleep=sleep)
+    assert 'rebuild 2: number_of_layers must be at least 1' in capsys.readouterr().err
+
+def test_watch_recovers_from_invalid_settings(build:IncrementalBuild, capsys):
+    settings_file = build.settings.SETTINGS_FILE_NAME
+    valid = open(settings_file).read()
+
+    def save_invalid():
+        lines = valid.replace('number_of_layers = 10', 'number_of_layers = -3').splitlines()
+        with open(settings_file, 'w') as file:
+            file.write('\n'.join(line for line in lines if not line.startswith('print_segment')))
+
+    def save_valid():
+        with open(settings_file, 'w') as file:
+            file.write(valid.replace('number_of_layers = 10', 'number_of_layers = 4'))
+        status = os.stat(settings_file)
+        os.utime(settings_file, ns=(status.st_atime_ns, status.st_mtime_ns + 2_000_000))
+
+    # an edit at the first poll after each rebuild, then a quiet debounce
+    actions = iter([save_invalid, None, save_valid, None])
+    def sleep(seconds:float):
+        action = next(actions, None)
+        if action is not None:
+            action()
+    watch(build, rebuilds=3, sleep=sleep)
+    log = capsys.readouterr().err
+    assert 'rebuild 2: number_of_layers must be at least 1' in log
+    assert 'rebuild 3 [number_of_layers]' in log and log.rstrip().endswith(f'-> {build.output}')
+    assert build.settings.value('number_of_layers') == 4
+    assert build.settings.value('print_segment') is False
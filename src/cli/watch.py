@@ -0,0 +1,291 @@
+import os
+import sys
+import time
+from typing import Any, Callable, Iterable
+from src.gcode import GCodeGenerator
+from src.pipeline import (
+    DEFAULT_SPACING,
+    GeometryCache,
+    format_validation,
+    layout_layers,
+    place_specimens,
+    plan_sketch_travels,
+    print_layers,
+    save_layout_info,
+    sketch_layers,
+    stage_key,
+    validate_layers,
+)
+from src.pipeline.pipeline import INSTRUCTION_INPUTS
+from src.settings import SettingsManager
+
+WATCH_INTERVAL = 0.2
+DEBOUNCE = 0.3
+
+
+class IncrementalBuild:
+
+    def __init__(
+            self,
+            settings:SettingsManager,
+            overrides:dict[str,Any]|None=None,
+            specimens:list[dict[str,Any]]|None=None,
+            spacing:float=DEFAULT_SPACING,
+            output:str|None=None,
+            binary:bool=False,
+            modal:bool=False,
+            fixed_point:bool=False,
+            plan_travel:bool=False,
+            unlifted_travel:float=0.0,
+            ) -> None:
+        """Regenerates the g-code of the settings files, running again only the stages whose inputs changed
+        since the previous build: geometry (sketches and layers), validation, kinematics (printer instructions),
+        body (g-code text) and write. A change of the head or tail file only writes the cached body again.
+
+        Args:
+            settings (SettingsManager): the settings files, read again on every build
+            overrides (dict[str,Any] | None): the settings overriding those of the settings file
+            specimens (list[dict[str,Any]] | None): the settings overridden by each specimen of a multi-specimen plate
+            spacing (float): with specimens, the gap between the specimens and from the edge of the plate
+            output (str | None): the output file. Defaults to {filename}.gcode, or .bgcode if binary is set
+            binary (bool): write binary g-code (.bgcode) instead of text
+            modal (bool): leave out the words whose value did not change since the previous line
+            fixed_point (bool): print with a FixedPointNozzle
+            plan_travel (bool): print the layers in the direction saving the most travel
+            unlifted_travel (float): when planning, the longest travel made without lifting the nozzle
+        """
+        self.settings = settings
+        self.overrides = overrides or {}
+        self.specimens = specimens or []
+        self.spacing = spacing
+        self.output = output
+        self.binary = binary
+        self.modal = modal
+        self.fixed_point = fixed_point
+        self.plan_travel = plan_travel
+        self.unlifted_travel = unlifted_travel
+        self.geometry_cache = GeometryCache()
+        # the settings the layers were built from, recorded by the last geometry stage
+        self.geometry_inputs = ()
+        self._keys = {}
+        self._results = {}
+
+    @property
+    def files(self) -> list[str]:
+        """The settings, g-code head and g-code tail files the build reads"""
+        return [self.settings.SETTINGS_FILE_NAME, self.settings.GCODE_HEAD_FILE_NAME, self.settings.GCODE_TAIL_FILE_NAME]
+
+    def rebuild(self) -> dict[str,Any]:
+        """Reads the files that changed and runs the stages whose inputs changed.
+        Nothing is written if the validation finds errors.
+
+        Returns:
+            dict[str,Any]: the 'changed' settings (and gcode_head/gcode_tail), the 'timings' in seconds of the stages run,
+            the stages 'reused', the validation 'report' and the 'output' written (None if nothing was written)
+
+        Raises:
+            ValueError: if a setting of the file is not valid, or the specimens do not fit on the plate
+        """
+        timings = {}
+        start = time.perf_counter()
+        changed = self.settings.reload_if_changed() | self.settings.reload_gcode_if_changed()
+        values = self.settings.as_dict() | self.overrides
+        timings['settings'] = time.perf_counter() - start
+        layers, placed = self._stage('geometry', stage_key(values, self.geometry_inputs), lambda: self._layers(values), timings)
+        if 'geometry' in timings:
+            # keyed on the settings the stage actually read
+            self._keys['geometry'] = stage_key(values, self.geometry_inputs)
+        instruction_key = stage_key(values, INSTRUCTION_INPUTS + self.geometry_inputs)
+        report = self._stage('validation', instruction_key, lambda: validate_layers(values, layers), timings)
+        output = None
+        if report['valid']:
+            instructions = self._stage('kinematics', instruction_key, lambda: print_layers(values, layers, self.fixed_point), timings)
+            generator = GCodeGenerator(values['filename'], self.settings.gcode_head, self.settings.gcode_tail, modal=self.modal)
+            body = self._stage('body', instruction_key, lambda: ''.join(generator.iter_body(instructions)), timings)
+            target = self.output or f"{values['filename']}.{'bgcode' if self.binary else 'gcode'}"
+            write_key = (instruction_key, generator.head, generator.tail, target)
+            if not os.path.exists(target):
+                # removed since it was written
+                self._keys.pop('write', None)
+            self._stage('write', write_key, lambda: self._write(generator, body, target, values, placed), timings)
+            if 'write' in timings:
+                output = target
+        return {
+            'changed': sorted(changed),
+            'timings': timings,
+            'reused': [stage for stage in ('geometry', 'validation', 'kinematics', 'body', 'write') if stage not in timings],
+            'report': report,
+            'output': output,
+        }
+
+    def _stage(
+            self,
+            name:str,
+            key:tuple,
+            run:Callable[[],Any],
+            timings:dict[str,float],
+            ) -> Any:
+        """Returns the result of a stage, running it again, and timing it, only if its key changed"""
+        if name in self._keys and self._keys[name] == key:
+            return self._results[name]
+        # a failing stage must run again on the next build
+        self._keys.pop(name, None)
+        start = time.perf_counter()
+        self._results[name] = run()
+        timings[name] = time.perf_counter() - start
+        self._keys[name] = key
+        return self._results[name]
+
+    def _layers(self, values:dict[str,Any]) -> tuple[list[Iterable[dict]],list[dict[str,Any]]|None]:
+        """Lists the layers of the job as they are printed, and the settings of the placed specimens if any.
+        The settings read on the way are recorded in geometry_inputs."""
+        values = _ReadSettings(values)
+        purge_sketch = self.geometry_cache.purge_sketch(values) if values['purge_nozzle'] is True else None
+        if self.specimens:
+            placed = place_specimens(values, self.specimens, self.spacing)
+            layers = layout_layers(values, placed, purge_sketch)
+        else:
+            placed = None
+            layers = sketch_layers(values, self.geometry_cache.sketch(values), purge_sketch)
+        if self.plan_travel:
+            layers = plan_sketch_travels(values, layers, self.unlifted_travel)
+        self.geometry_inputs = tuple(sorted(values.read))
+        return layers, placed
+
+    def _write(
+            self,
+            generator:GCodeGenerator,
+            body:str,
+            target:str,
+            values:dict[str,Any],
+            placed:list[dict[str,Any]]|None,
+            ) -> None:
+        """Writes the head, the rendered body and the tail to the target, and the layout of the specimens if any"""
+        if self.binary:
+            generator.write_bgcode(body, target)
+        else:
+            generator.write_gcode(body, target)
+        if placed is not None:
+            save_layout_info(values['filename'], placed)
+
+
+class _ReadSettings(dict):
+
+    def __init__(
+            self,
+            values:dict[str,Any],
+            read:set[str]|None=None,
+            overridden:frozenset[str]=frozenset(),
+            ) -> None:
+        """Settings recording the names read through them into read, as do the settings merged from them
+        with |, e.g. those of the specimens, except for the names the merge overrides"""
+        super().__init__(values)
+        self.read = set() if read is None else read
+        self.overridden = overridden
+
+    def __getitem__(self, name:str) -> Any:
+        if name not in self.overridden:
+            self.read.add(name)
+        return super().__getitem__(name)
+
+    def get(self, name:str, default:Any=None) -> Any:
+        return self[name] if name in self else default
+
+    def __or__(self, other:dict[str,Any]) -> '_ReadSettings':
+        return _ReadSettings(dict.__or__(self, other), self.read, self.overridden | set(other))
+
+
+def format_rebuild(
+        result:dict[str,Any],
+        number:int,
+        ) -> str:
+    """Formats the timings of a rebuild as a log line.
+
+    Args:
+        result (dict[str,Any]): the result of IncrementalBuild.rebuild
+        number (int): the number of the rebuild
+
+    Returns:
+        str: the log line
+    """
+    changed = f" [{', '.join(result['changed'])}]" if result['changed'] else ''
+    stages = ', '.join(f'{stage} {seconds*1000:.1f} ms' for stage, seconds in result['timings'].items())
+    line = f'rebuild {number}{changed}: {stages}, total {sum(result["timings"].values())*1000:.1f} ms'
+    if result['reused']:
+        line += f" (reused {', '.join(result['reused'])})"
+    if result['output'] is not None:
+        line += f" -> {result['output']}"
+    elif not result['report']['valid']:
+        line += ' -> nothing written: fix the errors above'
+    else:
+        line += ' -> up to date'
+    return line
+
+
+def watch(
+        build:IncrementalBuild,
+        interval:float=WATCH_INTERVAL,
+        debounce:float=DEBOUNCE,
+        rebuilds:int|None=None,
+        sleep:Callable[[float],None]=time.sleep,
+        ) -> None:
+    """Builds the g-code, then polls the files of the build and rebuilds it whenever they change.
+    A burst of writes triggers a single rebuild, once the files have been left unchanged for the debounce time.
+    The timings of each rebuild, and the problems found, are logged to the standard error.
+
+    Args:
+        build (IncrementalBuild): the build
+        interval (float): the seconds between two polls of the files
+        debounce (float): the seconds the files must be left unchanged before rebuilding
+        rebuilds (int | None): return after this number of rebuilds, the first build included. None to watch until interrupted
+        sleep (Callable[[float],None]): waits for the given seconds
+    """
+    stamps = _file_stamps(build.files)
+    number = 0
+    while True:
+        number += 1
+        _log_rebuild(build, number)
+        if rebuilds is not None and number >= rebuilds:
+            return
+        while True:
+            sleep(interval)
+            current = _file_stamps(build.files)
+            if current != stamps:
+                break
+        while True:
+            sleep(debounce)
+            settled = _file_stamps(build.files)
+            if settled == current:
+                break
+            current = settled
+        stamps = current
+
+
+def _log_rebuild(
+        build:IncrementalBuild,
+        number:int,
+        ) -> None:
+    """Rebuilds and logs the timings, or the error that stopped the rebuild"""
+    try:
+        result = build.rebuild()
+    except (OSError, ValueError) as error:
+        # e.g. an invalid setting, or a file removed while being saved: the next change is built again
+        print(f'rebuild {number}: {error}', file=sys.stderr)
+        return
+    report = result['report']
+    if 'validation' in result['timings'] and (report['errors'] or report['warnings']):
+        print(format_validation(report), file=sys.stderr)
+    print(format_rebuild(result, number), file=sys.stderr)
+
+
+def _file_stamps(file_names:list[str]) -> list[tuple[int,int]|None]:
+    """Returns the modification time and size of each file, None for the missing ones"""
+    stamps = []
+    for file_name in file_names:
+        try:
+            status = os.stat(file_name)
+        except OSError:
+            stamps.append(None)
+        else:
+            stamps.append((status.st_mtime_ns, status.st_size))
+    return stamps
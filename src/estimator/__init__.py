@@ -0,0 +1,3 @@
+from src.estimator.estimator import MachineLimits, estimate, format_duration, format_report
+
+__all__ = ['MachineLimits', 'estimate', 'format_duration', 'format_report']
@@ -0,0 +1,3 @@
+from src.estimator.estimator import main
+
+main()
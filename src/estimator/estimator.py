@@ -0,0 +1,265 @@
+import argparse
+import json
+import numpy as np
+from src.gcode import read_gcode
+from src.printer import InstructionBuffer
+
+DEFAULT_MAX_FEEDRATE = {
+    'X': 200,
+    'Y': 200,
+    'Z': 12,
+    'E': 120,
+}
+DEFAULT_MAX_ACCELERATION = {
+    'X': 1000,
+    'Y': 1000,
+    'Z': 200,
+    'E': 5000,
+}
+
+
+class MachineLimits:
+
+    def __init__(
+            self,
+            max_feedrate:dict[str,float]|None=None,
+            max_acceleration:dict[str,float]|None=None,
+            acceleration:float=1000,
+            travel_acceleration:float=1500,
+            junction_deviation:float=0.05,
+            minimum_speed:float=0.05,
+            ) -> None:
+        """Class representing the motion limits of a printer, as configured in its firmware.
+
+        Args:
+            max_feedrate (dict[str,float] | None): the highest speed of each axis (X, Y, Z, E), mm/s. Defaults to DEFAULT_MAX_FEEDRATE
+            max_acceleration (dict[str,float] | None): the highest acceleration of each axis, mm/s². Defaults to DEFAULT_MAX_ACCELERATION
+            acceleration (float): the acceleration of the extruding moves, mm/s²
+            travel_acceleration (float): the acceleration of the other moves, mm/s²
+            junction_deviation (float): the junction deviation, mm, setting how fast corners are taken
+            minimum_speed (float): the speed of the sharpest corners and reversals, mm/s
+        """
+        self.max_feedrate = dict(DEFAULT_MAX_FEEDRATE if max_feedrate is None else max_feedrate)
+        self.max_acceleration = dict(DEFAULT_MAX_ACCELERATION if max_acceleration is None else max_acceleration)
+        self.acceleration = acceleration
+        self.travel_acceleration = travel_acceleration
+        self.junction_deviation = junction_deviation
+        self.minimum_speed = minimum_speed
+
+
+def estimate(
+        instructions:InstructionBuffer,
+        limits:MachineLimits|None=None,
+        layer_width:float|None=None,
+        layer_height:float|None=None,
+        ) -> dict:
+    """Estimates the duration of a job and the material it uses.
+
+    Every move follows a trapezoidal speed profile: it accelerates from its entry speed up to its
+    feedrate (capped by the axis limits), cruises, and decelerates to the entry speed of the next
+    move. The speed through each corner is capped with the junction deviation model, and the
+    entry speeds are then lowered where the acceleration would not reach them in time. Both
+    passes over the moves are min-plus scans, computed with cumulative minimums, so the whole
+    estimate is a handful of array operations.
+
+    A move extrudes when E increases while the nozzle moves; every other move (lifts, travels,
+    retractions) is a travel move. Each move belongs to the layer of the next extruding move.
+
+    Args:
+        instructions (InstructionBuffer): the instructions, as built by Printer.print_cad or read from a g-code file
+        limits (MachineLimits | None): the motion limits of the printer. Defaults to MachineLimits()
+        layer_width (float | None): the width of the trace, to compute the printed volume
+        layer_height (float | None): the height of the trace, to compute the printed volume
+
+    Returns:
+        dict: the total 'seconds', 'print_seconds' and 'travel_seconds', the 'print_distance' and
+            'travel_distance', the net extruder motion 'e_total', the printed 'volume' (None without
+            layer_width and layer_height) and the 'seconds', 'print_seconds' and 'travel_seconds' of
+            each of the 'layers', indexed by their 'z'
+    """
+    if limits is None:
+        limits = MachineLimits()
+    report = {
+        'seconds': 0.0,
+        'print_seconds': 0.0,
+        'travel_seconds': 0.0,
+        'print_distance': 0.0,
+        'travel_distance': 0.0,
+        'e_total': 0.0,
+        'volume': None if layer_width is None or layer_height is None else 0.0,
+        'layers': [],
+    }
+    if len(instructions) == 0:
+        return report
+    mask = np.frombuffer(instructions.mask, dtype=np.uint8)
+    kind = np.frombuffer(instructions.kind, dtype=np.uint8)
+    positions = {}
+    for word, column in instructions.columns.items():
+        positions[word] = _fill_forward(np.frombuffer(column, dtype=float), (mask & InstructionBuffer.BITS[word]) != 0)
+    feedrates = _fill_forward(
+        np.frombuffer(instructions.f, dtype=float),
+        ((mask & InstructionBuffer.BITS['F']) != 0) & (np.frombuffer(instructions.f, dtype=float) > 0),
+        default=max(limits.max_feedrate['X'], limits.max_feedrate['Y'])*60,
+    )/60
+
+    # the axes start from the origin, where homing leaves them
+    deltas = {word: np.diff(positions[word], prepend=0.0) for word in 'XYZE'}
+    resets = kind == InstructionBuffer.SET_POSITION
+    for word in 'XYZE':
+        deltas[word][resets] = 0.0
+    distances = np.sqrt(deltas['X']**2 + deltas['Y']**2 + deltas['Z']**2)
+    lengths = np.where(distances > 0, distances, np.abs(deltas['E']))
+    moves = np.flatnonzero(lengths > 0)
+    if moves.size == 0:
+        return report
+    lengths = lengths[moves]
+    distances = distances[moves]
+    deltas = {word: delta[moves] for word, delta in deltas.items()}
+    extruding = (deltas['E'] > 0) & (distances > 0)
+
+    speeds = feedrates[moves]
+    accelerations = np.where(extruding, limits.acceleration, limits.travel_acceleration).astype(float)
+    with np.errstate(divide='ignore'):
+        for word in 'XYZE':
+            ratio = lengths/np.abs(deltas[word])
+            speeds = np.minimum(speeds, limits.max_feedrate[word]*ratio)
+            accelerations = np.minimum(accelerations, limits.max_acceleration[word]*ratio)
+
+    # junction deviation: the highest speed through the corner between a move and the previous one
+    with np.errstate(divide='ignore', invalid='ignore'):
+        units = np.stack([deltas[word]/distances for word in 'XYZ'], axis=1)
+        cosines = -np.einsum('ij,ij->i', units[1:], units[:-1])
+        half_sines = np.sqrt(0.5*(1 - np.maximum(cosines, -0.999999)))
+        junctions = accelerations[1:]*limits.junction_deviation*half_sines/(1 - half_sines)
+    junctions = np.minimum(junctions, np.minimum(speeds[1:], speeds[:-1])**2)
+    # reversals and the moves of the extruder alone go through a near stop
+    sharp = (cosines > 0.999999) | (distances[1:] == 0) | (distances[:-1] == 0)
+    junctions[sharp] = limits.minimum_speed**2
+    # squared entry speed bounds of each move, and a stop after the last one
+    bounds = np.concatenate(([0.0], junctions, [0.0]))
+
+    # backward pass: entry² <= next entry² + 2*a*length, forward pass: next entry² <= entry² + 2*a*length
+    reach = 2*accelerations*lengths
+    prefix = np.concatenate(([0.0], np.cumsum(reach)))
+    backward = np.minimum.accumulate((bounds + prefix)[::-1])[::-1] - prefix
+    entries = np.maximum(prefix + np.minimum.accumulate(backward - prefix), 0.0)
+
+    entry_speeds = np.sqrt(entries[:-1])
+    exit_speeds = np.sqrt(entries[1:])
+    accelerating = (speeds**2 - entries[:-1])/(2*accelerations)
+    decelerating = (speeds**2 - entries[1:])/(2*accelerations)
+    cruising = lengths - accelerating - decelerating
+    peaks = np.sqrt(np.maximum((reach + entries[:-1] + entries[1:])/2, np.maximum(entries[:-1], entries[1:])))
+    times = np.where(
+        cruising >= 0,
+        (speeds - entry_speeds)/accelerations + (speeds - exit_speeds)/accelerations + np.maximum(cruising, 0)/speeds,
+        (peaks - entry_speeds)/accelerations + (peaks - exit_speeds)/accelerations,
+    )
+
+    # each move belongs to the layer of the next extruding move (the last ones to the last layer)
+    heights = positions['Z'][moves]
+    printed = np.flatnonzero(extruding)
+    if printed.size:
+        layer_of_move = np.minimum(np.searchsorted(printed, np.arange(moves.size)), printed.size - 1)
+        layer_heights = heights[printed][layer_of_move]
+    else:
+        layer_heights = np.zeros(moves.size)
+    layer_starts = np.flatnonzero(np.r_[True, layer_heights[1:] != layer_heights[:-1]])
+    layer_ids = np.repeat(np.arange(layer_starts.size), np.diff(np.r_[layer_starts, moves.size]))
+    print_times = np.where(extruding, times, 0.0)
+    layer_print = np.bincount(layer_ids, weights=print_times, minlength=layer_starts.size)
+    layer_total = np.bincount(layer_ids, weights=times, minlength=layer_starts.size)
+
+    print_distance = float(distances[extruding].sum())
+    report.update(
+        seconds=float(times.sum()),
+        print_seconds=float(print_times.sum()),
+        travel_seconds=float(times.sum() - print_times.sum()),
+        print_distance=print_distance,
+        travel_distance=float(lengths[~extruding].sum()),
+        e_total=float(deltas['E'].sum()),
+        layers=[
+            {
+                'z': float(z),
+                'seconds': float(total),
+                'print_seconds': float(printing),
+                'travel_seconds': float(total - printing),
+            }
+            for z, total, printing in zip(layer_heights[layer_starts], layer_total, layer_print)
+        ],
+    )
+    if report['volume'] is not None:
+        report['volume'] = print_distance*layer_width*layer_height
+    return report
+
+
+def format_duration(seconds:float) -> str:
+    """Formats a duration as hours, minutes and seconds.
+
+    Args:
+        seconds (float): the duration
+
+    Returns:
+        str: the duration, e.g. 1h 02m 05s
+    """
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f'{hours}h {minutes:02d}m {seconds:02d}s'
+    return f'{minutes}m {seconds:02d}s'
+
+
+def format_report(report:dict) -> str:
+    """Formats the main figures of an estimate.
+
+    Args:
+        report (dict): the result of estimate
+
+    Returns:
+        str: the report, one figure per line
+    """
+    lines = [
+        f"total time: {format_duration(report['seconds'])}",
+        f"printing: {format_duration(report['print_seconds'])}, travelling: {format_duration(report['travel_seconds'])}",
+        f"printed length: {report['print_distance']:.1f} mm, travel length: {report['travel_distance']:.1f} mm",
+        f"extruder: {report['e_total']:.3f}",
+        f"layers: {len(report['layers'])}",
+    ]
+    if report['volume'] is not None:
+        lines.append(f"printed volume: {report['volume']:.1f} mm³")
+    return '\n'.join(lines)
+
+
+def _fill_forward(
+        values:np.ndarray,
+        present:np.ndarray,
+        default:float=0.0,
+        ) -> np.ndarray:
+    """Replaces the missing values with the last present one (default before the first one)"""
+    last = np.maximum.accumulate(np.where(present, np.arange(len(values)), -1))
+    return np.where(last >= 0, values[np.maximum(last, 0)], default)
+
+
+def main(argv:list[str]|None=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m src.estimator',
+        description='Estimates the print time and the material of a g-code file',
+    )
+    parser.add_argument('gcode', help='the g-code file')
+    parser.add_argument('--acceleration', type=float, default=1000, help='the acceleration of the extruding moves, mm/s²')
+    parser.add_argument('--travel-acceleration', type=float, default=1500, help='the acceleration of the other moves, mm/s²')
+    parser.add_argument('--junction-deviation', type=float, default=0.05, help='the junction deviation, mm')
+    parser.add_argument('--layer-width', type=float, help='the width of the trace, to compute the printed volume')
+    parser.add_argument('--layer-height', type=float, help='the height of the trace, to compute the printed volume')
+    parser.add_argument('--json', action='store_true', help='print the whole report, layers included, as JSON')
+    arguments = parser.parse_args(argv)
+    limits = MachineLimits(
+        acceleration=arguments.acceleration,
+        travel_acceleration=arguments.travel_acceleration,
+        junction_deviation=arguments.junction_deviation,
+    )
+    report = estimate(read_gcode(arguments.gcode), limits, arguments.layer_width, arguments.layer_height)
+    if arguments.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
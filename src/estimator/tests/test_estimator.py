@@ -0,0 +1,96 @@
+from math import sqrt
+import numpy as np
+from src.estimator import MachineLimits, estimate, format_duration
+from src.gcode import parse_gcode
+from src.printer import InstructionBuffer, Nozzle, Printer
+from src.shapes import Serpentine
+from src.sketch import Sketch
+import pytest
+
+def reference_time(moves:list[tuple[float,float,float]], limits:MachineLimits) -> float:
+    """Straightforward planner over planar moves (dx, dy, speed), with iterative backward and forward passes"""
+    lengths = [sqrt(dx*dx + dy*dy) for dx, dy, _ in moves]
+    accelerations = []
+    speeds = []
+    for (dx, dy, speed), length in zip(moves, lengths):
+        acceleration = limits.acceleration
+        for delta, axis in [(dx, 'X'), (dy, 'Y')]:
+            if delta:
+                speed = min(speed, limits.max_feedrate[axis]*length/abs(delta))
+                acceleration = min(acceleration, limits.max_acceleration[axis]*length/abs(delta))
+        speeds.append(speed)
+        accelerations.append(acceleration)
+    bounds = [0.0]
+    for i in range(1, len(moves)):
+        ux0, uy0 = moves[i-1][0]/lengths[i-1], moves[i-1][1]/lengths[i-1]
+        ux1, uy1 = moves[i][0]/lengths[i], moves[i][1]/lengths[i]
+        cosine = -(ux0*ux1 + uy0*uy1)
+        if cosine > 0.999999:
+            bounds.append(limits.minimum_speed**2)
+            continue
+        half_sine = sqrt(0.5*(1 - max(cosine, -0.999999)))
+        junction = accelerations[i]*limits.junction_deviation*half_sine/(1 - half_sine)
+        bounds.append(min(junction, min(speeds[i], speeds[i-1])**2))
+    bounds.append(0.0)
+    entries = list(bounds)
+    for i in range(len(moves) - 1, -1, -1):
+        entries[i] = min(entries[i], entries[i+1] + 2*accelerations[i]*lengths[i])
+    for i in range(len(moves)):
+        entries[i+1] = min(entries[i+1], entries[i] + 2*accelerations[i]*lengths[i])
+    total = 0.0
+    for i, (length, speed, acceleration) in enumerate(zip(lengths, speeds, accelerations)):
+        v0, v1 = sqrt(entries[i]), sqrt(entries[i+1])
+        cruising = length - (speed**2 - v0**2)/(2*acceleration) - (speed**2 - v1**2)/(2*acceleration)
+        if cruising >= 0:
+            total += (speed - v0)/acceleration + (speed - v1)/acceleration + cruising/speed
+        else:
+            peak = sqrt((2*acceleration*length + v0**2 + v1**2)/2)
+            total += (peak - v0)/acceleration + (peak - v1)/acceleration
+    return total
+
+def test_estimate_matches_reference():
+    generator = np.random.default_rng(3)
+    limits = MachineLimits(acceleration=800, travel_acceleration=800)
+    buffer = InstructionBuffer()
+    moves = []
+    x = y = e = 0.0
+    for dx, dy, speed in zip(generator.uniform(-20, 20, 300), generator.uniform(-20, 20, 300), generator.uniform(5, 150, 300)):
+        x += dx
+        y += dy
+        e += 0.1
+        buffer.append(InstructionBuffer.PRINT, x=x, y=y, e=e, f=speed*60)
+        moves.append((dx, dy, speed))
+    report = estimate(buffer, limits)
+    assert report['seconds'] == pytest.approx(reference_time(moves, limits), rel=1e-9)
+    assert report['print_seconds'] == report['seconds']
+    assert report['e_total'] == pytest.approx(30)
+
+def test_straight_line_is_one_trapezoid():
+    limits = MachineLimits(acceleration=100)
+    # 100 mm at 10 mm/s: 0.1 s to accelerate over 0.5 mm, the same to stop, 99 mm cruising
+    straight = parse_gcode('G1 X50 E1 F600\nG1 X100 E2\n')
+    assert estimate(straight, limits)['seconds'] == pytest.approx(0.2 + 9.9)
+    split = parse_gcode('G92\nG1 X100 E2 F600\n')
+    assert estimate(split, limits)['seconds'] == pytest.approx(0.2 + 9.9)
+
+def test_estimate_printed_job():
+    serpentine = Serpentine(-50.0, -50.0, 100, 100, False, 2, 10, 20)
+    sketch = Sketch(layer_height=0.5, number_of_layers=3)
+    sketch.gen_serpentine_layers(serpentine.trace_info)
+    sketch.gen_coordinates()
+    instructions = Printer(Nozzle(0, 0, 20, 1, 0.5, 0, 5, 4200, 3600)).print_cad(sketch.coordinates)
+    report = estimate(instructions, layer_width=1, layer_height=0.5)
+    assert [layer['z'] for layer in report['layers']] == [0.5, 1.0, 1.5]
+    assert sum(layer['seconds'] for layer in report['layers']) == pytest.approx(report['seconds'])
+    assert report['print_distance'] == pytest.approx(3*sum(
+        sqrt((x1 - x0)**2 + (y1 - y0)**2)
+        for (x0, y0), (x1, y1) in zip(serpentine.points, serpentine.points[1:])
+    ))
+    assert report['volume'] == pytest.approx(report['print_distance']*0.5)
+    assert report['e_total'] == pytest.approx(instructions.e[-1])
+    # the printing speed is 60 mm/s, so the printing time is a bit longer than the printed length over it
+    assert report['print_distance']/60 < report['print_seconds'] < report['print_distance']/60*1.2
+
+def test_format_duration():
+    assert format_duration(65) == '1m 05s'
+    assert format_duration(3725) == '1h 02m 05s'
@@ -1,3 +1,5 @@
-from .gcode_generator import GCodeGenerator
+from .formatter import LineFormatter
+from .gcode_generator import GCodeGenerator, package_version
+from .parser import parse_gcode, read_gcode
 
-__all__ = ['GCodeGenerator']
\ No newline at end of file
+__all__ = ['GCodeGenerator','LineFormatter','package_version','parse_gcode','read_gcode']
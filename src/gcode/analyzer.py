@@ -0,0 +1,272 @@
+import argparse
+from collections import Counter
+import json
+import sys
+from typing import Iterator
+import numpy as np
+from src.gcode.parser import iter_instruction_chunks
+from src.printer.instruction_buffer import InstructionBuffer
+
+STATE_WORDS = ('X', 'Y', 'Z', 'E', 'F')
+
+
+class _MachineState:
+
+    def __init__(self) -> None:
+        """Modal state of the machine, carried from a chunk of instructions to the next.
+        The axes start from the origin, where homing leaves them."""
+        self.values = {word: 0.0 for word in STATE_WORDS}
+        self.extruded = 0.0
+
+    def resolve(self, buffer:InstructionBuffer) -> dict[str,np.ndarray]:
+        """Resolves the absolute state after each instruction of a chunk.
+
+        Args:
+            buffer (InstructionBuffer): the chunk of instructions
+
+        Returns:
+            dict[str,np.ndarray]: the X, Y, Z, E, F values after each instruction, the 'previous' X, Y, Z
+                before it, its 'distance', its extruder motion 'de' and the 'cumulative' extruder motion,
+                which G92 resets do not affect
+        """
+        mask = np.frombuffer(buffer.mask, dtype=np.uint8)
+        index = np.arange(len(buffer))
+        resolved = {}
+        for word, column in buffer.columns.items():
+            last = np.maximum.accumulate(np.where((mask & InstructionBuffer.BITS[word]) != 0, index, -1))
+            resolved[word] = np.where(last >= 0, np.frombuffer(column, dtype=float)[np.maximum(last, 0)], self.values[word])
+        resets = np.frombuffer(buffer.kind, dtype=np.uint8) == InstructionBuffer.SET_POSITION
+        deltas = {}
+        for word in ('X', 'Y', 'Z', 'E'):
+            deltas[word] = np.diff(resolved[word], prepend=self.values[word])
+            deltas[word][resets] = 0.0
+        resolved['previous'] = {word: resolved[word] - deltas[word] for word in ('X', 'Y', 'Z')}
+        resolved['distance'] = np.sqrt(deltas['X']**2 + deltas['Y']**2 + deltas['Z']**2)
+        resolved['de'] = deltas['E']
+        resolved['cumulative'] = self.extruded + np.cumsum(deltas['E'])
+        if len(buffer):
+            self.values = {word: float(resolved[word][-1]) for word in STATE_WORDS}
+            self.extruded = float(resolved['cumulative'][-1])
+        return resolved
+
+
+def analyze(file_name:str) -> dict:
+    """Computes the statistics of a g-code file, streaming through it chunk by chunk.
+
+    A move extrudes when E increases while the nozzle moves. A layer is a run of extruding moves
+    at the same height.
+
+    Args:
+        file_name (str): the g-code file
+
+    Returns:
+        dict: the number of 'instructions' and 'moves', the number of 'layers', the 'print_length'
+            and 'travel_length', the 'final_e' value, the 'extruded' and 'retracted' extruder motion,
+            the number of 'retractions', the 'printed_extents' and 'extents' ([min, max] of X, Y, Z)
+            and the number of moves made at each of the 'feedrates'
+    """
+    state = _MachineState()
+    statistics = {
+        'instructions': 0,
+        'moves': 0,
+        'layers': 0,
+        'print_length': 0.0,
+        'travel_length': 0.0,
+        'final_e': 0.0,
+        'extruded': 0.0,
+        'retracted': 0.0,
+        'retractions': 0,
+        'printed_extents': {},
+        'extents': {},
+        'feedrates': {},
+    }
+    feedrates = Counter()
+    last_layer_z = None
+    for buffer in iter_instruction_chunks(file_name):
+        resolved = state.resolve(buffer)
+        distance = resolved['distance']
+        de = resolved['de']
+        moving = (distance > 0) | (de != 0)
+        extruding = (distance > 0) & (de > 0)
+        statistics['instructions'] += len(buffer)
+        statistics['moves'] += int(moving.sum())
+        statistics['print_length'] += float(distance[extruding].sum())
+        statistics['travel_length'] += float(distance[~extruding].sum())
+        statistics['extruded'] += float(de[de > 0].sum())
+        statistics['retracted'] -= float(de[de < 0].sum())
+        statistics['retractions'] += int((de < 0).sum())
+        heights = resolved['Z'][extruding]
+        if heights.size:
+            statistics['layers'] += int((heights[1:] != heights[:-1]).sum()) + (heights[0] != last_layer_z)
+            last_layer_z = heights[-1]
+        for word in ('X', 'Y', 'Z'):
+            _update_extents(statistics['printed_extents'], word, resolved[word][extruding], resolved['previous'][word][extruding])
+            _update_extents(statistics['extents'], word, resolved[word][moving], resolved['previous'][word][moving])
+        values, counts = np.unique(resolved['F'][moving], return_counts=True)
+        feedrates.update(dict(zip(values.tolist(), counts.tolist())))
+    statistics['layers'] = int(statistics['layers'])
+    statistics['final_e'] = state.values['E']
+    statistics['feedrates'] = dict(sorted(feedrates.items()))
+    return statistics
+
+
+def _update_extents(
+        extents:dict[str,list[float]],
+        word:str,
+        *values:np.ndarray,
+        ) -> None:
+    """Widens the [min, max] range of an axis to the given values"""
+    values = [array for array in values if array.size]
+    if not values:
+        return
+    low = min(float(array.min()) for array in values)
+    high = max(float(array.max()) for array in values)
+    if word in extents:
+        low = min(low, extents[word][0])
+        high = max(high, extents[word][1])
+    extents[word] = [low, high]
+
+
+def iter_moves(file_name:str) -> Iterator[np.ndarray]:
+    """Yields the moves of a g-code file, chunk by chunk, as the machine state they lead to.
+    The instructions that do not move any axis are left out, and G92 resets are applied, so that
+    two files doing the same thing give the same moves however they are written.
+
+    Args:
+        file_name (str): the g-code file
+
+    Yields:
+        np.ndarray: one row per move: X, Y, Z, cumulative extruder motion and F after the move
+    """
+    state = _MachineState()
+    for buffer in iter_instruction_chunks(file_name):
+        resolved = state.resolve(buffer)
+        moving = (resolved['distance'] > 0) | (resolved['de'] != 0)
+        yield np.stack([resolved['X'], resolved['Y'], resolved['Z'], resolved['cumulative'], resolved['F']], axis=1)[moving]
+
+
+def semantic_diff(
+        left_file:str,
+        right_file:str,
+        tolerance:float=1e-6,
+        max_differences:int=20,
+        ) -> dict:
+    """Compares the moves of two g-code files (see iter_moves), streaming through both of them.
+    Comments, formatting, omitted modal words and other commands do not count: only the sequence
+    of positions, extrusion and feedrates does. The moves are compared in order, one to one.
+
+    Args:
+        left_file (str): the first g-code file
+        right_file (str): the second g-code file
+        tolerance (float): the largest difference between two values considered equal
+        max_differences (int): the number of differing moves to describe
+
+    Returns:
+        dict: whether the files are 'equal', the number of 'left_moves' and 'right_moves', the number
+            of 'different_moves' among those both files have, and the first of them, in 'differences'
+    """
+    left_moves = iter_moves(left_file)
+    right_moves = iter_moves(right_file)
+    left = right = np.empty((0, len(STATE_WORDS)))
+    compared = 0
+    different = 0
+    differences = []
+    while True:
+        left = _next_moves(left, left_moves)
+        right = _next_moves(right, right_moves)
+        if not len(left) or not len(right):
+            break
+        count = min(len(left), len(right))
+        differing = np.flatnonzero(np.any(np.abs(left[:count] - right[:count]) > tolerance, axis=1))
+        different += differing.size
+        for index in differing[:max(max_differences - len(differences), 0)].tolist():
+            differences.append({
+                'move': compared + index,
+                'left': dict(zip(STATE_WORDS, left[index].tolist())),
+                'right': dict(zip(STATE_WORDS, right[index].tolist())),
+            })
+        left = left[count:]
+        right = right[count:]
+        compared += count
+    left_count = compared + len(left) + sum(len(moves) for moves in left_moves)
+    right_count = compared + len(right) + sum(len(moves) for moves in right_moves)
+    return {
+        'equal': different == 0 and left_count == right_count,
+        'left_moves': left_count,
+        'right_moves': right_count,
+        'different_moves': different,
+        'differences': differences,
+    }
+
+
+def _next_moves(
+        pending:np.ndarray,
+        moves:Iterator[np.ndarray],
+        ) -> np.ndarray:
+    """Returns the pending moves, or the next non-empty chunk once they are exhausted"""
+    while not len(pending):
+        pending = next(moves, None)
+        if pending is None:
+            return np.empty((0, len(STATE_WORDS)))
+    return pending
+
+
+def format_statistics(statistics:dict) -> str:
+    """Formats the statistics of a g-code file.
+
+    Args:
+        statistics (dict): the result of analyze
+
+    Returns:
+        str: the statistics, one per line
+    """
+    lines = [
+        f"instructions: {statistics['instructions']}, moves: {statistics['moves']}, layers: {statistics['layers']}",
+        f"printed length: {statistics['print_length']:.1f} mm, travel length: {statistics['travel_length']:.1f} mm",
+        f"final E: {statistics['final_e']:.5g}, extruded: {statistics['extruded']:.5g}, "
+        f"retracted: {statistics['retracted']:.5g} in {statistics['retractions']} retractions",
+    ]
+    for name, extents in [('printed extents', statistics['printed_extents']), ('extents', statistics['extents'])]:
+        if extents:
+            lines.append(f'{name}: ' + ', '.join(f'{word} {low:g}..{high:g}' for word, (low, high) in extents.items()))
+    lines.append('feedrates: ' + ', '.join(f'F{feedrate:g} x{count}' for feedrate, count in statistics['feedrates'].items()))
+    return '\n'.join(lines)
+
+
+def main(argv:list[str]|None=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m src.gcode.analyzer',
+        description='Audits g-code files: statistics, and semantic differences between two files',
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    stats_parser = commands.add_parser('stats', help='prints the statistics of g-code files')
+    stats_parser.add_argument('files', nargs='+', help='the g-code files')
+    stats_parser.add_argument('--json', action='store_true', help='print the statistics as JSON')
+    diff_parser = commands.add_parser('diff', help='compares the moves of two g-code files; exits with 1 if they differ')
+    diff_parser.add_argument('left', help='the first g-code file')
+    diff_parser.add_argument('right', help='the second g-code file')
+    diff_parser.add_argument('--tolerance', type=float, default=1e-6, help='the largest difference between two values considered equal')
+    diff_parser.add_argument('--max-differences', type=int, default=20, help='the number of differing moves to print')
+    arguments = parser.parse_args(argv)
+    if arguments.command == 'stats':
+        for file_name in arguments.files:
+            statistics = analyze(file_name)
+            if arguments.json:
+                print(json.dumps({'file': file_name, **statistics}))
+            else:
+                print(f'{file_name}\n{format_statistics(statistics)}\n')
+        return
+    diff = semantic_diff(arguments.left, arguments.right, arguments.tolerance, arguments.max_differences)
+    for difference in diff['differences']:
+        left = ' '.join(f'{word}{value:g}' for word, value in difference['left'].items())
+        right = ' '.join(f'{word}{value:g}' for word, value in difference['right'].items())
+        print(f"move {difference['move']}:\n- {left}\n+ {right}")
+    if diff['left_moves'] != diff['right_moves']:
+        print(f"{diff['left_moves']} moves in {arguments.left}, {diff['right_moves']} in {arguments.right}")
+    print(f"{diff['different_moves']} different moves" if not diff['equal'] else 'no semantic difference')
+    if not diff['equal']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+import struct
+from typing import Iterable, Iterator
+import zlib
+from src.gcode import heatshrink, meatpack
+
+MAGIC = b'GCDE'
+VERSION = 1
+
+CHECKSUM_NONE = 0
+CHECKSUM_CRC32 = 1
+
+BLOCK_FILE_METADATA = 0
+BLOCK_GCODE = 1
+BLOCK_SLICER_METADATA = 2
+BLOCK_PRINTER_METADATA = 3
+BLOCK_PRINT_METADATA = 4
+BLOCK_THUMBNAIL = 5
+
+COMPRESSIONS = {
+    'none': 0,
+    'deflate': 1,
+    'heatshrink_11_4': 2,
+    'heatshrink_12_4': 3,
+}
+GCODE_ENCODINGS = {
+    'none': 0,
+    'meatpack': 1,
+    'meatpack_comments': 2,
+}
+METADATA_ENCODING_INI = 0
+
+GCODE_BLOCK_SIZE = 65535
+
+METADATA_BLOCKS = {
+    'file': BLOCK_FILE_METADATA,
+    'printer': BLOCK_PRINTER_METADATA,
+    'print': BLOCK_PRINT_METADATA,
+    'slicer': BLOCK_SLICER_METADATA,
+}
+
+
+def file_header(checksum:bool=True) -> bytes:
+    """Returns the header of a binary g-code file.
+
+    Args:
+        checksum (bool): whether the blocks carry a CRC32 checksum
+
+    Returns:
+        bytes: the file header
+    """
+    return MAGIC + struct.pack('<IH', VERSION, CHECKSUM_CRC32 if checksum else CHECKSUM_NONE)
+
+
+def metadata_block(
+        block_type:int,
+        metadata:dict[str,object],
+        compression:str='deflate',
+        checksum:bool=True,
+        ) -> bytes:
+    """Encodes a metadata block, whose content is written as key=value lines.
+
+    Args:
+        block_type (int): the block type (BLOCK_FILE_METADATA, BLOCK_PRINTER_METADATA, ...)
+        metadata (dict[str,object]): the metadata
+        compression (str): the compression of the block, one of COMPRESSIONS
+        checksum (bool): whether the block carries a CRC32 checksum
+
+    Returns:
+        bytes: the encoded block
+    """
+    data = ''.join(f'{key}={value}\n' for key, value in metadata.items()).encode()
+    return _block(block_type, struct.pack('<H', METADATA_ENCODING_INI), data, compression, checksum)
+
+
+def gcode_block(
+        gcode:str,
+        compression:str='heatshrink_12_4',
+        encoding:str='meatpack',
+        checksum:bool=True,
+        ) -> bytes:
+    """Encodes a g-code block.
+
+    Args:
+        gcode (str): the g-code of the block
+        compression (str): the compression of the block, one of COMPRESSIONS
+        encoding (str): the encoding of the g-code, one of GCODE_ENCODINGS
+        checksum (bool): whether the block carries a CRC32 checksum
+
+    Returns:
+        bytes: the encoded block
+    """
+    match encoding:
+        case 'none':
+            data = gcode.encode()
+        case 'meatpack':
+            data = meatpack.encode(gcode)
+        case 'meatpack_comments':
+            data = meatpack.encode(gcode, keep_comments=True)
+        case _:
+            raise ValueError(f'unknown g-code encoding {encoding}')
+    return _block(BLOCK_GCODE, struct.pack('<H', GCODE_ENCODINGS[encoding]), data, compression, checksum)
+
+
+def iter_gcode_chunks(
+        pieces:Iterable[str],
+        size:int=GCODE_BLOCK_SIZE,
+        ) -> Iterator[str]:
+    """Groups g-code pieces into chunks of whole lines, each at most size characters long
+    (unless a single line is longer).
+
+    Args:
+        pieces (Iterable[str]): the g-code, in pieces of any length
+        size (int): the maximum size of a chunk
+
+    Yields:
+        str: the chunks
+    """
+    chunk = []
+    chunk_size = 0
+    for piece in pieces:
+        for line in piece.splitlines(keepends=True):
+            if chunk_size + len(line) > size and chunk:
+                yield ''.join(chunk)
+                chunk.clear()
+                chunk_size = 0
+            chunk.append(line)
+            chunk_size += len(line)
+    if chunk:
+        yield ''.join(chunk)
+
+
+def decode(data:bytes) -> dict[str,object]:
+    """Decodes a binary g-code file, verifying the checksum of every block.
+
+    Args:
+        data (bytes): the content of the file
+
+    Returns:
+        dict[str,object]: the 'file', 'printer', 'print' and 'slicer' metadata dictionaries,
+            and the decoded 'gcode' text
+    """
+    if data[:4] != MAGIC:
+        raise ValueError('not a binary g-code file')
+    version, checksum_type = struct.unpack_from('<IH', data, 4)
+    if version != VERSION:
+        raise ValueError(f'unsupported binary g-code version {version}')
+    decoded = {name: {} for name in METADATA_BLOCKS}
+    gcode = []
+    position = 10
+    block_names = {block_type: name for name, block_type in METADATA_BLOCKS.items()}
+    compressions = {code: name for name, code in COMPRESSIONS.items()}
+    while position < len(data):
+        start = position
+        block_type, compression, uncompressed_size = struct.unpack_from('<HHI', data, position)
+        position += 8
+        if compression:
+            compressed_size, = struct.unpack_from('<I', data, position)
+            position += 4
+        else:
+            compressed_size = uncompressed_size
+        parameters_size = 6 if block_type == BLOCK_THUMBNAIL else 2
+        encoding, = struct.unpack_from('<H', data, position)
+        position += parameters_size
+        payload = data[position:position + compressed_size]
+        position += compressed_size
+        if checksum_type == CHECKSUM_CRC32:
+            expected, = struct.unpack_from('<I', data, position)
+            if zlib.crc32(data[start:position]) != expected:
+                raise ValueError(f'checksum mismatch in the block at byte {start}')
+            position += 4
+        if compression not in compressions:
+            raise ValueError(f'unknown compression {compression} in the block at byte {start}')
+        content = _decompress(payload, compressions[compression], uncompressed_size)
+        if block_type == BLOCK_GCODE:
+            match encoding:
+                case 0:
+                    gcode.append(content.decode())
+                case 1 | 2:
+                    gcode.append(meatpack.decode(content))
+                case _:
+                    raise ValueError(f'unknown g-code encoding {encoding}')
+        elif block_type in block_names:
+            for line in content.decode().splitlines():
+                key, _, value = line.partition('=')
+                decoded[block_names[block_type]][key] = value
+    decoded['gcode'] = ''.join(gcode)
+    return decoded
+
+
+def _block(
+        block_type:int,
+        parameters:bytes,
+        data:bytes,
+        compression:str,
+        checksum:bool,
+        ) -> bytes:
+    """Assembles a block: header, parameters, (compressed) data and checksum"""
+    payload = _compress(data, compression)
+    if COMPRESSIONS[compression] == 0:
+        header = struct.pack('<HHI', block_type, 0, len(data))
+    else:
+        header = struct.pack('<HHII', block_type, COMPRESSIONS[compression], len(data), len(payload))
+    block = header + parameters + payload
+    if checksum:
+        block += struct.pack('<I', zlib.crc32(block))
+    return block
+
+
+def _compress(
+        data:bytes,
+        compression:str
+        ) -> bytes:
+    match compression:
+        case 'none':
+            return data
+        case 'deflate':
+            return zlib.compress(data)
+        case 'heatshrink_11_4':
+            return heatshrink.compress(data, 11, 4)
+        case 'heatshrink_12_4':
+            return heatshrink.compress(data, 12, 4)
+        case _:
+            raise ValueError(f'unknown compression {compression}')
+
+
+def _decompress(
+        data:bytes,
+        compression:str,
+        size:int
+        ) -> bytes:
+    match compression:
+        case 'none':
+            return data
+        case 'deflate':
+            return zlib.decompress(data)
+        case 'heatshrink_11_4':
+            return heatshrink.decompress(data, size, 11, 4)
+        case 'heatshrink_12_4':
+            return heatshrink.decompress(data, size, 12, 4)
+        case _:
+            raise ValueError(f'unknown compression {compression}')
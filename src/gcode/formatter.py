@@ -0,0 +1,121 @@
+from typing import Iterator
+from src.printer.instruction_buffer import InstructionBuffer
+
+DEFAULT_PRECISION = {
+    'X': 3,
+    'Y': 3,
+    'Z': 3,
+    'E': 5,
+    'F': 0,
+}
+
+
+class LineFormatter:
+
+    def __init__(
+            self,
+            command:str='G1',
+            precision:dict[str,int]|None=None,
+            modal:bool=False,
+            ) -> None:
+        """Class representing a precompiled g-code line formatter.
+        The words, their order and their number format are resolved once, so that formatting
+        a line only costs one format call per word. Values are written with a fixed number of
+        decimals per axis, without trailing zeros.
+        If modal is True, the words whose formatted value did not change since the previous
+        line are left out (a line where nothing changed is dropped altogether).
+
+        Args:
+            command (str): the command prepended to every line
+            precision (dict[str,int] | None): the number of decimals of the words to change from DEFAULT_PRECISION.
+                The other words keep their default precision, and the words are written in the order of DEFAULT_PRECISION
+            modal (bool): leave out the words whose value did not change since the previous line
+
+        Raises:
+            ValueError: if precision has a word other than X, Y, Z, E and F
+        """
+        unknown = set(precision or {}) - set(DEFAULT_PRECISION)
+        if unknown:
+            raise ValueError(f'unknown words {", ".join(sorted(unknown))}: the words are {", ".join(DEFAULT_PRECISION)}')
+        self.command = command
+        self.precision = DEFAULT_PRECISION | (precision or {})
+        self.modal = modal
+        self._templates = {word: (f'{{:.{decimals}f}}', decimals > 0) for word, decimals in self.precision.items()}
+        self._state = {}
+
+    def reset(self) -> None:
+        """Forgets the modal state, so that the next line is written in full"""
+        self._state = {}
+
+    def format_value(
+            self,
+            word:str,
+            value:float
+            ) -> str:
+        """Formats a single value with the precision of its word.
+
+        Args:
+            word (str): the word (X, Y, Z, E, F)
+            value (float): the value to format
+
+        Returns:
+            str: the formatted value
+        """
+        template, strip = self._templates[word]
+        text = template.format(value)
+        if strip:
+            text = text.rstrip('0').rstrip('.')
+        if text == '-0':
+            text = '0'
+        return text
+
+    def __call__(
+            self,
+            instructions:dict
+            ) -> str:
+        """Formats a g-code line.
+
+        Args:
+            instructions (dict): the values of the words of the line
+
+        Returns:
+            str: the g-code line, newline included, or an empty string if nothing is left to write
+        """
+        return self._format([instructions.get(word) for word in self.precision])
+
+    def iter_buffer(
+            self,
+            buffer:InstructionBuffer
+            ) -> Iterator[str]:
+        """Formats every instruction of a columnar buffer, reading the columns directly.
+
+        Args:
+            buffer (InstructionBuffer): the instructions
+
+        Yields:
+            str: the g-code lines
+        """
+        columns = buffer.columns
+        selected = [(columns[word], InstructionBuffer.BITS[word]) for word in self.precision]
+        for index, mask in enumerate(buffer.mask):
+            yield self._format([column[index] if mask & bit else None for column, bit in selected])
+
+    def _format(
+            self,
+            values:list[float|None]
+            ) -> str:
+        """Formats a g-code line from the values of the words, in output order (None if missing)"""
+        line = [self.command]
+        state = self._state
+        for word, value in zip(self.precision, values):
+            if value is None:
+                continue
+            text = self.format_value(word, value)
+            if self.modal:
+                if state.get(word) == text:
+                    continue
+                state[word] = text
+            line.append(word + text)
+        if len(line) == 1:
+            return ''
+        return ' '.join(line) + '\n'
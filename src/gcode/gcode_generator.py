@@ -1,14 +1,45 @@
+from contextlib import contextmanager
+import functools
+import io
+import sys
+from typing import IO, Iterable, Iterator
+from src.gcode import bgcode
+from src.gcode.formatter import LineFormatter
+from src.printer.instruction_buffer import InstructionBuffer
+from src.profiling import profiler
+
+PACKAGE = 'gcode-generator'
+# the version of the source tree, when the package is not installed
+VERSION = '0.9.0'
+
+
+@functools.cache
+def package_version() -> str:
+    """Returns the version of the installed package, or VERSION when running from the source tree.
+
+    Returns:
+        str: the version
+    """
+    # slow to import, and only needed to key cached outputs and to name the producer of binary g-code
+    import importlib.metadata
+    try:
+        return importlib.metadata.version(PACKAGE)
+    except importlib.metadata.PackageNotFoundError:
+        return VERSION
+
+
 class GCodeGenerator:
 
     COMMAND_PRINT = 'G1'
-    COMMANDS = ['X', 'Y', 'Z', 'E', 'F']
-    gcode = ''
+    BUFFER_SIZE = 1 << 16
 
     def __init__(
             self,
             filename:str,
             gcode_head:str,
-            gcode_tail:str
+            gcode_tail:str,
+            precision:dict[str,int]|None=None,
+            modal:bool=False,
             ) -> None:
         """Class representing a g-code generator.
         The head and tail of the file are hardcoded in the gcode_head.ini and gcode_tail.ini files.
@@ -18,27 +49,98 @@ class GCodeGenerator:
             filename (str): the name of the gcode file that will be generated
             gcode_head (str): the name of the file containing the head of the g-code file
             gcode_tail (str): the name of the file containing the tail of the g-code file
+            precision (dict[str,int] | None): the number of decimals of the words (X, Y, Z, E, F) to change from formatter.DEFAULT_PRECISION
+            modal (bool): leave out the words whose value did not change since the previous line
         """
         self.head = gcode_head
         self.tail = gcode_tail
         self.filename = filename
+        self.instructions = None
+        self.formatter = LineFormatter(self.COMMAND_PRINT, precision, modal)
 
     def gen_gcode(
             self,
-            instructions:list
+            instructions:Iterable[dict]|InstructionBuffer
             ) -> None:
-        """Generates the g-code from the set of instructions provided by the printer.
+        """Sets the instructions provided by the printer as the body of the g-code.
+        The g-code text is only produced when it is written or read through the gcode property.
+        A one-shot iterator (e.g. a generator) is kept as a list, so that the body can be read and saved more than once.
 
         Args:
-            instructions (list): the set of instructions
+            instructions (Iterable[dict] | InstructionBuffer): the set of instructions
+        """
+        if iter(instructions) is instructions:
+            instructions = list(instructions)
+        self.instructions = instructions
+
+    @property
+    def gcode(self) -> str:
+        """Returns the whole g-code document as a single string
+
+        Returns:
+            str: the g-code document
         """
-        self.gcode+=self.head
-        self.gcode+="\n\n"
-        if instructions is not None:
+        return ''.join(self.iter_gcode(self.instructions))
+
+    def iter_gcode(
+            self,
+            instructions:Iterable[dict]|InstructionBuffer|str|IO[str]|None
+            ) -> Iterator[str]:
+        """Yields the g-code document piece by piece: head, one line per instruction, tail.
+
+        Args:
+            instructions (Iterable[dict] | InstructionBuffer | str | IO[str] | None): the set of instructions, consumed lazily, or the body already rendered by iter_body, or a text file of it
+
+        Yields:
+            str: the next piece of the g-code document
+        """
+        yield self.head
+        yield "\n\n"
+        if isinstance(instructions, str):
+            yield instructions
+        elif isinstance(instructions, io.TextIOBase):
+            # e.g. a body of an OutputCache, copied in chunks
+            while piece := instructions.read(self.BUFFER_SIZE):
+                yield piece
+        else:
+            yield from self.iter_body(instructions)
+        yield "\n"
+        yield self.tail
+
+    def iter_body(
+            self,
+            instructions:Iterable[dict]|InstructionBuffer|None
+            ) -> Iterator[str]:
+        """Yields the body of the g-code, one line per instruction, without the head and the tail.
+        Joined, it can be passed back as the instructions to write the same document with another head or tail.
+
+        The instructions may also come as a stream of InstructionBuffer chunks, e.g. one per layer from Printer.iter_cad:
+        the chunks are formatted as a single sequence, so the modal words carry over from one chunk to the next.
+
+        Args:
+            instructions (Iterable[dict] | InstructionBuffer | Iterable[InstructionBuffer] | None): the set of instructions, consumed lazily
+
+        Returns:
+            Iterator[str]: the lines of the body
+        """
+        return profiler.iter_stage('gen_gcode', self._iter_body(instructions))
+
+    def _iter_body(
+            self,
+            instructions:Iterable[dict]|InstructionBuffer|Iterable[InstructionBuffer]|None
+            ) -> Iterator[str]:
+        self.formatter.reset()
+        if isinstance(instructions, InstructionBuffer):
+            profiler.count('lines', len(instructions))
+            yield from self.formatter.iter_buffer(instructions)
+        elif instructions is not None:
             for coordinate in instructions:
-                self.gcode+=self.gen_gcode_line(coordinate)
-        self.gcode+="\n"
-        self.gcode+=self.tail
+                if isinstance(coordinate, InstructionBuffer):
+                    profiler.count('lines', len(coordinate))
+                    yield from self.formatter.iter_buffer(coordinate)
+                else:
+                    profiler.count('lines')
+                    yield self.gen_gcode_line(coordinate)
 
     def gen_gcode_line(
             self,
@@ -52,16 +154,123 @@ class GCodeGenerator:
         Returns:
             str: the generated g-code line
         """
-        gcode_line = 'G1 '
-        for command in self.COMMANDS:
-            if command in instructions:
-                gcode_line+=f'{command}{instructions[command]} '
-        gcode_line+='\n'
-        return gcode_line
-
-    def save_gcode(self) -> None:
-        """Saves the g-code file.
+        return self.formatter(instructions)
+
+    @profiler.profiled('write')
+    def write_gcode(
+            self,
+            instructions:Iterable[dict]|InstructionBuffer|str|IO[str]|None,
+            output:str|IO[str]|None=None,
+            ) -> int:
+        """Streams the g-code to the output in buffered chunks, without holding the whole document in memory.
+
+        Args:
+            instructions (Iterable[dict] | InstructionBuffer | str | IO[str] | None): the set of instructions, consumed lazily, or the body rendered by iter_body, or a text file of it
+            output (str | IO[str] | None): a file name, an open text file object, or None/'-' for the standard output
+
+        Returns:
+            int: the number of characters written
+        """
+        written = 0
+        with _open_output(output) as output_file:
+            chunk = []
+            chunk_size = 0
+            for piece in self.iter_gcode(instructions):
+                chunk.append(piece)
+                chunk_size += len(piece)
+                if chunk_size >= self.BUFFER_SIZE:
+                    output_file.write(''.join(chunk))
+                    written += chunk_size
+                    chunk.clear()
+                    chunk_size = 0
+            if chunk:
+                output_file.write(''.join(chunk))
+                written += chunk_size
+        profiler.count('bytes', written)
+        return written
+
+    def save_gcode(
+            self,
+            instructions:Iterable[dict]|InstructionBuffer|str|IO[str]|None=None
+            ) -> None:
+        """Saves the g-code file as {filename}.gcode.
+
+        Args:
+            instructions (Iterable[dict] | InstructionBuffer | str | IO[str] | None): the set of instructions, or the body rendered by iter_body, or a text file of it. If None, the ones set by gen_gcode are used
+        """
+        if instructions is None:
+            instructions = self.instructions
+        self.write_gcode(instructions, f'{self.filename}.gcode')
+
+    @profiler.profiled('write')
+    def write_bgcode(
+            self,
+            instructions:Iterable[dict]|InstructionBuffer|str|IO[str]|None,
+            output:str|IO[bytes]|None=None,
+            metadata:dict[str,dict[str,object]]|None=None,
+            compression:str='heatshrink_12_4',
+            encoding:str='meatpack',
+            checksum:bool=True,
+            ) -> int:
+        """Streams the g-code to the output in the binary g-code (.bgcode) format.
+        The file, printer, print and slicer metadata blocks are written first, then the same head,
+        body and tail of the text g-code, split into g-code blocks of whole lines.
+
+        Args:
+            instructions (Iterable[dict] | InstructionBuffer | str | IO[str] | None): the set of instructions, consumed lazily, or the body rendered by iter_body, or a text file of it
+            output (str | IO[bytes] | None): a file name, an open binary file object, or None/'-' for the standard output
+            metadata (dict[str,dict[str,object]] | None): the 'file', 'printer', 'print' and 'slicer' metadata. The file metadata defaults to the producer
+            compression (str): the compression of the g-code blocks, one of bgcode.COMPRESSIONS
+            encoding (str): the encoding of the g-code blocks, one of bgcode.GCODE_ENCODINGS
+            checksum (bool): whether the blocks carry a CRC32 checksum
+
+        Returns:
+            int: the number of bytes written
         """
-        with open(f'{self.filename}.gcode', 'w') as output_file:
-            for line in self.gcode:
-                output_file.write(line)        
\ No newline at end of file
+        metadata = {'file': {'Producer': f'gcode_generator {package_version()}'}} | (metadata or {})
+        written = 0
+        with _open_output(output, binary=True) as output_file:
+            written += output_file.write(bgcode.file_header(checksum))
+            for name, block_type in bgcode.METADATA_BLOCKS.items():
+                if name == 'file' and not metadata.get(name):
+                    continue
+                block = bgcode.metadata_block(block_type, metadata.get(name, {}), 'deflate', checksum)
+                written += output_file.write(block)
+            for chunk in bgcode.iter_gcode_chunks(self.iter_gcode(instructions)):
+                written += output_file.write(bgcode.gcode_block(chunk, compression, encoding, checksum))
+        profiler.count('bytes', written)
+        return written
+
+    def save_bgcode(
+            self,
+            instructions:Iterable[dict]|InstructionBuffer|None=None,
+            **options,
+            ) -> None:
+        """Saves the binary g-code file as {filename}.bgcode.
+
+        Args:
+            instructions (Iterable[dict] | InstructionBuffer | None): the set of instructions. If None, the ones set by gen_gcode are used
+            **options: the metadata, compression, encoding and checksum options of write_bgcode
+        """
+        if instructions is None:
+            instructions = self.instructions
+        self.write_bgcode(instructions, f'{self.filename}.bgcode', **options)
+
+
+@contextmanager
+def _open_output(
+        output:str|IO|None,
+        binary:bool=False
+        ) -> Iterator[IO]:
+    """Yields a writable stream for a file name, a file object or the standard output.
+    Only streams opened here are closed on exit.
+    """
+    if output is None or output == '-':
+        stream = sys.stdout.buffer if binary else sys.stdout
+        yield stream
+        stream.flush()
+    elif isinstance(output, str):
+        with open(output, 'wb' if binary else 'w') as output_file:
+            yield output_file
+    else:
+        yield output
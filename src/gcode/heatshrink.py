@@ -0,0 +1,128 @@
+def compress(
+        data:bytes,
+        window_bits:int=12,
+        lookahead_bits:int=4,
+        ) -> bytes:
+    """Compresses data in the heatshrink format (LZSS with a 2**window_bits bytes window).
+
+    The bit stream is written most significant bit first: a 1 tag bit followed by 8 bits for a literal
+    byte, or a 0 tag bit followed by the back-reference distance minus one (window_bits bits) and the
+    length minus one (lookahead_bits bits). The last byte is padded with zero bits.
+
+    Args:
+        data (bytes): the data to compress
+        window_bits (int): base 2 logarithm of the window size
+        lookahead_bits (int): base 2 logarithm of the longest back-reference
+
+    Returns:
+        bytes: the compressed data
+    """
+    window = 1 << window_bits
+    max_length = 1 << lookahead_bits
+    # a back-reference must take fewer bits than the literals it replaces
+    min_length = (1 + window_bits + lookahead_bits)//9 + 1
+    writer = _BitWriter()
+    positions = {}
+    size = len(data)
+    index = 0
+    while index < size:
+        best_length = 0
+        best_distance = 0
+        limit = min(max_length, size - index)
+        if limit >= 2:
+            for candidate in reversed(positions.get(data[index:index + 2], [])[-32:]):
+                distance = index - candidate
+                if distance > window:
+                    break
+                length = 2
+                while length < limit and data[candidate + length] == data[index + length]:
+                    length += 1
+                if length > best_length:
+                    best_length = length
+                    best_distance = distance
+                    if length == limit:
+                        break
+        if best_length >= min_length:
+            writer.write(0, 1)
+            writer.write(best_distance - 1, window_bits)
+            writer.write(best_length - 1, lookahead_bits)
+            step = best_length
+        else:
+            writer.write(0x100 | data[index], 9)
+            step = 1
+        for position in range(index, index + step):
+            positions.setdefault(data[position:position + 2], []).append(position)
+        index += step
+    return writer.getvalue()
+
+
+def decompress(
+        data:bytes,
+        size:int,
+        window_bits:int=12,
+        lookahead_bits:int=4,
+        ) -> bytes:
+    """Decompresses heatshrink data.
+
+    Args:
+        data (bytes): the compressed data
+        size (int): the size of the decompressed data, which tells the end of the stream from the padding bits
+        window_bits (int): base 2 logarithm of the window size
+        lookahead_bits (int): base 2 logarithm of the longest back-reference
+
+    Returns:
+        bytes: the decompressed data
+    """
+    bit_position = 0
+    total_bits = len(data)*8
+    output = bytearray()
+
+    def read(count:int) -> int:
+        nonlocal bit_position
+        if bit_position + count > total_bits:
+            raise ValueError('truncated heatshrink stream')
+        first = bit_position >> 3
+        last = (bit_position + count + 7) >> 3
+        chunk = int.from_bytes(data[first:last], 'big')
+        shift = (last << 3) - bit_position - count
+        bit_position += count
+        return (chunk >> shift) & ((1 << count) - 1)
+
+    while len(output) < size:
+        if read(1):
+            output.append(read(8))
+        else:
+            distance = read(window_bits) + 1
+            length = read(lookahead_bits) + 1
+            if distance > len(output):
+                raise ValueError('heatshrink back-reference out of the window')
+            start = len(output) - distance
+            for offset in range(length):
+                output.append(output[start + offset])
+    return bytes(output[:size])
+
+
+class _BitWriter:
+
+    def __init__(self) -> None:
+        """Accumulates a bit stream, most significant bit first"""
+        self._bytes = bytearray()
+        self._value = 0
+        self._bits = 0
+
+    def write(
+            self,
+            value:int,
+            count:int
+            ) -> None:
+        self._value = (self._value << count) | value
+        self._bits += count
+        while self._bits >= 8:
+            self._bits -= 8
+            self._bytes.append((self._value >> self._bits) & 0xFF)
+        self._value &= (1 << self._bits) - 1
+
+    def getvalue(self) -> bytes:
+        if self._bits:
+            return bytes(self._bytes) + bytes([(self._value << (8 - self._bits)) & 0xFF])
+        return bytes(self._bytes)
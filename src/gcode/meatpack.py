@@ -0,0 +1,158 @@
+SIGNAL_BYTE = 0xFF
+ENABLE_PACKING = 0xFB
+DISABLE_PACKING = 0xFA
+RESET_ALL = 0xF9
+ENABLE_NO_SPACES = 0xF7
+DISABLE_NO_SPACES = 0xF6
+LITERAL = 0xF
+
+_CODES = {character: code for code, character in enumerate('0123456789. \nGX')}
+_NO_SPACES_CODES = {**{character: code for character, code in _CODES.items() if character != ' '}, 'E': _CODES[' ']}
+
+
+def encode(
+        gcode:str,
+        keep_comments:bool=False,
+        ) -> bytes:
+    """Encodes g-code with MeatPack, packing the most common characters two per byte.
+
+    Packing and the no-spaces mode are enabled at the start of the data, so that every block
+    can be decoded on its own. Comments are dropped unless keep_comments is True, the spaces
+    outside comments are removed and empty lines are skipped. Each line is packed on its own:
+    when it has an odd number of characters the final newline is paired with a padding code,
+    which the decoder ignores.
+
+    Args:
+        gcode (str): the g-code to encode
+        keep_comments (bool): keep the comments (MeatPackComments encoding)
+
+    Returns:
+        bytes: the encoded g-code
+    """
+    output = bytearray([
+        SIGNAL_BYTE, SIGNAL_BYTE, ENABLE_PACKING,
+        SIGNAL_BYTE, SIGNAL_BYTE, ENABLE_NO_SPACES,
+    ])
+    for line in gcode.splitlines():
+        command, separator, comment = line.partition(';')
+        line = command.replace(' ', '').replace('\t', '')
+        if keep_comments and separator:
+            line += separator + comment.rstrip()
+        if not line:
+            continue
+        line += '\n'
+        if len(line) % 2 == 1:
+            line += '0'
+        for index in range(0, len(line), 2):
+            first = _NO_SPACES_CODES.get(line[index], LITERAL)
+            second = _NO_SPACES_CODES.get(line[index + 1], LITERAL)
+            if first == _CODES['\n']:
+                second = 0
+            output.append(first | (second << 4))
+            if first == LITERAL:
+                output.extend(line[index].encode('ascii', 'replace'))
+            if second == LITERAL:
+                output.extend(line[index + 1].encode('ascii', 'replace'))
+    return bytes(output)
+
+
+def decode(data:bytes) -> str:
+    """Decodes MeatPack encoded g-code, following the reference firmware decoder.
+
+    Args:
+        data (bytes): the encoded g-code
+
+    Returns:
+        str: the decoded g-code
+    """
+    decoder = _Decoder()
+    for byte in data:
+        decoder.receive(byte)
+    return decoder.output.decode()
+
+
+class _Decoder:
+
+    def __init__(self) -> None:
+        """State machine of the MeatPack decoder"""
+        self.output = bytearray()
+        self.packing = False
+        self.no_spaces = False
+        self.signal_count = 0
+        self.command_is_next = False
+        self.literal_count = 0
+        self.pending = None
+
+    def receive(
+            self,
+            byte:int
+            ) -> None:
+        if byte == SIGNAL_BYTE:
+            if self.signal_count:
+                self.command_is_next = True
+                self.signal_count = 0
+            else:
+                self.signal_count = 1
+        elif self.command_is_next:
+            self.command(byte)
+            self.command_is_next = False
+        else:
+            if self.signal_count:
+                self.unpack(SIGNAL_BYTE)
+                self.signal_count = 0
+            self.unpack(byte)
+
+    def command(
+            self,
+            command:int
+            ) -> None:
+        match command:
+            case 0xFB:
+                self.packing = True
+            case 0xFA:
+                self.packing = False
+            case 0xF7:
+                self.no_spaces = True
+            case 0xF6:
+                self.no_spaces = False
+            case 0xF9:
+                self.packing = False
+                self.no_spaces = False
+
+    def character(
+            self,
+            code:int
+            ) -> int:
+        if code == _CODES[' '] and self.no_spaces:
+            return ord('E')
+        return ord('0123456789. \nGX'[code])
+
+    def unpack(
+            self,
+            byte:int
+            ) -> None:
+        if not self.packing:
+            self.output.append(byte)
+            return
+        if self.literal_count:
+            self.output.append(byte)
+            if self.pending is not None:
+                self.output.append(self.pending)
+                self.pending = None
+            self.literal_count -= 1
+            return
+        first = byte & 0xF
+        second = byte >> 4
+        if first == LITERAL:
+            self.literal_count += 1
+            if second == LITERAL:
+                self.literal_count += 1
+            else:
+                self.pending = self.character(second)
+            return
+        self.output.append(self.character(first))
+        if self.output[-1] != ord('\n'):
+            if second == LITERAL:
+                self.literal_count += 1
+            else:
+                self.output.append(self.character(second))
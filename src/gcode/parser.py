@@ -0,0 +1,154 @@
+import mmap
+import os
+from typing import Iterable, Iterator
+from src.printer.instruction_buffer import InstructionBuffer
+
+MOVE_KINDS = {
+    b'G0': InstructionBuffer.TRAVEL,
+    b'G00': InstructionBuffer.TRAVEL,
+    b'G1': InstructionBuffer.PRINT,
+    b'G01': InstructionBuffer.PRINT,
+    b'G92': InstructionBuffer.SET_POSITION,
+}
+AXES = {ord(letter): letter.lower() for letter in 'XYZEFxyzef'}
+# the commands switching the positioning modes: (axes relative, extruder relative), None where unchanged
+MODES = {
+    b'G90': (False, False),
+    b'G91': (True, True),
+    b'M82': (None, False),
+    b'M83': (None, True),
+}
+LINE_NUMBER = ord('N'), ord('n')
+CHUNK_ROWS = 1 << 16
+READ_SIZE = 1 << 20
+
+
+def parse_gcode(gcode:str) -> InstructionBuffer:
+    """Parses the moves (G0, G1) and position resets (G92) of a g-code text into an instruction buffer.
+    The other commands and the comments are skipped. G0 lines are stored as TRAVEL, G1 lines as PRINT
+    and G92 lines as SET_POSITION rows; a G92 without words resets every axis to 0.
+    The line numbers and checksums of numbered lines (N12 G1 X10*97) are ignored, and so are the words
+    without a valid number. The relative moves (after G91, or M83 for the extruder) are stored as the
+    absolute positions they lead to, until G90 (or M82) switches back to absolute positioning.
+
+    Args:
+        gcode (str): the g-code
+
+    Returns:
+        InstructionBuffer: the instructions
+    """
+    buffer = InstructionBuffer()
+    _parse_lines(gcode.encode().splitlines(), buffer, _Positioning())
+    return buffer
+
+
+def read_gcode(file_name:str) -> InstructionBuffer:
+    """Parses the moves of a whole g-code file (see parse_gcode).
+
+    Args:
+        file_name (str): the g-code file
+
+    Returns:
+        InstructionBuffer: the instructions
+    """
+    buffer = InstructionBuffer()
+    for chunk in iter_instruction_chunks(file_name):
+        buffer.extend_buffer(chunk)
+    return buffer
+
+
+def iter_instruction_chunks(
+        file_name:str,
+        chunk_rows:int=CHUNK_ROWS,
+        ) -> Iterator[InstructionBuffer]:
+    """Parses the moves of a g-code file (see parse_gcode) in chunks of about chunk_rows instructions.
+    The file is memory-mapped and read a block of lines at a time, so the memory used does not depend
+    on the size of the file.
+
+    Args:
+        file_name (str): the g-code file
+        chunk_rows (int): the number of instructions after which a chunk is yielded
+
+    Yields:
+        InstructionBuffer: the instructions, chunk by chunk
+    """
+    buffer = InstructionBuffer()
+    positioning = _Positioning()
+    for lines in _iter_line_blocks(file_name):
+        for start in range(0, len(lines), chunk_rows):
+            _parse_lines(lines[start:start + chunk_rows], buffer, positioning)
+            if len(buffer) >= chunk_rows:
+                yield buffer
+                buffer = InstructionBuffer()
+    if len(buffer):
+        yield buffer
+
+
+def _iter_line_blocks(file_name:str) -> Iterator[list[bytes]]:
+    """Yields the lines of a file, READ_SIZE bytes at a time, cut on line ends"""
+    if os.path.getsize(file_name) == 0:
+        return
+    with open(file_name, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        size = len(data)
+        position = 0
+        while position < size:
+            end = data.find(b'\n', min(position + READ_SIZE, size) - 1)
+            end = size if end < 0 else end + 1
+            yield data[position:end].splitlines()
+            position = end
+
+
+class _Positioning:
+
+    def __init__(self) -> None:
+        """Positioning modes and logical position of the nozzle, carried from one block of lines to the next"""
+        self.relative = False
+        self.relative_e = False
+        self.position = {'x': 0.0, 'y': 0.0, 'z': 0.0, 'e': 0.0}
+
+
+def _parse_lines(
+        lines:Iterable[bytes],
+        buffer:InstructionBuffer,
+        positioning:_Positioning,
+        ) -> None:
+    """Appends the moves of the given lines to the buffer"""
+    append = buffer.append
+    position = positioning.position
+    for line in lines:
+        line = line.partition(b';')[0]
+        # the checksum of a numbered line
+        line = line.partition(b'*')[0]
+        words = line.split()
+        if words and words[0][0] in LINE_NUMBER:
+            del words[0]
+        if not words:
+            continue
+        command = words[0].upper()
+        kind = MOVE_KINDS.get(command)
+        if kind is None:
+            modes = MODES.get(command)
+            if modes is not None:
+                if modes[0] is not None:
+                    positioning.relative = modes[0]
+                positioning.relative_e = modes[1]
+            continue
+        values = {}
+        for word in words[1:]:
+            axis = AXES.get(word[0])
+            if axis is not None:
+                try:
+                    values[axis] = float(word[1:])
+                except ValueError:
+                    continue
+        if kind == InstructionBuffer.SET_POSITION and not values:
+            values = {'x': 0.0, 'y': 0.0, 'z': 0.0, 'e': 0.0}
+        relative = kind != InstructionBuffer.SET_POSITION and (positioning.relative or positioning.relative_e)
+        for axis, value in values.items():
+            if axis == 'f':
+                continue
+            if relative and (positioning.relative_e if axis == 'e' else positioning.relative):
+                value += position[axis]
+                values[axis] = value
+            position[axis] = value
+        append(kind, **values)
@@ -0,0 +1,109 @@
+from src.gcode import parser
+from src.gcode.analyzer import analyze, iter_moves, semantic_diff
+from src.gcode.parser import iter_instruction_chunks, parse_gcode, read_gcode
+import pytest
+
+GCODE = '''G28 ; home all axes
+G1 Z0.4 F4200 ; moves to 0.4 and sets the feedrate
+G92 E0.0000 ; reset the extruder
+G1 X0 Y0 Z20 E0 F0
+G1 Z25 E0 F4200
+G1 X-50 Y-50 F4200
+G1 Z0.5 F4200
+G1 X-50 Y50 E0.637 F3600
+G1 X-41 Y50 E0.68 F3600
+G1 Z5.5 E0.58 F4200
+G1 X-50 Y-50 F4200
+G1 Z1 F4200
+G1 X-50 Y50 E1.317 F3600
+'''
+
+MODAL_GCODE = '''; same moves, written differently
+G1 Z0.4 F4200
+G1 X0 Y0 Z20 F0
+G1 Z25 F4200
+G1 X-50 Y-50
+G1 Z0.5
+G1 F3600
+G1 Y50 E0.637
+G1 X-41 E0.68
+G92 E0
+G1 Z5.5 E-0.1 F4200
+G1 X-50 Y-50
+G1 Z1
+G1 Y50 E0.637 F3600
+'''
+
+RELATIVE_GCODE = '''; same moves, relative after the first ones
+G1 Z0.4 F4200
+G1 X0 Y0 Z20 E0 F0
+G91
+G1 Z5 F4200
+G1 X-50 Y-50
+G1 Z-24.5
+M82
+G1 Y100 E0.637 F3600
+M83
+G1 X9 E0.043
+G1 Z5 E-0.1 F4200
+G90
+G1 X-50 Y-50
+G1 Z1
+M83
+G1 Y50 E0.737 F3600
+'''
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    # read a few lines at a time, so that the files are streamed over several blocks
+    monkeypatch.setattr(parser, 'READ_SIZE', 64)
+    names = []
+    for name, gcode in [('plain.gcode', GCODE), ('modal.gcode', MODAL_GCODE), ('relative.gcode', RELATIVE_GCODE)]:
+        (tmp_path/name).write_text(gcode)
+        names.append(str(tmp_path/name))
+    return names
+
+def test_chunks(files):
+    plain = files[0]
+    chunks = list(iter_instruction_chunks(plain, chunk_rows=4))
+    assert len(chunks) > 1
+    assert sum(len(chunk) for chunk in chunks) == len(read_gcode(plain)) == 12
+
+def test_analyze(files):
+    statistics = analyze(files[0])
+    assert statistics['layers'] == 2
+    assert statistics['print_length'] == pytest.approx(209)
+    assert statistics['final_e'] == 1.317
+    assert statistics['retractions'] == 1
+    assert statistics['retracted'] == pytest.approx(0.1)
+    assert statistics['printed_extents'] == {'X': [-50, -41], 'Y': [-50, 50], 'Z': [0.5, 1]}
+    assert statistics['extents']['Z'] == [0, 25]
+    assert statistics['feedrates'] == {0.0: 1, 3600.0: 3, 4200.0: 7}
+
+def test_semantic_diff(files, tmp_path):
+    plain, modal, _ = files
+    assert semantic_diff(plain, modal)['equal']
+    changed = tmp_path/'changed.gcode'
+    changed.write_text(GCODE.replace('G1 X-41 Y50 E0.68 F3600', 'G1 X-41 Y49 E0.68 F3600'))
+    diff = semantic_diff(plain, str(changed))
+    assert not diff['equal']
+    # the lift after the changed move keeps its Y
+    assert diff['different_moves'] == 2
+    assert diff['differences'][0]['left']['Y'] == 50 and diff['differences'][0]['right']['Y'] == 49
+    shorter = tmp_path/'shorter.gcode'
+    shorter.write_text(GCODE.rsplit('G1', 1)[0])
+    diff = semantic_diff(plain, str(shorter))
+    assert not diff['equal'] and diff['different_moves'] == 0
+    assert diff['left_moves'] == diff['right_moves'] + 1 == sum(len(moves) for moves in iter_moves(plain))
+
+def test_relative_positioning(files):
+    plain, _, relative = files
+    # the modes carry over from one block of lines to the next
+    assert semantic_diff(plain, relative)['equal']
+    assert analyze(relative)['final_e'] == pytest.approx(1.317)
+
+def test_parse_numbered_lines():
+    assert list(parse_gcode('N0 M110 N0*125\nN1 G1 X10 Y2.5*97\nn2 g1 e0.5*12\n')) == [{'X': 10, 'Y': 2.5}, {'E': 0.5}]
+
+def test_parse_malformed_words():
+    assert list(parse_gcode('G1 X Y2 E\nG1 X1.2.3 Z4\n')) == [{'Y': 2}, {'Z': 4}]
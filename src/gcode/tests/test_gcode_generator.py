@@ -0,0 +1,166 @@
+import io
+import struct
+import tomllib
+from src.gcode import bgcode, gcode_generator, heatshrink, GCodeGenerator, LineFormatter, package_version, parse_gcode
+from src.printer import InstructionBuffer
+import pytest
+
+INSTRUCTIONS = [
+    {'Z': 5, 'E': 0.0, 'F': 4200},
+    {'X': -50.0, 'Y': -50.0, 'F': 4200},
+    {'X': -50.0, 'Y': 50.0, 'E': 0.636, 'F': 3600},
+]
+
+@pytest.fixture
+def generator() -> GCodeGenerator:
+    return GCodeGenerator(filename='test', gcode_head='G28', gcode_tail='M104 S0')
+
+def test_write_gcode_matches_gcode(generator: GCodeGenerator):
+    generator.gen_gcode(INSTRUCTIONS)
+    output = io.StringIO()
+    written = generator.write_gcode(iter(INSTRUCTIONS), output)
+    assert output.getvalue() == generator.gcode
+    assert written == len(generator.gcode)
+
+def test_write_gcode_in_chunks(generator: GCodeGenerator):
+    generator.BUFFER_SIZE = 8
+    output = io.StringIO()
+    generator.write_gcode(INSTRUCTIONS*100, output)
+    assert output.getvalue().startswith('G28\n\n')
+    assert output.getvalue().endswith('\nM104 S0')
+    assert output.getvalue().count('\n') == 300 + 3
+
+def test_save_gcode(generator: GCodeGenerator, tmp_path):
+    generator.filename = str(tmp_path/'test')
+    generator.gen_gcode(INSTRUCTIONS)
+    generator.save_gcode()
+    assert (tmp_path/'test.gcode').read_text() == generator.gcode
+
+def test_save_gcode_after_reading_generated_gcode(generator: GCodeGenerator, tmp_path):
+    generator.filename = str(tmp_path/'test')
+    generator.gen_gcode(instruction for instruction in INSTRUCTIONS)
+    gcode = generator.gcode
+    assert gcode == ''.join(generator.iter_gcode(INSTRUCTIONS))
+    assert generator.gcode == gcode
+    generator.save_gcode()
+    assert (tmp_path/'test.gcode').read_text() == gcode
+
+def test_package_version(monkeypatch):
+    # the fallback of the source tree follows the packaged version
+    with open('pyproject.toml', 'rb') as pyproject_file:
+        assert gcode_generator.VERSION == tomllib.load(pyproject_file)['project']['version']
+    package_version.cache_clear()
+    monkeypatch.setattr(gcode_generator, 'PACKAGE', 'not-an-installed-package')
+    try:
+        assert package_version() == gcode_generator.VERSION
+    finally:
+        package_version.cache_clear()
+
+def test_write_rendered_body(generator: GCodeGenerator):
+    body = ''.join(generator.iter_body(INSTRUCTIONS))
+    generator.head = 'G28 X Y'
+    output = io.StringIO()
+    generator.write_gcode(body, output)
+    assert output.getvalue() == ''.join(generator.iter_gcode(INSTRUCTIONS))
+    assert output.getvalue().startswith('G28 X Y\n\n')
+
+def test_gen_gcode_line(generator: GCodeGenerator):
+    assert generator.gen_gcode_line({'X': -50.0, 'Y': 50, 'E': 0.63600, 'F': 3600}) == 'G1 X-50 Y50 E0.636 F3600\n'
+    assert generator.gen_gcode_line({'X': -0.0001, 'Z': 0.1 + 0.2}) == 'G1 X0 Z0.3\n'
+
+def test_line_formatter_precision():
+    formatter = LineFormatter(precision={'X': 1, 'Y': 1, 'E': 2})
+    # the words not listed keep their default precision
+    assert formatter({'X': 1.26, 'Y': 2, 'Z': 0.1234, 'E': 0.126, 'F': 4200}) == 'G1 X1.3 Y2 Z0.123 E0.13 F4200\n'
+    with pytest.raises(ValueError):
+        LineFormatter(precision={'A': 1})
+
+def test_line_formatter_modal():
+    formatter = LineFormatter(modal=True)
+    assert formatter({'X': 1, 'Y': 2, 'F': 4200}) == 'G1 X1 Y2 F4200\n'
+    assert formatter({'X': 3, 'Y': 2, 'F': 4200}) == 'G1 X3\n'
+    assert formatter({'X': 3.0001, 'Y': 2, 'F': 4200}) == ''
+    formatter.reset()
+    assert formatter({'X': 3, 'Y': 2, 'F': 4200}) == 'G1 X3 Y2 F4200\n'
+
+def test_write_instruction_buffer(generator: GCodeGenerator):
+    buffer = InstructionBuffer()
+    for instruction in INSTRUCTIONS:
+        buffer.append(
+            InstructionBuffer.PRINT,
+            **{word.lower(): value for word, value in instruction.items()},
+        )
+    assert ''.join(generator.iter_gcode(buffer)) == ''.join(generator.iter_gcode(INSTRUCTIONS))
+
+def test_write_buffer_chunks():
+    chunks = []
+    for instruction in INSTRUCTIONS*3:
+        chunks.append(InstructionBuffer())
+        chunks[-1].append(InstructionBuffer.PRINT, **{word.lower(): value for word, value in instruction.items()})
+    generator = GCodeGenerator(filename='test', gcode_head='G28', gcode_tail='M104 S0', modal=True)
+    # the modal words carry over from one chunk to the next
+    assert ''.join(generator.iter_body(iter(chunks))) == ''.join(generator.iter_body(INSTRUCTIONS*3))
+
+@pytest.mark.parametrize('compression', list(bgcode.COMPRESSIONS))
+@pytest.mark.parametrize('encoding', list(bgcode.GCODE_ENCODINGS))
+def test_bgcode_round_trip(generator: GCodeGenerator, compression, encoding):
+    generator.head = 'G90 ; absolute positioning\nG28'
+    instructions = INSTRUCTIONS*2000
+    output = io.BytesIO()
+    generator.write_bgcode(
+        instructions,
+        output,
+        metadata={'printer': {'plate_shape': 'rounded'}, 'print': {'number_of_layers': 5}},
+        compression=compression,
+        encoding=encoding,
+    )
+    decoded = bgcode.decode(output.getvalue())
+    assert decoded['file']['Producer'].startswith('gcode_generator')
+    assert decoded['printer'] == {'plate_shape': 'rounded'}
+    assert decoded['print'] == {'number_of_layers': '5'}
+    text = ''.join(generator.iter_gcode(instructions))
+    if encoding == 'none':
+        assert decoded['gcode'] == text
+    else:
+        expected = [line.split(';')[0].replace(' ', '') for line in text.splitlines()]
+        if encoding == 'meatpack_comments':
+            expected[0] = 'G90; absolute positioning'
+        assert decoded['gcode'].splitlines() == [line for line in expected if line]
+
+def test_bgcode_checksum(generator: GCodeGenerator):
+    output = io.BytesIO()
+    generator.write_bgcode(INSTRUCTIONS, output)
+    data = bytearray(output.getvalue())
+    data[-10] ^= 0xFF
+    with pytest.raises(ValueError):
+        bgcode.decode(bytes(data))
+
+def test_bgcode_unknown_compression():
+    block = struct.pack('<HHII', bgcode.BLOCK_GCODE, 9, 3, 3) + struct.pack('<H', 0) + b'G28'
+    with pytest.raises(ValueError, match='unknown compression 9 in the block at byte 10'):
+        bgcode.decode(bgcode.file_header(False) + block)
+
+@pytest.mark.parametrize('window_bits', [11, 12])
+def test_heatshrink_matches_reference(generator: GCodeGenerator, window_bits):
+    heatshrink2 = pytest.importorskip('heatshrink2')
+    data = ''.join(generator.iter_gcode(INSTRUCTIONS*200)).encode()
+    assert heatshrink2.decompress(heatshrink.compress(data, window_bits, 4), window_sz2=window_bits, lookahead_sz2=4) == data
+    reference = heatshrink2.compress(data, window_sz2=window_bits, lookahead_sz2=4)
+    assert heatshrink.decompress(reference, len(data), window_bits, 4) == data
+
+def test_parse_gcode():
+    buffer = parse_gcode('G28 ; home\nG1 Z0.4 F4200 ; lift\nG92 E0.0000\nG0 X1.5 Y-2\ng1 x3 e0.25 ; print\nM104 S0\nG92\n')
+    assert list(buffer) == [
+        {'Z': 0.4, 'F': 4200},
+        {'E': 0},
+        {'X': 1.5, 'Y': -2},
+        {'X': 3, 'E': 0.25},
+        {'X': 0, 'Y': 0, 'Z': 0, 'E': 0},
+    ]
+    assert list(buffer.kind) == [
+        InstructionBuffer.PRINT,
+        InstructionBuffer.SET_POSITION,
+        InstructionBuffer.TRAVEL,
+        InstructionBuffer.PRINT,
+        InstructionBuffer.SET_POSITION,
+    ]
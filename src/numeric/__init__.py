@@ -0,0 +1,3 @@
+from src.numeric.rounding import py_round
+
+__all__ = ['py_round']
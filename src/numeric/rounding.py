@@ -0,0 +1,30 @@
+import numpy as np
+
+
+def py_round(
+        values:np.ndarray,
+        ndigits:int
+        ) -> np.ndarray:
+    """Rounds an array with the same result as the built-in round(value, ndigits) applied to each element.
+
+    numpy.round multiplies by 10**ndigits before rounding, so it can pick the wrong neighbour when the
+    product lands on (or extremely close to) a .5 boundary. Those few elements are rounded again with
+    the built-in round; all the others are exact, since dividing the rounded product by 10**ndigits
+    gives the double closest to the decimal result, as round does.
+
+    Args:
+        values (np.ndarray): the values to round
+        ndigits (int): the number of decimals
+
+    Returns:
+        np.ndarray: the rounded values
+    """
+    values = np.asarray(values, dtype=float)
+    scale = 10.0**ndigits
+    scaled = values*scale
+    rounded = np.rint(scaled)/scale
+    distance = np.abs(scaled - np.floor(scaled) - 0.5)
+    ambiguous = np.flatnonzero(distance <= np.abs(scaled)*1e-14 + 1e-12)
+    if ambiguous.size > 0:
+        rounded[ambiguous] = [round(value, ndigits) for value in values[ambiguous].tolist()]
+    return rounded
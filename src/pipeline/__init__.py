@@ -0,0 +1,69 @@
+from src.pipeline.pipeline import (
+    build_nozzle,
+    build_purge_segment,
+    build_purge_sketch,
+    build_segment,
+    build_serpentine,
+    build_sketch,
+    generate_gcode,
+    iter_instructions,
+    job_layers,
+    layers_travel_savings,
+    plan_sketch_travels,
+    print_layers,
+    print_sketches,
+    sketch_layers,
+    stage_key,
+    travel_savings,
+    write_job,
+    write_layers,
+)
+from src.pipeline.geometry_cache import GeometryCache
+from src.pipeline.output_cache import OutputCache, body_key, body_options
+from src.pipeline.layout import (
+    DEFAULT_SPACING,
+    SPECIMEN_INPUTS,
+    generate_layout_gcode,
+    layout_layers,
+    order_specimens,
+    place_specimens,
+    print_layout,
+    save_layout_info,
+)
+from src.pipeline.validation import ValidationError, format_validation, validate_layers
+
+__all__ = [
+    'DEFAULT_SPACING',
+    'GeometryCache',
+    'OutputCache',
+    'SPECIMEN_INPUTS',
+    'ValidationError',
+    'body_key',
+    'body_options',
+    'build_nozzle',
+    'build_purge_segment',
+    'build_purge_sketch',
+    'build_segment',
+    'build_serpentine',
+    'build_sketch',
+    'format_validation',
+    'generate_gcode',
+    'generate_layout_gcode',
+    'iter_instructions',
+    'job_layers',
+    'layers_travel_savings',
+    'layout_layers',
+    'order_specimens',
+    'place_specimens',
+    'plan_sketch_travels',
+    'print_layers',
+    'print_layout',
+    'print_sketches',
+    'save_layout_info',
+    'sketch_layers',
+    'stage_key',
+    'travel_savings',
+    'validate_layers',
+    'write_job',
+    'write_layers',
+]
@@ -0,0 +1,104 @@
+from collections import OrderedDict, namedtuple
+from typing import Any, Callable
+from src.pipeline.pipeline import (
+    PURGE_INPUTS,
+    SEGMENT_INPUTS,
+    SERPENTINE_INPUTS,
+    SKETCH_INPUTS,
+    build_purge_segment,
+    build_purge_sketch,
+    build_segment,
+    build_serpentine,
+    build_sketch,
+    stage_key,
+)
+from src.shapes import Segment, Serpentine
+from src.sketch import Sketch
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'max_size', 'size'])
+
+PURGE_SKETCH_INPUTS = PURGE_INPUTS + ('layer_height',)
+
+
+class GeometryCache:
+
+    def __init__(
+            self,
+            max_size:int=32,
+            ) -> None:
+        """Least recently used cache of the geometry stages (serpentine, segments and sketches),
+        keyed on the settings each stage actually depends on. Changing a setting that does not
+        affect the geometry (speeds, file name, ...) then costs a lookup instead of a rebuild.
+
+        The cached objects are shared between the callers, so they must not be modified.
+
+        Args:
+            max_size (int): the number of objects kept, over all the stages
+        """
+        if max_size < 1:
+            raise ValueError('the cache must hold at least one object')
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(
+            self,
+            stage:str,
+            key:tuple,
+            build:Callable[[],Any],
+            ) -> Any:
+        """Returns the cached object of a stage, building and storing it on a miss.
+
+        Args:
+            stage (str): the name of the stage
+            key (tuple): the values of the inputs of the stage
+            build (Callable[[],Any]): builds the object on a miss
+
+        Returns:
+            Any: the object
+        """
+        entry_key = (stage, key)
+        if entry_key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(entry_key)
+            return self._entries[entry_key]
+        self.misses += 1
+        value = build()
+        self._entries[entry_key] = value
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return value
+
+    def serpentine(self, settings:dict[str,Any]) -> Serpentine:
+        """Returns the serpentine of the settings"""
+        return self.get('serpentine', stage_key(settings, SERPENTINE_INPUTS), lambda: build_serpentine(settings))
+
+    def segment(self, settings:dict[str,Any]) -> Segment:
+        """Returns the suspended segment of the settings"""
+        return self.get('segment', stage_key(settings, SEGMENT_INPUTS), lambda: build_segment(settings, self.serpentine(settings)))
+
+    def purge_segment(self, settings:dict[str,Any]) -> Segment:
+        """Returns the purge segment of the settings"""
+        return self.get('purge_segment', stage_key(settings, PURGE_INPUTS), lambda: build_purge_segment(settings))
+
+    def sketch(self, settings:dict[str,Any]) -> Sketch:
+        """Returns the sketch of the stacked serpentines (and suspended segment) of the settings"""
+        def build() -> Sketch:
+            segment = self.segment(settings) if settings['print_segment'] is True else None
+            return build_sketch(settings, self.serpentine(settings), segment)
+        return self.get('sketch', stage_key(settings, SKETCH_INPUTS), build)
+
+    def purge_sketch(self, settings:dict[str,Any]) -> Sketch:
+        """Returns the purge sketch of the settings"""
+        return self.get('purge_sketch', stage_key(settings, PURGE_SKETCH_INPUTS), lambda: build_purge_sketch(settings, self.purge_segment(settings)))
+
+    def cache_info(self) -> CacheInfo:
+        """Returns the hits, misses, maximum size and current size of the cache"""
+        return CacheInfo(self.hits, self.misses, self.max_size, len(self._entries))
+
+    def clear(self) -> None:
+        """Empties the cache and resets the counters"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
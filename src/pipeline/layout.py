@@ -0,0 +1,401 @@
+import csv
+import os
+from math import hypot, sqrt
+from typing import IO, Any, Callable, Iterable, Iterator
+from src.printer import InstructionBuffer
+from src.pipeline.output_cache import OutputCache, body_key
+from src.pipeline.pipeline import (
+    build_purge_segment,
+    build_purge_sketch,
+    build_serpentine,
+    build_sketch,
+    plan_sketch_travels,
+    print_layers,
+    write_job,
+)
+from src.sketch import Sketch, SketchLayers
+
+# the settings each specimen of a layout may set on its own
+SPECIMEN_INPUTS = (
+    'x_width',
+    'y_width',
+    'constant_pitch',
+    'min_pitch',
+    'first_inlet_diameter',
+    'last_inlet_diameter',
+    'centered_segment',
+    'segment_y_pos',
+    'number_of_layers',
+    'print_segment',
+)
+# the default gap between two specimens, and between a specimen and the edge of the plate, mm
+DEFAULT_SPACING = 5.0
+
+
+def place_specimens(
+        settings:dict[str,Any],
+        specimens:list[dict[str,Any]],
+        spacing:float=DEFAULT_SPACING,
+        ) -> list[dict[str,Any]]:
+    """Packs several serpentine specimens on the printing plate.
+
+    The specimens are placed on shelves, the tallest first: each one goes on the first shelf it fits
+    in, to the right of the specimens already there, or opens a new shelf above the last one. The
+    footprint of a specimen is its actual width and its y_width, widened by half the layer width on
+    every side; the footprints stay spacing apart from each other, from the edge of the plate and,
+    when purge_nozzle is set, from the purge segment.
+
+    Args:
+        settings (dict[str,Any]): the settings shared by every specimen
+        specimens (list[dict[str,Any]]): the settings of each specimen overriding the shared ones, among SPECIMEN_INPUTS
+        spacing (float): the smallest gap between two footprints, mm
+
+    Returns:
+        list[dict[str,Any]]: the complete settings of each specimen, in the given order, with its x_pos and y_pos
+
+    Raises:
+        ValueError: if a specimen sets a setting out of SPECIMEN_INPUTS, or does not fit on the plate
+    """
+    specimens = [settings | _check_specimen(specimen) | {'centered_serpentine': False, 'x_pos': 0, 'y_pos': 0} for specimen in specimens]
+    # the positions are rounded to 0.01 mm, which may move a footprint by as much
+    margin = settings['layer_width']/2 + 0.01
+    sizes = [
+        (build_serpentine(specimen).width + 2*margin, specimen['y_width'] + 2*margin)
+        for specimen in specimens
+    ]
+    plate = _Plate(settings['plate_shape'], settings['plate_size'], spacing)
+    if settings['purge_nozzle'] is True:
+        purge_segment = build_purge_segment(settings)
+        plate.keep_out(
+            min(purge_segment.x_coords) - margin,
+            min(purge_segment.y_coords) - margin,
+            max(purge_segment.x_coords) + margin,
+            max(purge_segment.y_coords) + margin,
+        )
+    # each shelf: [bottom, height, first free x]
+    shelves = []
+    corners = [None]*len(specimens)
+    for index in sorted(range(len(specimens)), key=lambda i: (-sizes[i][1], -sizes[i][0])):
+        width, height = sizes[index]
+        for shelf in shelves:
+            if height <= shelf[1]:
+                x = plate.free_x(shelf[2], shelf[0], width, height)
+                if x is not None:
+                    corners[index] = x, shelf[0]
+                    shelf[2] = x + width + spacing
+                    break
+        else:
+            floor = shelves[-1][0] + shelves[-1][1] + spacing if shelves else None
+            corner = plate.new_shelf(floor, width, height)
+            if corner is None:
+                raise ValueError(f'specimen {index + 1} ({width:g} x {height:g} mm with its trace) does not fit on the plate')
+            corners[index] = corner
+            shelves.append([corner[1], height, corner[0] + width + spacing])
+    return [
+        specimen | {'x_pos': round(x + margin, 2), 'y_pos': round(y + margin, 2)}
+        for specimen, (x, y) in zip(specimens, corners)
+    ]
+
+
+def order_specimens(
+        settings:dict[str,Any],
+        sketches:list[Sketch],
+        purge_sketch:Sketch|None=None,
+        ) -> list[int]:
+    """Orders the specimens by nearest neighbour: starting from where the nozzle is before the first one
+    (the end of the purge segment, or home), each specimen is followed by the one starting the closest
+    to where its first layer ends.
+
+    Args:
+        settings (dict[str,Any]): the shared settings
+        sketches (list[Sketch]): the sketch of each specimen
+        purge_sketch (Sketch | None): the purge sketch, printed first if purge_nozzle is set
+
+    Returns:
+        list[int]: the indexes of the specimens, in printing order
+    """
+    if settings['purge_nozzle'] is True:
+        if purge_sketch is None:
+            purge_sketch = build_purge_sketch(settings)
+        end = purge_sketch.layer_sequence[-1][-1]
+        x, y = end['x'], end['y']
+    else:
+        x, y = settings['x_home'], settings['y_home']
+    left = list(range(len(sketches)))
+    order = []
+    while left:
+        index = min(left, key=lambda i: hypot(sketches[i].layer_sequence[0][0]['x'] - x, sketches[i].layer_sequence[0][0]['y'] - y))
+        left.remove(index)
+        order.append(index)
+        end = sketches[index].layer_sequence[0][-1]
+        x, y = end['x'], end['y']
+    return order
+
+
+def layout_coordinates(
+        sketches:list[Sketch],
+        order:list[int],
+        ) -> list[dict]:
+    """Interleaves the layers of the specimens, so that the whole plate is printed layer by layer.
+    At each height the specimens are visited in order, and in the reverse order at the next height,
+    so that every height starts next to the specimen the previous one ended on.
+
+    Args:
+        sketches (list[Sketch]): the sketch of each specimen
+        order (list[int]): the printing order of the specimens
+
+    Returns:
+        list[dict]: the layers, as in Sketch.coordinates, with the 'specimen' number they belong to.
+            Their templates become (specimen index, template)
+    """
+    heights = {}
+    for index in order:
+        for layer in sketches[index].iter_coordinates():
+            heights.setdefault(layer['z'], []).append(layer | {'template': (index, layer['template']), 'specimen': index + 1})
+    coordinates = []
+    for level, z in enumerate(sorted(heights)):
+        coordinates.extend(heights[z] if level % 2 == 0 else heights[z][::-1])
+    return coordinates
+
+
+def layout_layers(
+        settings:dict[str,Any],
+        placed:list[dict[str,Any]],
+        purge_sketch:Sketch|None=None,
+        ) -> list[Iterable[dict]]:
+    """Lists the layers printed in a row for a layout: those of the purge sketch, if purge_nozzle is set,
+    then the interleaved layers of the specimens (see sketch_layers).
+
+    Args:
+        settings (dict[str,Any]): the shared settings
+        placed (list[dict[str,Any]]): the settings of each specimen, as returned by place_specimens
+        purge_sketch (Sketch | None): the purge sketch. Built from the settings if None and needed
+
+    Returns:
+        list[Iterable[dict]]: the coordinates of each part of the job
+    """
+    sketches = [build_sketch(specimen, build_serpentine(specimen)) for specimen in placed]
+    if settings['purge_nozzle'] is True and purge_sketch is None:
+        purge_sketch = build_purge_sketch(settings)
+    coordinates = layout_coordinates(sketches, order_specimens(settings, sketches, purge_sketch))
+    if settings['purge_nozzle'] is not True:
+        return [coordinates]
+    return [SketchLayers(purge_sketch), coordinates]
+
+
+def print_layout(
+        settings:dict[str,Any],
+        placed:list[dict[str,Any]],
+        purge_sketch:Sketch|None=None,
+        fixed_point:bool=False,
+        plan_travel:bool=False,
+        unlifted_travel:float=0.0,
+        ) -> InstructionBuffer:
+    """Prints the purge sketch, if purge_nozzle is set, then every specimen of a layout, layer by layer.
+
+    Args:
+        settings (dict[str,Any]): the shared settings
+        placed (list[dict[str,Any]]): the settings of each specimen, as returned by place_specimens
+        purge_sketch (Sketch | None): the purge sketch. Built from the settings if None and needed
+        fixed_point (bool): print with a FixedPointNozzle
+        plan_travel (bool): print the layers in the direction saving the most travel (see plan_travels)
+        unlifted_travel (float): when planning, the longest travel made without lifting the nozzle
+
+    Returns:
+        InstructionBuffer: the instructions
+    """
+    layers = layout_layers(settings, placed, purge_sketch)
+    if plan_travel:
+        layers = plan_sketch_travels(settings, layers, unlifted_travel)
+    return print_layers(settings, layers, fixed_point)
+
+
+def save_layout_info(
+        filename:str,
+        placed:list[dict[str,Any]],
+        ) -> None:
+    """Saves the layout to {filename}_layout.csv, one row per specimen, and the information of the
+    serpentine of each specimen to {filename}_specimen_{n}_serpentine_info.csv (see Serpentine.save_serpentine_info).
+
+    Args:
+        filename (str): the name of the files to be saved, without extension
+        placed (list[dict[str,Any]]): the settings of each specimen, as returned by place_specimens
+    """
+    with open(f'{filename}_layout.csv', 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow([
+            'Specimen number', 'x position', 'y position', 'width', 'y width', 'constant pitch', 'min pitch',
+            'first inlet diameter', 'last inlet diameter', 'number of layers', 'serpentine info',
+        ])
+        for number, specimen in enumerate(placed, start=1):
+            serpentine = build_serpentine(specimen)
+            info_name = f'{filename}_specimen_{number:02d}'
+            serpentine.save_serpentine_info(info_name)
+            writer.writerow([
+                number, specimen['x_pos'], specimen['y_pos'], serpentine.width, specimen['y_width'],
+                specimen['constant_pitch'], specimen['min_pitch'], specimen['first_inlet_diameter'],
+                specimen['last_inlet_diameter'], specimen['number_of_layers'], f'{os.path.basename(info_name)}_serpentine_info.csv',
+            ])
+
+
+def generate_layout_gcode(
+        settings:dict[str,Any],
+        specimens:list[dict[str,Any]],
+        gcode_head:str,
+        gcode_tail:str,
+        output:str|IO|Callable[[Iterator[str]],int]|None=None,
+        spacing:float=DEFAULT_SPACING,
+        binary:bool=False,
+        modal:bool=False,
+        fixed_point:bool=False,
+        plan_travel:bool=False,
+        unlifted_travel:float=0.0,
+        validate:bool=True,
+        cache:OutputCache|None=None,
+        validation:Callable[[dict[str,Any]],None]|None=None,
+        ) -> int:
+    """Packs several specimens on the plate, writes the g-code printing them all in one job and
+    saves the layout next to it (see save_layout_info), as {filename}_layout.csv.
+
+    Args:
+        settings (dict[str,Any]): the settings shared by every specimen
+        specimens (list[dict[str,Any]]): the settings of each specimen overriding the shared ones, among SPECIMEN_INPUTS
+        gcode_head (str): the head of the g-code
+        gcode_tail (str): the tail of the g-code
+        output (str | IO | Callable[[Iterator[str]],int] | None): where to write the g-code (see write_job)
+        spacing (float): the smallest gap between two specimens, mm
+        binary (bool): write binary g-code (.bgcode) instead of text
+        modal (bool): leave out the words whose value did not change since the previous line
+        fixed_point (bool): print with a FixedPointNozzle, whose extruded volume is exactly reproducible
+        plan_travel (bool): print the layers in the direction saving the most travel
+        unlifted_travel (float): when planning, the longest travel made without lifting the nozzle
+        validate (bool): check the job before writing it (see validate_layers)
+        cache (OutputCache | None): reuse the body cached for the same settings, specimens and options, if any, splicing the head
+            and tail around it. Otherwise the body is stored once validated
+        validation (Callable[[dict[str,Any]],None] | None): called with the validation report, e.g. to show its warnings
+
+    Returns:
+        int: the number of characters (bytes if binary is True) written
+
+    Raises:
+        ValueError: if a specimen does not fit on the plate, or ValidationError if validate is set and
+            the validation finds errors. Nothing is written
+    """
+    placed = place_specimens(settings, specimens, spacing)
+
+    def layers() -> list[Iterable[dict]]:
+        job = layout_layers(settings, placed)
+        return plan_sketch_travels(settings, job, unlifted_travel) if plan_travel else job
+
+    key = None
+    if cache is not None:
+        key = body_key(
+            settings,
+            modal=modal,
+            fixed_point=fixed_point,
+            plan_travel=plan_travel,
+            unlifted_travel=unlifted_travel,
+            specimens=specimens,
+            spacing=spacing,
+        )
+    characters = write_job(settings, layers, gcode_head, gcode_tail, output, binary, modal, fixed_point, validate, cache, key, validation)
+    save_layout_info(settings['filename'], placed)
+    return characters
+
+
+class _Plate:
+
+    def __init__(
+            self,
+            plate_shape:str,
+            plate_size:float,
+            margin:float,
+            ) -> None:
+        """The part of the printing plate the footprints may cover: the plate shrunk by margin,
+        without the kept out rectangles widened by margin.
+        A rounded plate is centered on the origin, a squared one spans [0, plate_size] on both axes."""
+        self.plate_shape = plate_shape
+        self.plate_size = plate_size
+        self.margin = margin
+        self.kept_out = []
+
+    def keep_out(
+            self,
+            left:float,
+            bottom:float,
+            right:float,
+            top:float,
+            ) -> None:
+        self.kept_out.append((left - self.margin, bottom - self.margin, right + self.margin, top + self.margin))
+
+    def x_range(
+            self,
+            bottom:float,
+            top:float,
+            ) -> tuple[float,float]|None:
+        """Returns the x range of the plate over a band of heights, or None if the band leaves the plate"""
+        if self.plate_shape == 'rounded':
+            radius = self.plate_size/2 - self.margin
+            height = max(abs(bottom), abs(top))
+            if height > radius:
+                return None
+            half_chord = sqrt(radius**2 - height**2)
+            return -half_chord, half_chord
+        if bottom < self.margin or top > self.plate_size - self.margin:
+            return None
+        return self.margin, self.plate_size - self.margin
+
+    def free_x(
+            self,
+            x:float,
+            y:float,
+            width:float,
+            height:float,
+            ) -> float|None:
+        """Returns the lowest left edge, from x on, of a footprint whose bottom edge is at y, or None if it does not fit"""
+        x_range = self.x_range(y, y + height)
+        if x_range is None:
+            return None
+        x = max(x, x_range[0])
+        moved = True
+        while moved:
+            moved = False
+            for left, bottom, right, top in self.kept_out:
+                if x < right and x + width > left and y < top and y + height > bottom:
+                    x = right
+                    moved = True
+        return x if x + width <= x_range[1] + 1e-9 else None
+
+    def new_shelf(
+            self,
+            floor:float|None,
+            width:float,
+            height:float,
+            ) -> tuple[float,float]|None:
+        """Returns the bottom left corner of the first footprint of a new shelf, starting at floor
+        (the bottom of the plate if None) and pushed up past the kept out rectangles if needed"""
+        if self.plate_shape == 'rounded':
+            radius = self.plate_size/2 - self.margin
+            if width/2 > radius:
+                return None
+            # the lowest band whose chords are all wider than the footprint
+            lowest = -sqrt(radius**2 - (width/2)**2)
+        else:
+            lowest = self.margin
+        y = lowest if floor is None else max(floor, lowest)
+        candidates = sorted(top for _, _, _, top in self.kept_out)
+        while True:
+            x = self.free_x(float('-inf'), y, width, height)
+            if x is not None:
+                return x, y
+            candidates = [top for top in candidates if top > y]
+            if not candidates:
+                return None
+            y = candidates[0]
+
+
+def _check_specimen(specimen:dict[str,Any]) -> dict[str,Any]:
+    unknown = set(specimen) - set(SPECIMEN_INPUTS)
+    if unknown:
+        raise ValueError(f'settings not allowed per specimen: {", ".join(sorted(unknown))}')
+    return specimen
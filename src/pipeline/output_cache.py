@@ -0,0 +1,255 @@
+from collections import namedtuple
+import hashlib
+import json
+import os
+import tempfile
+from typing import IO, Any, Callable, Iterable
+from src.gcode import package_version
+from src.settings.settings_file_model import settings_index
+
+OutputCacheInfo = namedtuple('OutputCacheInfo', ['hits', 'misses', 'evictions', 'max_bytes', 'bytes', 'entries'])
+
+DEFAULT_CACHE_DIRECTORY = '.gcode_cache'
+SUFFIX = '.gcode'
+# bumped with every change of the rendered body (formatting, moves, comments), so that no body cached before is reused
+BODY_FORMAT = 1
+
+
+def normalize_settings(settings:dict[str,Any]) -> dict[str,Any]:
+    """Returns the settings the g-code body depends on: every setting of the model but the file name,
+    with their numbers converted to the declared type, so that 10 and 10.0 give the same key.
+
+    Args:
+        settings (dict[str,Any]): the settings
+
+    Returns:
+        dict[str,Any]: the normalized settings
+    """
+    return {name: _normalize_value(name, settings[name]) for name in settings_index if name != 'filename'}
+
+
+def body_options(
+        modal:bool=False,
+        fixed_point:bool=False,
+        plan_travel:bool=False,
+        unlifted_travel:float=0.0,
+        specimens:list[dict[str,Any]]|None=None,
+        spacing:float|None=None,
+        ) -> dict[str,Any]:
+    """Returns the inputs of a g-code body other than the settings, in a canonical form, so that every caller
+    (generate_gcode, generate_layout_gcode, the web interface) gives the same body the same key.
+    The options without effect are left at their default: unlifted_travel without plan_travel, spacing without specimens.
+
+    Args:
+        modal (bool): the words whose value did not change since the previous line are left out
+        fixed_point (bool): printed with a FixedPointNozzle
+        plan_travel (bool): the layers are printed in the direction saving the most travel
+        unlifted_travel (float): when planning, the longest travel made without lifting the nozzle
+        specimens (list[dict[str,Any]] | None): the settings overridden by each specimen of a multi-specimen plate
+        spacing (float | None): with specimens, the gap between the specimens and from the edge of the plate
+
+    Returns:
+        dict[str,Any]: the options
+    """
+    specimens = [{name: _normalize_value(name, value) for name, value in specimen.items()} for specimen in specimens or []]
+    return {
+        'modal': bool(modal),
+        'fixed_point': bool(fixed_point),
+        'plan_travel': bool(plan_travel),
+        'unlifted_travel': float(unlifted_travel) if plan_travel else 0.0,
+        'specimens': specimens,
+        'spacing': float(spacing) if specimens else None,
+    }
+
+
+def body_key(
+        settings:dict[str,Any],
+        **options,
+        ) -> str:
+    """Returns the key of the g-code body of the settings in an OutputCache.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        **options: the other inputs of the body, those of body_options
+
+    Returns:
+        str: the key, a SHA-256 hexadecimal digest
+    """
+    content = {
+        'version': package_version(),
+        'format': BODY_FORMAT,
+        'settings': normalize_settings(settings),
+        'options': body_options(**options),
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+class OutputCache:
+
+    def __init__(
+            self,
+            directory:str=DEFAULT_CACHE_DIRECTORY,
+            max_bytes:int=256 << 20,
+            ) -> None:
+        """Disk cache of the g-code bodies, content-addressed by a hash of the normalized settings, of the options
+        changing the body, of the version of the package and of BODY_FORMAT. The head and tail are not part of the body: they are
+        spliced around it when writing, so changing them alone reuses the cached body.
+        The bodies are streamed to and from their files, chunk by chunk, so that none is ever held whole in memory.
+        The least recently used bodies are removed once the cache holds more than max_bytes.
+
+        Args:
+            directory (str): the folder of the cache, created when the first body is stored
+            max_bytes (int): the size of the cache, at most
+        """
+        if max_bytes < 1:
+            raise ValueError('the cache must hold at least one byte')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def open(self, key:str) -> IO[str]|None:
+        """Opens the cached body of a key for reading, to be closed by the caller.
+
+        Args:
+            key (str): the key
+
+        Returns:
+            IO[str] | None: the body, None on a miss
+        """
+        path = self._path(key)
+        try:
+            body_file = open(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # the modification time orders the entries from the least recently used
+        os.utime(path)
+        self.hits += 1
+        return body_file
+
+    def get(self, key:str) -> str|None:
+        """Returns the cached body of a key, read whole, None on a miss.
+
+        Args:
+            key (str): the key
+
+        Returns:
+            str | None: the body
+        """
+        body_file = self.open(key)
+        if body_file is None:
+            return None
+        with body_file:
+            return body_file.read()
+
+    def put(
+            self,
+            key:str,
+            body:str|Iterable[str],
+            ) -> None:
+        """Stores the body of a key, then removes the least recently used bodies beyond max_bytes.
+        The body just stored is kept, even if it alone is larger than max_bytes, until the next one is stored.
+
+        Args:
+            key (str): the key
+            body (str | Iterable[str]): the body of the g-code as rendered by GCodeGenerator.iter_body, whole or in pieces, consumed lazily
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        # written aside then renamed, so that no reader ever sees half a body
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w') as body_file:
+                if isinstance(body, str):
+                    body_file.write(body)
+                else:
+                    for piece in body:
+                        body_file.write(piece)
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self._evict(self._path(key))
+
+    def body(
+            self,
+            key:str,
+            build:Callable[[],str|Iterable[str]],
+            ) -> IO[str]:
+        """Opens the cached body of a key for reading, building and storing it first on a miss.
+
+        Args:
+            key (str): the key
+            build (Callable[[],str|Iterable[str]]): builds the body on a miss, whole or in pieces
+
+        Returns:
+            IO[str]: the body, to be closed by the caller
+        """
+        body_file = self.open(key)
+        if body_file is None:
+            self.put(key, build())
+            body_file = open(self._path(key))
+        return body_file
+
+    def cache_info(self) -> OutputCacheInfo:
+        """Returns the hits, misses, evictions, maximum size, current size and number of bodies of the cache"""
+        entries = self._entries()
+        return OutputCacheInfo(self.hits, self.misses, self.evictions, self.max_bytes, sum(size for _, size, _ in entries), len(entries))
+
+    def clear(self) -> None:
+        """Removes every body and resets the counters"""
+        for path, _, _ in self._entries():
+            os.remove(path)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key:str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def _entries(self) -> list[tuple[str,int,int]]:
+        """Lists the path, size and modification time of the cached bodies"""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(SUFFIX):
+                try:
+                    status = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, status.st_size, status.st_mtime_ns))
+        return entries
+
+    def _evict(self, kept:str) -> None:
+        """Removes the least recently used bodies but the kept one until the cache fits in max_bytes"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for path, entry_size, _ in entries:
+            if size <= self.max_bytes:
+                break
+            if path == kept:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # e.g. open for reading on Windows
+                continue
+            size -= entry_size
+            self.evictions += 1
+
+
+def _normalize_value(
+        name:str,
+        value:Any,
+        ) -> Any:
+    """Converts a number to the type declared for the setting"""
+    if settings_index[name].type is float and not isinstance(value, bool):
+        return float(value)
+    if settings_index[name].type is int and isinstance(value, float) and value.is_integer():
+        # e.g. read from a number input of the interface
+        return int(value)
+    return value
@@ -0,0 +1,601 @@
+from typing import IO, Any, Callable, Iterable, Iterator
+from src.gcode import GCodeGenerator
+from src.printer import FixedPointNozzle, InstructionBuffer, Nozzle, Printer, plan_travels, travel_summary
+from src.shapes import Segment, Serpentine, set_position
+from src.sketch import Sketch, SketchLayers
+from src.pipeline.output_cache import OutputCache, body_key
+from src.pipeline.validation import ValidationError, validate_layers
+from src.profiling import profiler
+
+SERPENTINE_INPUTS = (
+    'plate_shape',
+    'plate_size',
+    'centered_serpentine',
+    'x_pos',
+    'y_pos',
+    'x_width',
+    'y_width',
+    'constant_pitch',
+    'min_pitch',
+    'first_inlet_diameter',
+    'last_inlet_diameter',
+)
+SEGMENT_INPUTS = SERPENTINE_INPUTS + (
+    'centered_segment',
+    'segment_y_pos',
+)
+PURGE_INPUTS = (
+    'purge_x',
+    'purge_y',
+    'length',
+    'purge_inlet_diameter',
+    'is_vertical',
+)
+SKETCH_INPUTS = SEGMENT_INPUTS + (
+    'layer_height',
+    'number_of_layers',
+    'print_segment',
+)
+NOZZLE_INPUTS = (
+    'x_home',
+    'y_home',
+    'z_home',
+    'layer_width',
+    'layer_height',
+    'retraction',
+    'lift_distance',
+    'moving_speed',
+    'printing_speed',
+)
+INSTRUCTION_INPUTS = tuple(dict.fromkeys(SKETCH_INPUTS + PURGE_INPUTS + NOZZLE_INPUTS + ('purge_nozzle',)))
+
+
+def stage_key(
+        settings:dict[str,Any],
+        inputs:tuple[str,...]
+        ) -> tuple:
+    """Returns the values of the settings a stage depends on, usable as a cache key.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        inputs (tuple[str,...]): the names of the settings the stage depends on
+
+    Returns:
+        tuple: the values of the inputs
+    """
+    return tuple(settings[name] for name in inputs)
+
+
+@profiler.profiled('serpentine')
+def build_serpentine(settings:dict[str,Any]) -> Serpentine:
+    """Builds the serpentine, placed on the printing plate.
+
+    Args:
+        settings (dict[str,Any]): the settings
+
+    Returns:
+        Serpentine: the serpentine
+    """
+    x_pos, y_pos = set_position(
+        settings['plate_shape'],
+        settings['plate_size'],
+        settings['centered_serpentine'],
+        settings['x_pos'],
+        settings['y_pos'],
+        settings['x_width'],
+        settings['y_width'],
+    )
+    return Serpentine(
+        x_pos=x_pos,
+        y_pos=y_pos,
+        x_width=settings['x_width'],
+        y_width=settings['y_width'],
+        constant_pitch=settings['constant_pitch'],
+        min_pitch=settings['min_pitch'],
+        first_inlet_diameter=settings['first_inlet_diameter'],
+        last_inlet_diameter=settings['last_inlet_diameter'],
+    )
+
+
+@profiler.profiled('segment')
+def build_segment(
+        settings:dict[str,Any],
+        serpentine:Serpentine
+        ) -> Segment:
+    """Builds the suspended segment printed on top of the serpentine.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        serpentine (Serpentine): the serpentine the segment lies on
+
+    Returns:
+        Segment: the suspended segment
+    """
+    shift = 0.5 if settings['centered_segment'] is True else settings['segment_y_pos']
+    return Segment(
+        x_position=serpentine.x_pos,
+        y_position=serpentine.y_pos + settings['y_width']*shift,
+        length=serpentine.width,
+        inlet_diameter=settings['first_inlet_diameter'],
+    )
+
+
+@profiler.profiled('segment')
+def build_purge_segment(settings:dict[str,Any]) -> Segment:
+    """Builds the segment printed to purge the nozzle.
+
+    Args:
+        settings (dict[str,Any]): the settings
+
+    Returns:
+        Segment: the purge segment
+    """
+    return Segment(
+        x_position=settings['purge_x'],
+        y_position=settings['purge_y'],
+        length=settings['length'],
+        inlet_diameter=settings['purge_inlet_diameter'],
+        is_vertical=settings['is_vertical'],
+    )
+
+
+@profiler.profiled('sketch')
+def build_sketch(
+        settings:dict[str,Any],
+        serpentine:Serpentine,
+        segment:Segment|None=None,
+        ) -> Sketch:
+    """Builds the sketch of the stacked serpentines, topped by the suspended segment if print_segment is set.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        serpentine (Serpentine): the serpentine
+        segment (Segment | None): the suspended segment. Built from the serpentine if None
+
+    Returns:
+        Sketch: the sketch. Its coordinates are not stored, but yielded by iter_coordinates (see sketch_layers)
+    """
+    sketch = Sketch(
+        layer_height=settings['layer_height'],
+        number_of_layers=settings['number_of_layers'],
+    )
+    sketch.gen_serpentine_layers(serpentine.trace_info)
+    if settings['print_segment'] is True:
+        if segment is None:
+            segment = build_segment(settings, serpentine)
+        sketch.gen_segment_layer(segment.trace_info)
+    return sketch
+
+
+@profiler.profiled('sketch')
+def build_purge_sketch(
+        settings:dict[str,Any],
+        purge_segment:Segment|None=None,
+        ) -> Sketch:
+    """Builds the single layer sketch of the purge segment.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        purge_segment (Segment | None): the purge segment. Built from the settings if None
+
+    Returns:
+        Sketch: the sketch. Its coordinates are not stored, but yielded by iter_coordinates (see sketch_layers)
+    """
+    if purge_segment is None:
+        purge_segment = build_purge_segment(settings)
+    sketch = Sketch(
+        layer_height=settings['layer_height'],
+        number_of_layers=1,
+    )
+    sketch.gen_segment_layer(purge_segment.trace_info)
+    return sketch
+
+
+def build_nozzle(
+        settings:dict[str,Any],
+        fixed_point:bool=False,
+        ) -> Nozzle:
+    """Builds the nozzle of the printer, at its home position.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        fixed_point (bool): build a FixedPointNozzle, doing its bookkeeping in integers
+
+    Returns:
+        Nozzle: the nozzle
+    """
+    nozzle_class = FixedPointNozzle if fixed_point else Nozzle
+    return nozzle_class(
+        x_home=settings['x_home'],
+        y_home=settings['y_home'],
+        z_home=settings['z_home'],
+        layer_width=settings['layer_width'],
+        layer_height=settings['layer_height'],
+        retraction=settings['retraction'],
+        lift_distance=settings['lift_distance'],
+        moving_speed=settings['moving_speed'],
+        printing_speed=settings['printing_speed'],
+    )
+
+
+def sketch_layers(
+        settings:dict[str,Any],
+        sketch:Sketch,
+        purge_sketch:Sketch|None=None,
+        ) -> list[SketchLayers]:
+    """Lists the layers printed in a row: those of the purge sketch, if purge_nozzle is set, then those of the main sketch.
+    The layers are generated from the sketches each time they are iterated, one at a time.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        sketch (Sketch): the main sketch
+        purge_sketch (Sketch | None): the purge sketch. Built from the settings if None and needed
+
+    Returns:
+        list[SketchLayers]: the coordinates of each sketch
+    """
+    if settings['purge_nozzle'] is not True:
+        return [SketchLayers(sketch)]
+    if purge_sketch is None:
+        purge_sketch = build_purge_sketch(settings)
+    return [SketchLayers(purge_sketch), SketchLayers(sketch)]
+
+
+@profiler.profiled('travel_planning')
+def plan_sketch_travels(
+        settings:dict[str,Any],
+        layers:list[Iterable[dict]],
+        unlifted_travel:float=0.0,
+        ) -> list[list[dict]]:
+    """Plans the travels of sketches printed in a row, each starting where the previous one ends.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        layers (list[Iterable[dict]]): the coordinates of each sketch
+        unlifted_travel (float): the longest travel made without lifting the nozzle
+
+    Returns:
+        list[list[dict]]: the planned coordinates of each sketch
+    """
+    x, y = settings['x_home'], settings['y_home']
+    planned = []
+    for coordinates in layers:
+        planned.append(plan_travels(coordinates, x, y, unlifted_travel=unlifted_travel))
+        if planned[-1]:
+            x, y = planned[-1][-1]['trace'][-1]['x'], planned[-1][-1]['trace'][-1]['y']
+    return planned
+
+
+def job_layers(
+        settings:dict[str,Any],
+        sketch:Sketch,
+        purge_sketch:Sketch|None=None,
+        plan_travel:bool=False,
+        unlifted_travel:float=0.0,
+        ) -> list[Iterable[dict]]:
+    """Lists the layers of the job as they are printed: those of sketch_layers, planned if plan_travel is set.
+    Unless planned, they are generated from the sketches as they are iterated.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        sketch (Sketch): the main sketch
+        purge_sketch (Sketch | None): the purge sketch. Built from the settings if None and needed
+        plan_travel (bool): print the layers in the direction saving the most travel (see plan_travels)
+        unlifted_travel (float): when planning, the longest travel made without lifting the nozzle
+
+    Returns:
+        list[Iterable[dict]]: the coordinates of each sketch
+    """
+    layers = sketch_layers(settings, sketch, purge_sketch)
+    if plan_travel:
+        layers = plan_sketch_travels(settings, layers, unlifted_travel)
+    return layers
+
+
+def print_layers(
+        settings:dict[str,Any],
+        layers:list[Iterable[dict]],
+        fixed_point:bool=False,
+        ) -> InstructionBuffer:
+    """Prints the coordinates of sketches in a row.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        layers (list[Iterable[dict]]): the coordinates of each sketch, as returned by job_layers
+        fixed_point (bool): print with a FixedPointNozzle
+
+    Returns:
+        InstructionBuffer: the instructions
+    """
+    printer = Printer(build_nozzle(settings, fixed_point))
+    for coordinates in layers:
+        printer.print_cad(coordinates)
+    return printer.instructions
+
+
+def iter_instructions(
+        settings:dict[str,Any],
+        layers:Iterable[Iterable[dict]],
+        fixed_point:bool=False,
+        ) -> Iterator[InstructionBuffer]:
+    """Prints the coordinates of sketches in a row as print_layers does, yielding the instructions layer by layer.
+    The sketches are printed by the same printer, one after the other, so the purge and main sketches make a single
+    stream whose positions and extruded volume carry over. Only one layer of instructions is held at a time.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        layers (Iterable[Iterable[dict]]): the coordinates of each sketch, as returned by job_layers, consumed lazily
+        fixed_point (bool): print with a FixedPointNozzle
+
+    Yields:
+        InstructionBuffer: the instructions of the next layer, the first one starting with the home position
+    """
+    printer = Printer(build_nozzle(settings, fixed_point))
+    for coordinates in layers:
+        yield from printer.iter_cad(coordinates)
+    if len(printer.instructions):
+        # the home position of a job without layers
+        yield printer.instructions
+
+
+def print_sketches(
+        settings:dict[str,Any],
+        sketch:Sketch,
+        purge_sketch:Sketch|None=None,
+        fixed_point:bool=False,
+        plan_travel:bool=False,
+        unlifted_travel:float=0.0,
+        ) -> InstructionBuffer:
+    """Prints the purge sketch, if purge_nozzle is set, then the main sketch.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        sketch (Sketch): the main sketch
+        purge_sketch (Sketch | None): the purge sketch. Built from the settings if None and needed
+        fixed_point (bool): print with a FixedPointNozzle
+        plan_travel (bool): print the layers in the direction saving the most travel (see plan_travels)
+        unlifted_travel (float): when planning, the longest travel made without lifting the nozzle
+
+    Returns:
+        InstructionBuffer: the instructions
+    """
+    return print_layers(settings, job_layers(settings, sketch, purge_sketch, plan_travel, unlifted_travel), fixed_point)
+
+
+def travel_savings(
+        settings:dict[str,Any],
+        sketch:Sketch,
+        purge_sketch:Sketch|None=None,
+        unlifted_travel:float=0.0,
+        ) -> dict[str,Any]:
+    """Compares the travels of the planned layers with those of the layers as sketched.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        sketch (Sketch): the main sketch
+        purge_sketch (Sketch | None): the purge sketch. Built from the settings if None and needed
+        unlifted_travel (float): the longest travel made without lifting the nozzle
+
+    Returns:
+        dict[str,Any]: the travel summaries 'before' and 'after' planning, the 'distance_saved' and the 'seconds_saved'
+    """
+    return layers_travel_savings(settings, sketch_layers(settings, sketch, purge_sketch), unlifted_travel)
+
+
+def layers_travel_savings(
+        settings:dict[str,Any],
+        layers:list[Iterable[dict]],
+        unlifted_travel:float=0.0,
+        ) -> dict[str,Any]:
+    """Compares the travels of the planned layers with those of the given ones (see travel_savings).
+
+    Args:
+        settings (dict[str,Any]): the settings
+        layers (list[Iterable[dict]]): the coordinates of each part of the job, as returned by sketch_layers
+        unlifted_travel (float): the longest travel made without lifting the nozzle
+
+    Returns:
+        dict[str,Any]: the travel summaries 'before' and 'after' planning, the 'distance_saved' and the 'seconds_saved'
+    """
+    planned = plan_sketch_travels(settings, layers, unlifted_travel)
+    summaries = [
+        travel_summary(
+            [layer for coordinates in sketches for layer in coordinates],
+            settings['x_home'],
+            settings['y_home'],
+            settings['z_home'],
+            settings['lift_distance'],
+            settings['moving_speed'],
+        )
+        for sketches in (layers, planned)
+    ]
+    return {
+        'before': summaries[0],
+        'after': summaries[1],
+        'distance_saved': summaries[0]['distance'] - summaries[1]['distance'],
+        'seconds_saved': summaries[0]['seconds'] - summaries[1]['seconds'],
+    }
+
+
+def generate_gcode(
+        settings:dict[str,Any],
+        gcode_head:str,
+        gcode_tail:str,
+        output:str|IO|Callable[[Iterator[str]],int]|None=None,
+        serpentine:Serpentine|None=None,
+        binary:bool=False,
+        modal:bool=False,
+        fixed_point:bool=False,
+        plan_travel:bool=False,
+        unlifted_travel:float=0.0,
+        validate:bool=True,
+        cache:OutputCache|None=None,
+        validation:Callable[[dict[str,Any]],None]|None=None,
+        ) -> int:
+    """Runs the whole Serpentine -> Sketch -> Printer -> GCodeGenerator pipeline and writes the g-code.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        gcode_head (str): the head of the g-code
+        gcode_tail (str): the tail of the g-code
+        output (str | IO | Callable[[Iterator[str]],int] | None): where to write the g-code (see write_job)
+        serpentine (Serpentine | None): an already built serpentine for these settings, to reuse
+        binary (bool): write binary g-code (.bgcode) instead of text
+        modal (bool): leave out the words whose value did not change since the previous line
+        fixed_point (bool): print with a FixedPointNozzle, whose extruded volume is exactly reproducible
+        plan_travel (bool): print the layers in the direction saving the most travel
+        unlifted_travel (float): when planning, the longest travel made without lifting the nozzle
+        validate (bool): check the job before writing it (see validate_layers)
+        cache (OutputCache | None): reuse the body cached for the same settings and options, if any, splicing the head
+            and tail around it. Otherwise the body is stored once validated
+        validation (Callable[[dict[str,Any]],None] | None): called with the validation report, e.g. to show its warnings
+
+    Returns:
+        int: the number of characters (bytes if binary is True) written
+
+    Raises:
+        ValidationError: if validate is set and the validation finds errors. Nothing is written
+    """
+    def layers() -> list[Iterable[dict]]:
+        return job_layers(
+            settings,
+            build_sketch(settings, build_serpentine(settings) if serpentine is None else serpentine),
+            plan_travel=plan_travel,
+            unlifted_travel=unlifted_travel,
+        )
+
+    key = None
+    if cache is not None:
+        key = body_key(settings, modal=modal, fixed_point=fixed_point, plan_travel=plan_travel, unlifted_travel=unlifted_travel)
+    return write_job(settings, layers, gcode_head, gcode_tail, output, binary, modal, fixed_point, validate, cache, key, validation)
+
+
+def write_job(
+        settings:dict[str,Any],
+        layers:Callable[[],list[Iterable[dict]]],
+        gcode_head:str,
+        gcode_tail:str,
+        output:str|IO|Callable[[Iterator[str]],int]|None=None,
+        binary:bool=False,
+        modal:bool=False,
+        fixed_point:bool=False,
+        validate:bool=True,
+        cache:OutputCache|None=None,
+        key:str|None=None,
+        validation:Callable[[dict[str,Any]],None]|None=None,
+        ) -> int:
+    """Writes the g-code of a job, reusing its body from the cache if any. On a miss the layers are built, validated,
+    printed and rendered to the cache layer by layer, then the cached body is copied between the head and the tail.
+    Only validated bodies are cached, so the cache is left out if validate is False.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        layers (Callable[[],list[Iterable[dict]]]): builds the coordinates of each part of the job, in printing order. Not called on a hit
+        gcode_head (str): the head of the g-code
+        gcode_tail (str): the tail of the g-code
+        output (str | IO | Callable[[Iterator[str]],int] | None): a file name, an open file object (binary if binary is True), '-' for the standard output,
+            None for {filename}.gcode/.bgcode, or a function taking the text g-code piece by piece and returning the characters it handled,
+            e.g. sending them to a printer
+        binary (bool): write binary g-code (.bgcode) instead of text
+        modal (bool): leave out the words whose value did not change since the previous line
+        fixed_point (bool): print with a FixedPointNozzle, whose extruded volume is exactly reproducible
+        validate (bool): check the layers first (see validate_layers)
+        cache (OutputCache | None): the cache of the bodies
+        key (str | None): with cache, the key of the body, from body_key
+        validation (Callable[[dict[str,Any]],None] | None): called with the validation report, e.g. to show its warnings
+
+    Returns:
+        int: the number of characters (bytes if binary is True) written
+
+    Raises:
+        ValidationError: if validate is set and the validation finds errors. Nothing is written
+    """
+    if cache is None or not validate:
+        return write_layers(settings, layers(), gcode_head, gcode_tail, output, binary, modal, fixed_point, validate, validation)
+
+    def render() -> Iterator[str]:
+        job = layers()
+        _validate(settings, job, validation)
+        return GCodeGenerator(settings['filename'], '', '', modal=modal).iter_body(iter_instructions(settings, job, fixed_point))
+
+    with cache.body(key, render) as body:
+        return _write_gcode(settings, body, gcode_head, gcode_tail, output, binary, modal)
+
+
+def write_layers(
+        settings:dict[str,Any],
+        layers:list[Iterable[dict]],
+        gcode_head:str,
+        gcode_tail:str,
+        output:str|IO|Callable[[Iterator[str]],int]|None=None,
+        binary:bool=False,
+        modal:bool=False,
+        fixed_point:bool=False,
+        validate:bool=True,
+        validation:Callable[[dict[str,Any]],None]|None=None,
+        ) -> int:
+    """Validates the layers of a job, prints them and writes the g-code.
+    The layers are printed and formatted as they are written, one at a time (see iter_instructions), so those of
+    job_layers are generated from the sketches twice, for the validation and for the printing, and never stored.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        layers (list[Iterable[dict]]): the coordinates of each part of the job, in printing order, each iterable twice
+        gcode_head (str): the head of the g-code
+        gcode_tail (str): the tail of the g-code
+        output (str | IO | Callable[[Iterator[str]],int] | None): where to write the g-code (see write_job)
+        binary (bool): write binary g-code (.bgcode) instead of text
+        modal (bool): leave out the words whose value did not change since the previous line
+        fixed_point (bool): print with a FixedPointNozzle, whose extruded volume is exactly reproducible
+        validate (bool): check the layers first (see validate_layers)
+        validation (Callable[[dict[str,Any]],None] | None): called with the validation report, e.g. to show its warnings
+
+    Returns:
+        int: the number of characters (bytes if binary is True) written
+
+    Raises:
+        ValidationError: if validate is set and the validation finds errors. Nothing is written
+    """
+    if validate:
+        _validate(settings, layers, validation)
+    return _write_gcode(settings, iter_instructions(settings, layers, fixed_point), gcode_head, gcode_tail, output, binary, modal)
+
+
+def _validate(
+        settings:dict[str,Any],
+        layers:list[Iterable[dict]],
+        validation:Callable[[dict[str,Any]],None]|None,
+        ) -> None:
+    """Validates the layers, passing the report to validation, and raises ValidationError if it has errors"""
+    report = validate_layers(settings, layers)
+    if validation is not None:
+        validation(report)
+    if not report['valid']:
+        raise ValidationError(report)
+
+
+def _write_gcode(
+        settings:dict[str,Any],
+        instructions:Iterable[InstructionBuffer]|InstructionBuffer|str|IO[str],
+        gcode_head:str,
+        gcode_tail:str,
+        output:str|IO|Callable[[Iterator[str]],int]|None,
+        binary:bool,
+        modal:bool,
+        ) -> int:
+    """Writes the g-code of the instructions, or of the body they were rendered to, to the output of write_job"""
+    gcode_generator = GCodeGenerator(
+        filename=settings['filename'],
+        gcode_head=gcode_head,
+        gcode_tail=gcode_tail,
+        modal=modal,
+    )
+    if callable(output):
+        return output(gcode_generator.iter_gcode(instructions))
+    if binary:
+        if output is None:
+            output = f'{gcode_generator.filename}.bgcode'
+        return gcode_generator.write_bgcode(instructions, output)
+    if output is None:
+        output = f'{gcode_generator.filename}.gcode'
+    return gcode_generator.write_gcode(instructions, output)
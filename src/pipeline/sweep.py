@@ -0,0 +1,185 @@
+import argparse
+from ast import literal_eval
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+import csv
+from itertools import product
+from math import floor
+import os
+import time
+from typing import Any
+from src.pipeline.pipeline import SERPENTINE_INPUTS, build_serpentine, generate_gcode, stage_key
+from src.settings import SettingsManager
+from src.settings.settings_file_model import settings_model
+from src.shapes import Serpentine
+
+
+def parse_values(text:str) -> list[Any]:
+    """Parses the values of a swept setting: either a comma separated list (3000,3600,4200)
+    or an inclusive start:stop:step range (0.5:2:0.5).
+
+    Args:
+        text (str): the values
+
+    Returns:
+        list[Any]: the parsed values
+    """
+    if ':' in text:
+        start, stop, step = (_convert(part.strip()) for part in text.split(':'))
+        if step <= 0:
+            raise ValueError(f'the step of {text} must be positive')
+        count = floor((stop - start)/step + 1e-9) + 1
+        if isinstance(start, int) and isinstance(step, int):
+            return [start + i*step for i in range(count)]
+        return [round(start + i*step, 10) for i in range(count)]
+    return [_convert(value.strip()) for value in text.split(',')]
+
+
+def expand_sweep(
+        base_settings:dict[str,Any],
+        sweep:dict[str,list[Any]],
+        ) -> list[dict[str,Any]]:
+    """Expands the Cartesian product of the swept values over the base settings.
+
+    Args:
+        base_settings (dict[str,Any]): the settings shared by every combination
+        sweep (dict[str,list[Any]]): the values of each swept setting
+
+    Returns:
+        list[dict[str,Any]]: the settings of each combination
+    """
+    known = {option for options in settings_model.values() for option in options}
+    unknown = set(sweep) - known
+    if unknown:
+        raise ValueError(f'unknown settings: {", ".join(sorted(unknown))}')
+    return [
+        base_settings | dict(zip(sweep, values))
+        for values in product(*sweep.values())
+    ]
+
+
+def run_sweep(
+        base_settings:dict[str,Any],
+        sweep:dict[str,list[Any]],
+        gcode_head:str,
+        gcode_tail:str,
+        output_dir:str='.',
+        max_workers:int|None=None,
+        ) -> list[dict[str,Any]]:
+    """Generates one g-code file for each combination of the swept settings on a process pool,
+    and writes a {filename}_manifest.csv linking each file to its parameters.
+
+    Combinations sharing the same serpentine inputs reuse a single serpentine geometry, built once.
+    At most twice max_workers jobs are queued at any time, so the memory stays bounded however
+    large the sweep is.
+
+    Args:
+        base_settings (dict[str,Any]): the settings shared by every combination
+        sweep (dict[str,list[Any]]): the values of each swept setting
+        gcode_head (str): the head of the g-code files
+        gcode_tail (str): the tail of the g-code files
+        output_dir (str): the folder the files are written to
+        max_workers (int | None): the number of worker processes. Defaults to the number of CPUs
+
+    Returns:
+        list[dict[str,Any]]: the manifest rows: file name, swept parameters, size and generation time
+    """
+    combinations = expand_sweep(base_settings, sweep)
+    os.makedirs(output_dir, exist_ok=True)
+    max_workers = max_workers or os.cpu_count() or 1
+    serpentines = {}
+    manifest = []
+    pending = set()
+
+    def collect(done:set[Future]) -> None:
+        for future in done:
+            manifest.append(future.result())
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for index, settings in enumerate(combinations, start=1):
+            key = stage_key(settings, SERPENTINE_INPUTS)
+            if key not in serpentines:
+                serpentines[key] = build_serpentine(settings)
+            filename = f'{base_settings["filename"]}_{index:03d}'
+            settings = settings | {'filename': os.path.join(output_dir, filename)}
+            parameters = {name: settings[name] for name in sweep}
+            if len(pending) >= 2*max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(_generate, settings, gcode_head, gcode_tail, serpentines[key], filename, parameters))
+        done, _ = wait(pending)
+        collect(done)
+    manifest.sort(key=lambda row: row['file'])
+    with open(os.path.join(output_dir, f'{base_settings["filename"]}_manifest.csv'), 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=['file', *sweep, 'characters', 'seconds'])
+        writer.writeheader()
+        writer.writerows(manifest)
+    return manifest
+
+
+def _generate(
+        settings:dict[str,Any],
+        gcode_head:str,
+        gcode_tail:str,
+        serpentine:Serpentine,
+        filename:str,
+        parameters:dict[str,Any],
+        ) -> dict[str,Any]:
+    """Generates one file of the sweep, in a worker process"""
+    start = time.perf_counter()
+    characters = generate_gcode(settings, gcode_head, gcode_tail, serpentine=serpentine)
+    return {
+        'file': f'{filename}.gcode',
+        **parameters,
+        'characters': characters,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def _convert(value:str) -> Any:
+    try:
+        return literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def main(argv:list[str]|None=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m src.pipeline.sweep',
+        description='Generates one g-code file for each combination of the swept settings',
+    )
+    parser.add_argument('--settings', help='the base settings file (default: settings.ini)')
+    parser.add_argument('--head', help='the g-code head file (default: gcode_head.ini)')
+    parser.add_argument('--tail', help='the g-code tail file (default: gcode_tail.ini)')
+    parser.add_argument(
+        '--vary',
+        action='append',
+        default=[],
+        metavar='KEY=VALUES',
+        help='a swept setting, with comma separated values or an inclusive start:stop:step range. Can be repeated',
+    )
+    parser.add_argument('--output-dir', default='.', help='the folder the files are written to')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes')
+    arguments = parser.parse_args(argv)
+    sweep = {}
+    for item in arguments.vary:
+        key, separator, values = item.partition('=')
+        if not separator:
+            parser.error(f'--vary expects KEY=VALUES, got {item}')
+        sweep[key.strip()] = parse_values(values)
+    try:
+        settings = SettingsManager(arguments.settings, arguments.head, arguments.tail)
+        manifest = run_sweep(
+            settings.as_dict(),
+            sweep,
+            settings.gcode_head,
+            settings.gcode_tail,
+            output_dir=arguments.output_dir,
+            max_workers=arguments.workers,
+        )
+    except ValueError as error:
+        parser.error(str(error))
+    print(f'{len(manifest)} files written to {arguments.output_dir}')
+
+
+if __name__ == '__main__':
+    main()
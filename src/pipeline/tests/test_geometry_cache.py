@@ -0,0 +1,37 @@
+from src.pipeline import GeometryCache, build_sketch, build_serpentine
+from src.settings import SettingsManager
+from src.sketch import SketchLayers
+import pytest
+
+@pytest.fixture
+def settings() -> dict:
+    return SettingsManager('defaults/settings.ini', 'defaults/gcode_head.ini', 'defaults/gcode_tail.ini').as_dict()
+
+def test_non_geometry_settings_hit(settings: dict):
+    cache = GeometryCache()
+    sketch = cache.sketch(settings)
+    assert cache.sketch(settings | {'moving_speed': 1000, 'filename': 'other'}) is sketch
+    assert cache.cache_info().hits == 1
+
+def test_geometry_settings_miss(settings: dict):
+    cache = GeometryCache()
+    serpentine = cache.serpentine(settings)
+    sketch = cache.sketch(settings)
+    other = cache.sketch(settings | {'number_of_layers': 3})
+    assert other is not sketch
+    assert cache.serpentine(settings | {'number_of_layers': 3}) is serpentine
+    assert len(SketchLayers(other)) == 3 + (settings['print_segment'] is True)
+
+def test_cached_sketch_matches_pipeline(settings: dict):
+    settings = settings | {'print_segment': True}
+    sketch = GeometryCache().sketch(settings)
+    assert list(sketch.iter_coordinates()) == list(build_sketch(settings, build_serpentine(settings)).iter_coordinates())
+
+def test_eviction(settings: dict):
+    cache = GeometryCache(max_size=2)
+    first = cache.purge_segment(settings)
+    cache.purge_segment(settings | {'length': 10})
+    cache.purge_segment(settings | {'length': 20})
+    assert cache.cache_info().size == 2
+    assert cache.purge_segment(settings) is not first
+    assert cache.cache_info().misses == 4
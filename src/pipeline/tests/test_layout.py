@@ -0,0 +1,70 @@
+from math import hypot
+from src.gcode.analyzer import analyze
+from src.pipeline import build_serpentine, generate_layout_gcode, layout_layers, place_specimens
+from src.settings import SettingsManager
+import pytest
+
+SPECIMENS = [{'x_width': 40, 'y_width': 30, 'min_pitch': pitch} for pitch in (1, 2, 3, 4, 0.5, 1.5)]
+
+@pytest.fixture
+def settings() -> dict:
+    return SettingsManager('defaults/settings.ini', 'defaults/gcode_head.ini', 'defaults/gcode_tail.ini').as_dict()
+
+def _boxes(settings:dict, placed:list[dict]) -> list[tuple[float,float,float,float]]:
+    margin = settings['layer_width']/2
+    return [
+        (specimen['x_pos'] - margin, specimen['y_pos'] - margin,
+         specimen['x_pos'] + build_serpentine(specimen).width + margin, specimen['y_pos'] + specimen['y_width'] + margin)
+        for specimen in placed
+    ]
+
+def _apart(first:tuple, second:tuple, spacing:float) -> bool:
+    return (
+        first[2] + spacing <= second[0] + 1e-6 or second[2] + spacing <= first[0] + 1e-6
+        or first[3] + spacing <= second[1] + 1e-6 or second[3] + spacing <= first[1] + 1e-6
+    )
+
+@pytest.mark.parametrize('plate_shape', ['rounded', 'squared'])
+def test_place_specimens(settings:dict, plate_shape:str):
+    settings = settings | {'plate_shape': plate_shape}
+    if plate_shape == 'squared':
+        settings |= {'purge_x': 100, 'purge_y': 80}
+    placed = place_specimens(settings, SPECIMENS, spacing=5)
+    assert [specimen['min_pitch'] for specimen in placed] == [1, 2, 3, 4, 0.5, 1.5]
+    boxes = _boxes(settings, placed)
+    for index, box in enumerate(boxes):
+        for other in boxes[index + 1:]:
+            assert _apart(box, other, 5)
+        purge = (settings['purge_x'] - 0.5, settings['purge_y'] - 0.5, settings['purge_x'] + 0.5, settings['purge_y'] + settings['length'] + 0.5)
+        assert _apart(box, purge, 5)
+        if plate_shape == 'rounded':
+            assert all(hypot(x, y) <= settings['plate_size']/2 - 5 + 1e-6 for x in box[::2] for y in box[1::2])
+        else:
+            assert 5 - 1e-6 <= min(box) and max(box) <= settings['plate_size'] - 5 + 1e-6
+
+def test_place_specimens_errors(settings:dict):
+    with pytest.raises(ValueError):
+        place_specimens(settings, [{}]*5)
+    with pytest.raises(ValueError):
+        place_specimens(settings, [{'plate_size': 300}])
+
+def test_layout_layers(settings:dict):
+    placed = place_specimens(settings, SPECIMENS[:3] + [{'x_width': 40, 'y_width': 30, 'number_of_layers': 2}])
+    purge, layers = layout_layers(settings, placed)
+    heights = [layer['z'] for layer in layers]
+    assert heights == sorted(heights)
+    assert len(layers) == 3*settings['number_of_layers'] + 2
+    first = [layer['template'][0] for layer in layers if layer['z'] == heights[0]]
+    second = [layer['template'][0] for layer in layers if layer['z'] == heights[len(first)]]
+    assert second == first[::-1]
+
+def test_generate_layout_gcode(settings:dict, tmp_path):
+    settings = settings | {'filename': str(tmp_path/'plate')}
+    generate_layout_gcode(settings, SPECIMENS, '', '')
+    statistics = analyze(str(tmp_path/'plate.gcode'))
+    # the purge segment is printed at the height of the first layer
+    assert statistics['layers'] == settings['number_of_layers']
+    rows = (tmp_path/'plate_layout.csv').read_text().splitlines()
+    assert len(rows) == len(SPECIMENS) + 1
+    assert rows[1].endswith('plate_specimen_01_serpentine_info.csv')
+    assert (tmp_path/'plate_specimen_06_serpentine_info.csv').exists()
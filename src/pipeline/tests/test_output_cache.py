@@ -0,0 +1,144 @@
+import io
+import os
+import tracemalloc
+from src.cli import main
+from src.pipeline import OutputCache, body_key, body_options, generate_gcode, generate_layout_gcode
+from src.pipeline import output_cache
+from src.settings import SettingsManager
+import pytest
+
+@pytest.fixture
+def settings() -> dict:
+    return SettingsManager('defaults/settings.ini', 'defaults/gcode_head.ini', 'defaults/gcode_tail.ini').as_dict()
+
+def _generate(settings:dict, cache:OutputCache, head:str='G28', tail:str='M84', **options) -> str:
+    output = io.StringIO()
+    generate_gcode(settings, head, tail, output=output, cache=cache, **options)
+    return output.getvalue()
+
+def test_body_key(settings:dict):
+    key = body_key(settings)
+    assert body_key(settings | {'filename': 'other'}) == key
+    assert body_key(settings | {'printing_speed': int(settings['printing_speed'])}) == key
+    assert body_key(settings | {'number_of_layers': float(settings['number_of_layers'])}) == key
+    assert body_key(settings | {'printing_speed': 1234}) != key
+    assert body_key(settings, modal=True) != key
+
+def test_body_options():
+    # the options every caller passes for the same body, whichever way it spells them
+    assert body_options() == body_options(modal=False, fixed_point=False, plan_travel=False, unlifted_travel=0)
+    assert body_options(unlifted_travel=5) == body_options()
+    assert body_options(plan_travel=True, unlifted_travel=5) != body_options(plan_travel=True)
+    assert body_options(spacing=10) == body_options()
+    assert body_options(specimens=[{'min_pitch': 1}], spacing=10) == body_options(specimens=[{'min_pitch': 1.0}], spacing=10.0)
+    assert body_options(specimens=[{'min_pitch': 1}], spacing=10) != body_options(specimens=[{'min_pitch': 1}], spacing=5)
+
+def test_body_key_version(settings:dict, monkeypatch):
+    key = body_key(settings)
+    monkeypatch.setattr(output_cache, 'BODY_FORMAT', output_cache.BODY_FORMAT + 1)
+    assert body_key(settings) != key
+    monkeypatch.undo()
+    monkeypatch.setattr(output_cache, 'package_version', lambda: '0.0.0')
+    assert body_key(settings) != key
+
+def test_directory_created_on_first_put(tmp_path):
+    cache = OutputCache(str(tmp_path/'cache'))
+    assert not os.path.exists(tmp_path/'cache')
+    assert cache.get('a') is None and cache.cache_info().entries == 0
+    cache.clear()
+    assert not os.path.exists(tmp_path/'cache')
+    cache.put('a', 'G1 X1')
+    assert cache.get('a') == 'G1 X1'
+
+def test_put_streams_pieces(tmp_path):
+    cache = OutputCache(str(tmp_path))
+    cache.put('a', iter(['G1 X1\n', 'G1 X2\n']))
+    with cache.open('a') as body:
+        assert body.read() == 'G1 X1\nG1 X2\n'
+    def failing():
+        yield 'G1 X1\n'
+        raise ValueError('invalid')
+    with pytest.raises(ValueError):
+        cache.put('b', failing())
+    assert sorted(os.listdir(tmp_path)) == ['a.gcode']
+
+def test_app_key_matches_pipeline(settings:dict, tmp_path):
+    # the app keys the body on its settings alone, which must find what the pipeline stored
+    cache = OutputCache(str(tmp_path))
+    _generate(settings, cache)
+    assert cache.get(body_key(settings)) is not None
+
+def _hit_peak(settings:dict, path) -> int:
+    cache = OutputCache(str(path/'cache'))
+    generate_gcode(settings, 'G28', 'M84', output=str(path/'first.gcode'), cache=cache)
+    tracemalloc.start()
+    try:
+        generate_gcode(settings, 'G28', 'M84', output=str(path/'second.gcode'), cache=cache)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert cache.cache_info().hits == 1
+    assert (path/'first.gcode').read_text() == (path/'second.gcode').read_text()
+    return peak
+
+def test_cached_body_copied_in_chunks(settings:dict, tmp_path):
+    # ten times the layers, about the same peak: the cached body is copied a write buffer at a time
+    (tmp_path/'small').mkdir()
+    (tmp_path/'large').mkdir()
+    small = _hit_peak(settings | {'number_of_layers': 1000}, tmp_path/'small')
+    assert _hit_peak(settings | {'number_of_layers': 10000}, tmp_path/'large') < 1.5*small
+
+def test_head_change_splices_cached_body(settings:dict, tmp_path):
+    cache = OutputCache(str(tmp_path))
+    gcode = _generate(settings, cache)
+    assert cache.cache_info()[:2] == (0, 1) and cache.cache_info().entries == 1
+    spliced = _generate(settings | {'filename': 'other'}, cache, head='G28 X Y')
+    assert cache.cache_info().hits == 1
+    assert spliced == gcode.replace('G28', 'G28 X Y', 1)
+    assert spliced == _generate(settings, None, head='G28 X Y')
+    _generate(settings | {'printing_speed': 1234}, cache)
+    assert cache.cache_info()[:2] == (1, 2) and cache.cache_info().entries == 2
+
+def test_invalid_jobs_are_not_cached(settings:dict, tmp_path):
+    cache = OutputCache(str(tmp_path))
+    invalid = settings | {'purge_x': -700}
+    with pytest.raises(ValueError):
+        _generate(invalid, cache)
+    _generate(invalid, cache, validate=False)
+    assert cache.cache_info().entries == 0
+
+def test_lru_eviction(tmp_path):
+    cache = OutputCache(str(tmp_path), max_bytes=250)
+    for index, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, key*100)
+        # distinct access times, whatever the resolution of the clock of the file system
+        os.utime(tmp_path/f'{key}.gcode', ns=(index*10**9, index*10**9))
+    assert cache.get('a') is None and cache.get('b') == 'b'*100
+    os.utime(tmp_path/'b.gcode', ns=(5*10**9, 5*10**9))
+    cache.put('d', 'd'*100)
+    assert cache.get('c') is None and cache.get('b') is not None
+    info = cache.cache_info()
+    assert (info.evictions, info.entries, info.bytes) == (2, 2, 200)
+    cache.clear()
+    assert cache.cache_info() == (0, 0, 0, 250, 0, 0)
+
+def test_main_cache(tmp_path, capsys):
+    arguments = ['--settings', 'defaults/settings.ini', '--head', 'defaults/gcode_head.ini', '--tail', 'defaults/gcode_tail.ini', '--cache', str(tmp_path/'cache')]
+    main([*arguments, '-o', str(tmp_path/'first.gcode')])
+    assert 'reused' not in capsys.readouterr().err
+    main([*arguments, '-o', str(tmp_path/'second.gcode')])
+    assert 'reused from the cache' in capsys.readouterr().err
+    assert (tmp_path/'first.gcode').read_text() == (tmp_path/'second.gcode').read_text()
+
+def test_main_layout_cache(settings:dict, tmp_path, capsys, monkeypatch):
+    # a layout stored by the pipeline is reused by the command line for the same specimens
+    monkeypatch.chdir(tmp_path)
+    cache = OutputCache(str(tmp_path/'cache'))
+    specimens = [{'x_width': 40, 'y_width': 30, 'min_pitch': pitch} for pitch in (1, 2)]
+    generate_layout_gcode(settings, specimens, 'G28', 'M84', output=str(tmp_path/'first.gcode'), cache=cache)
+    assert cache.cache_info().entries == 1
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    defaults = os.path.join(root, 'defaults')
+    main(['--settings', os.path.join(defaults, 'settings.ini'), '--head', os.path.join(defaults, 'gcode_head.ini'), '--tail', os.path.join(defaults, 'gcode_tail.ini'),
+          '--cache', str(tmp_path/'cache'), '--specimen', 'x_width=40,y_width=30,min_pitch=1', '--specimen', 'x_width=40,y_width=30,min_pitch=2', '-o', str(tmp_path/'second.gcode')])
+    assert 'reused from the cache' in capsys.readouterr().err
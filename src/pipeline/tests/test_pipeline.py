@@ -0,0 +1,66 @@
+import io
+import tracemalloc
+from src.gcode import GCodeGenerator
+from src.pipeline import build_serpentine, build_sketch, generate_gcode, iter_instructions, job_layers, print_layers, write_layers
+from src.settings import SettingsManager
+import pytest
+
+@pytest.fixture
+def settings() -> dict:
+    return SettingsManager('defaults/settings.ini', 'defaults/gcode_head.ini', 'defaults/gcode_tail.ini').as_dict()
+
+def _layers(settings:dict) -> list:
+    return job_layers(settings, build_sketch(settings, build_serpentine(settings)))
+
+@pytest.mark.parametrize('fixed_point', [False, True])
+def test_iter_instructions_matches_print_layers(settings:dict, fixed_point:bool):
+    settings = settings | {'purge_nozzle': True, 'print_segment': True}
+    layers = _layers(settings)
+    chunks = list(iter_instructions(settings, layers, fixed_point))
+    # the purge, the serpentines and the segment, as one stream
+    assert len(chunks) == 1 + settings['number_of_layers'] + 1
+    instructions = print_layers(settings, layers, fixed_point)
+    assert [instruction for chunk in chunks for instruction in chunk] == list(instructions)
+    generator = GCodeGenerator('test', '', '', modal=True)
+    assert ''.join(generator.iter_body(iter(chunks))) == ''.join(generator.iter_body(instructions))
+
+def test_job_layers_from_sketch(settings:dict):
+    sketch = build_sketch(settings, build_serpentine(settings))
+    layers = job_layers(settings, sketch)
+    assert not sketch.coordinates
+    sketch.gen_coordinates()
+    # generated again on each pass, as the validation and the printing need
+    assert list(layers[-1]) == list(layers[-1]) == sketch.coordinates
+    assert len(layers[-1]) == len(sketch.coordinates)
+
+def test_iter_instructions_without_layers(settings:dict):
+    assert [list(chunk) for chunk in iter_instructions(settings, [[]])] == [list(print_layers(settings, [[]]))]
+
+def _peak(settings:dict) -> int:
+    layers = _layers(settings)
+    tracemalloc.start()
+    try:
+        write_layers(settings, layers, '', '', output=_Sink(), validate=False)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+class _Sink(io.StringIO):
+    def write(self, text:str) -> int:
+        return len(text)
+
+def test_write_layers_memory_bounded(settings:dict):
+    # ten times the layers, about the same peak: one layer and one write buffer are held at a time
+    assert _peak(settings | {'number_of_layers': 1000}) < 1.5*_peak(settings | {'number_of_layers': 100})
+
+def _job_peak(settings:dict) -> int:
+    tracemalloc.start()
+    try:
+        generate_gcode(settings, '', '', output=_Sink(), validate=False)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def test_generate_gcode_memory_bounded(settings:dict):
+    # the layers of the sketch are generated as they are printed, never stored
+    assert _job_peak(settings | {'number_of_layers': 1000}) < 1.5*_job_peak(settings | {'number_of_layers': 100})
@@ -0,0 +1,37 @@
+import csv
+from src.pipeline.sweep import expand_sweep, parse_values, run_sweep
+from src.settings import SettingsManager
+import pytest
+
+@pytest.fixture
+def settings() -> SettingsManager:
+    return SettingsManager('defaults/settings.ini', 'defaults/gcode_head.ini', 'defaults/gcode_tail.ini')
+
+def test_parse_values():
+    assert parse_values('3000,3600') == [3000, 3600]
+    assert parse_values('3000:4200:600') == [3000, 3600, 4200]
+    assert parse_values('0.5:1.5:0.5') == [0.5, 1.0, 1.5]
+    assert parse_values('True,False') == [True, False]
+
+def test_expand_sweep(settings: SettingsManager):
+    combinations = expand_sweep(settings.as_dict(), {'printing_speed': [3000, 3600], 'min_pitch': [1, 2, 3]})
+    assert len(combinations) == 6
+    assert combinations[-1]['printing_speed'] == 3600 and combinations[-1]['min_pitch'] == 3
+    with pytest.raises(ValueError):
+        expand_sweep(settings.as_dict(), {'not_a_setting': [1]})
+
+def test_run_sweep(settings: SettingsManager, tmp_path):
+    manifest = run_sweep(
+        settings.as_dict(),
+        {'printing_speed': [3000, 3600], 'number_of_layers': [1, 2]},
+        settings.gcode_head,
+        settings.gcode_tail,
+        output_dir=str(tmp_path),
+        max_workers=2,
+    )
+    assert len(manifest) == 4
+    with open(tmp_path/'printability_test_manifest.csv') as file:
+        rows = list(csv.DictReader(file))
+    assert [row['file'] for row in rows] == [f'printability_test_00{i}.gcode' for i in range(1, 5)]
+    assert rows[1]['printing_speed'] == '3000' and rows[1]['number_of_layers'] == '2'
+    assert 'F3600' in (tmp_path/'printability_test_003.gcode').read_text()
@@ -0,0 +1,67 @@
+from src.pipeline import (
+    ValidationError,
+    build_serpentine,
+    build_sketch,
+    format_validation,
+    generate_gcode,
+    job_layers,
+    validate_layers,
+)
+from src.settings import SettingsManager
+import pytest
+
+@pytest.fixture
+def settings() -> dict:
+    return SettingsManager('defaults/settings.ini', 'defaults/gcode_head.ini', 'defaults/gcode_tail.ini').as_dict()
+
+def _validate(settings:dict, **kwargs) -> dict:
+    return validate_layers(settings, job_layers(settings, build_sketch(settings, build_serpentine(settings)), **kwargs))
+
+def _layer(z:float, points:list[tuple[float,float]], specimen:int, lift:bool=True) -> dict:
+    trace = [{'x': x, 'y': y, 'filament_diameter': 10} for x, y in points]
+    return {'z': z, 'trace': trace, 'template': None, 'specimen': specimen, 'lift': lift}
+
+def test_defaults_are_valid(settings:dict):
+    report = _validate(settings)
+    assert report == {'valid': True, 'errors': [], 'warnings': []}
+    assert format_validation(report) == 'no problem found'
+    assert _validate(settings, plan_travel=True, unlifted_travel=20)['valid']
+
+@pytest.mark.parametrize('changes', [
+    {'purge_x': -700},
+    {'plate_size': 100},
+    {'plate_shape': 'squared'},
+])
+def test_bounds(settings:dict, changes:dict):
+    report = _validate(settings | changes)
+    assert not report['valid']
+    assert {issue['check'] for issue in report['errors']} == {'bounds'}
+
+def test_overlap(settings:dict):
+    report = _validate(settings | {'purge_x': -10, 'purge_y': 0})
+    assert [(issue['check'], issue['parts']) for issue in report['errors']] == [('overlap', ['purge segment', 'sketch'])]
+    # a layer width apart, the traces touch without overlapping
+    serpentine = build_serpentine(settings)
+    assert _validate(settings | {'purge_x': serpentine.x_pos - settings['layer_width'], 'purge_y': 0})['valid']
+    assert not _validate(settings | {'purge_x': serpentine.x_pos - settings['layer_width']*0.9, 'purge_y': 0})['valid']
+
+def test_travels(settings:dict):
+    settings = settings | {'purge_nozzle': False}
+    printed = _layer(0.5, [(-10, 0), (10, 0)], 1)
+    lifted = validate_layers(settings, [[printed, _layer(0.5, [(-20, 0.2), (-20, 10)], 2)]])
+    assert lifted == {'valid': True, 'errors': [], 'warnings': []}
+    dragging = validate_layers(settings, [[printed, _layer(0.5, [(-20, 0.2), (-20, 10)], 2, lift=False)]])
+    assert dragging['valid']
+    assert [issue['parts'] for issue in dragging['warnings']] == [['specimen 2', 'specimen 1']]
+    higher = _layer(1.0, [(-10, 0), (10, 0)], 1)
+    through = validate_layers(settings, [[higher, _layer(0.5, [(-20, 0.2), (-20, 10)], 2, lift=False)]])
+    assert [issue['check'] for issue in through['errors']] == ['travel']
+
+def test_generate_gcode_refuses_errors(settings:dict, tmp_path):
+    output = tmp_path/'test.gcode'
+    with pytest.raises(ValidationError) as error:
+        generate_gcode(settings | {'purge_x': -700}, '', '', output=str(output))
+    assert not error.value.report['valid']
+    assert not output.exists()
+    generate_gcode(settings | {'purge_x': -700}, '', '', output=str(output), validate=False)
+    assert output.exists()
@@ -0,0 +1,317 @@
+from typing import Any, Iterable
+import numpy as np
+from src.printer.kinematics import trace_arrays
+from src.profiling import profiler
+
+# the tolerance on heights and distances, mm
+TOLERANCE = 1e-6
+
+
+class ValidationError(ValueError):
+
+    def __init__(self, report:dict) -> None:
+        """Error raised when a job is not emitted because its validation found errors.
+
+        Args:
+            report (dict): the validation report, as returned by validate_layers
+        """
+        super().__init__('; '.join(issue['message'] for issue in report['errors']))
+        self.report = report
+
+    def __reduce__(self) -> tuple:
+        # rebuilt from the report, to cross process pools
+        return type(self), (self.report,)
+
+
+@profiler.profiled('validation')
+def validate_layers(
+        settings:dict[str,Any],
+        layers:list[Iterable[dict]],
+        cell_size:float|None=None,
+        ) -> dict:
+    """Checks the layers of a job before it is printed, all the trace points at once:
+
+    - bounds: every trace, widened by half the layer width, must lie on the printing plate (error)
+    - overlap: the traces of two different parts (the purge segment, the sketch, the specimens of a
+      layout) printed at the same height must stay a layer width apart (error). The segments are
+      looked up in a uniform grid, so that only the segments sharing a cell are compared
+    - travel: a travel to the next layer must not cross the traces printed higher than the nozzle
+      (error), nor those printed at its height, which happens when travelling without lifting (warning)
+
+    Args:
+        settings (dict[str,Any]): the settings
+        layers (list[Iterable[dict]]): the coordinates of each part of the job, in printing order, as
+            returned by sketch_layers, layout_layers or plan_sketch_travels
+        cell_size (float | None): the edge of the cells of the grid, mm. Defaults to 4 layer widths
+
+    Returns:
+        dict: whether the job is 'valid' (it has no error), its 'errors' and its 'warnings', each one a
+            dict with the 'check' that failed, the 'parts' involved and a 'message'
+    """
+    report = {'valid': True, 'errors': [], 'warnings': []}
+    flat = _flatten(settings, layers)
+    if not flat['labels']:
+        return report
+    width = settings['layer_width']
+    _check_bounds(settings, flat, report)
+    _check_overlaps(flat, width, cell_size or 4*width, report)
+    _check_travels(settings, flat, width, report)
+    report['valid'] = not report['errors']
+    return report
+
+
+def format_validation(report:dict) -> str:
+    """Formats a validation report.
+
+    Args:
+        report (dict): the result of validate_layers
+
+    Returns:
+        str: the errors and the warnings, one per line
+    """
+    lines = [f"error: {issue['message']}" for issue in report['errors']]
+    lines += [f"warning: {issue['message']}" for issue in report['warnings']]
+    return '\n'.join(lines) if lines else 'no problem found'
+
+
+def _flatten(
+        settings:dict[str,Any],
+        layers:list[Iterable[dict]],
+        ) -> dict:
+    """Gathers the layers in printing order and the segments of their traces into arrays.
+    The traces shared by several layers are converted once."""
+    labels = []
+    layer_labels = []
+    heights = []
+    starts = []
+    ends = []
+    lifts = []
+    trace_keys = []
+    points = {}
+    segments = []
+    for part, coordinates in enumerate(layers):
+        for layer in coordinates:
+            if not layer['trace']:
+                continue
+            if part == 0 and settings['purge_nozzle'] is True:
+                label = 'purge segment'
+            elif 'specimen' in layer:
+                label = f"specimen {layer['specimen']}"
+            else:
+                label = 'sketch'
+            if label not in labels:
+                labels.append(label)
+            index = len(heights)
+            layer_labels.append(labels.index(label))
+            heights.append(layer['z'])
+            starts.append((layer['trace'][0]['x'], layer['trace'][0]['y']))
+            ends.append((layer['trace'][-1]['x'], layer['trace'][-1]['y']))
+            lifts.append(layer.get('lift', True))
+            key = id(layer['trace'])
+            trace_keys.append(key)
+            if key not in points:
+                x, y, _ = trace_arrays(layer['trace'])
+                points[key] = x, y, labels.index(label)
+            x, y, _ = points[key]
+            segments.append((x, y, index))
+    if not segments:
+        return {'labels': labels}
+    count = np.array([len(x) - 1 for x, _, _ in segments], dtype=np.int64)
+    layer_of_segment = np.repeat(np.array([index for _, _, index in segments], dtype=np.int64), count)
+    return {
+        'labels': labels,
+        'layer_labels': np.array(layer_labels, dtype=np.int64),
+        'heights': np.array(heights, dtype=float),
+        'starts': np.array(starts, dtype=float).reshape(-1, 2),
+        'ends': np.array(ends, dtype=float).reshape(-1, 2),
+        'lifts': np.array(lifts, dtype=bool),
+        'trace_keys': trace_keys,
+        'points': list(points.values()),
+        'segment_starts': np.concatenate([np.stack([x[:-1], y[:-1]], axis=1) for x, y, _ in segments]),
+        'segment_ends': np.concatenate([np.stack([x[1:], y[1:]], axis=1) for x, y, _ in segments]),
+        'segment_layers': layer_of_segment,
+    }
+
+
+def _check_bounds(
+        settings:dict[str,Any],
+        flat:dict,
+        report:dict,
+        ) -> None:
+    """Reports the parts whose traces leave the plate"""
+    x = np.concatenate([x for x, _, _ in flat['points']])
+    y = np.concatenate([y for _, y, _ in flat['points']])
+    label = np.concatenate([np.full(len(x), label, dtype=np.int64) for x, _, label in flat['points']])
+    margin = settings['layer_width']/2
+    size = settings['plate_size']
+    if settings['plate_shape'] == 'rounded':
+        excess = np.hypot(x, y) + margin - size/2
+    else:
+        excess = np.max(np.stack([margin - x, margin - y, x + margin - size, y + margin - size]), axis=0)
+    outside = excess > TOLERANCE
+    counts = np.bincount(label[outside], minlength=len(flat['labels']))
+    for index in np.flatnonzero(counts).tolist():
+        mask = outside & (label == index)
+        worst = np.argmax(np.where(mask, excess, -np.inf))
+        _add(report, 'errors', 'bounds', [flat['labels'][index]], (
+            f"{counts[index]} points of the {flat['labels'][index]} lie off the {size:g} mm {settings['plate_shape']} plate, "
+            f"up to {excess[worst]:.2f} mm out (X{x[worst]:g} Y{y[worst]:g})"
+        ))
+
+
+def _check_overlaps(
+        flat:dict,
+        width:float,
+        cell_size:float,
+        report:dict,
+        ) -> None:
+    """Reports the parts whose traces overlap at the same height, comparing the segments of different
+    parts sharing a grid cell. Only the heights where several parts are printed are looked at, and the
+    heights printing the same traces are looked at once."""
+    heights, level_of_layer = np.unique(flat['heights'], return_inverse=True)
+    signatures = [set() for _ in heights]
+    level_labels = [set() for _ in heights]
+    for layer, level in enumerate(level_of_layer.tolist()):
+        signatures[level].add(flat['trace_keys'][layer])
+        level_labels[level].add(int(flat['layer_labels'][layer]))
+    representatives = {}
+    representative_of_level = np.full(len(heights), -1, dtype=np.int64)
+    for level, signature in enumerate(signatures):
+        if len(level_labels[level]) > 1:
+            representative_of_level[level] = representatives.setdefault(frozenset(signature), level)
+    checked = np.flatnonzero(representative_of_level[level_of_layer[flat['segment_layers']]] == level_of_layer[flat['segment_layers']])
+    if checked.size < 2:
+        return
+    starts = flat['segment_starts'][checked]
+    ends = flat['segment_ends'][checked]
+    layers = flat['segment_layers'][checked]
+    labels = flat['layer_labels'][layers]
+    low = np.floor((np.minimum(starts, ends) - width/2)/cell_size).astype(np.int64)
+    high = np.floor((np.maximum(starts, ends) + width/2)/cell_size).astype(np.int64)
+    spans = high - low + 1
+    cells_per_segment = spans[:, 0]*spans[:, 1]
+    segment = np.repeat(np.arange(len(layers)), cells_per_segment)
+    offset = np.arange(len(segment)) - np.repeat(np.cumsum(cells_per_segment) - cells_per_segment, cells_per_segment)
+    cell_x = low[segment, 0] + offset//spans[segment, 1] - low[:, 0].min()
+    cell_y = low[segment, 1] + offset % spans[segment, 1] - low[:, 1].min()
+    cells = (level_of_layer[layers[segment]]*(cell_x.max() + 1) + cell_x)*(cell_y.max() + 1) + cell_y
+    keys = cells*len(flat['labels']) + labels[segment]
+    order = np.argsort(keys)
+    keys = keys[order]
+    cells = cells[order]
+    segment = segment[order]
+    # every entry is paired with the entries of its cell belonging to the next parts
+    followers_start = np.searchsorted(keys, keys, side='right')
+    followers = np.searchsorted(cells, cells, side='right') - followers_start
+    first = np.repeat(np.arange(len(keys)), followers)
+    second = np.repeat(followers_start, followers) + np.arange(len(first)) - np.repeat(np.cumsum(followers) - followers, followers)
+    pairs = np.unique(segment[first]*len(layers) + segment[second])
+    first, second = pairs//len(layers), pairs % len(layers)
+    overlapping = _segment_distances(starts[first], ends[first], starts[second], ends[second]) < width - TOLERANCE
+    first_labels = labels[first[overlapping]]
+    second_labels = labels[second[overlapping]]
+    levels = level_of_layer[layers[first[overlapping]]]
+    label_pairs = np.unique(np.stack([np.minimum(first_labels, second_labels), np.maximum(first_labels, second_labels)], axis=1), axis=0)
+    for one, other in label_pairs.tolist():
+        mask = (np.minimum(first_labels, second_labels) == one) & (np.maximum(first_labels, second_labels) == other)
+        overlap_heights = heights[np.isin(representative_of_level, np.unique(levels[mask]))]
+        parts = [flat['labels'][one], flat['labels'][other]]
+        _add(report, 'errors', 'overlap', parts, (
+            f'the {parts[0]} and the {parts[1]} overlap at {len(overlap_heights)} '
+            f"height{'s' if len(overlap_heights) > 1 else ''} from z={overlap_heights[0]:g}"
+        ))
+
+
+def _check_travels(
+        settings:dict[str,Any],
+        flat:dict,
+        width:float,
+        report:dict,
+        ) -> None:
+    """Reports the travels crossing traces printed as high as the nozzle or higher"""
+    heights = flat['heights']
+    previous_heights = np.concatenate(([settings['z_home']], heights[:-1]))
+    travel_heights = np.where(flat['lifts'], previous_heights + settings['lift_distance'], heights)
+    travel_starts = np.concatenate(([[settings['x_home'], settings['y_home']]], flat['ends'][:-1]))
+    printed_before = np.maximum.accumulate(np.concatenate(([-np.inf], heights[:-1])))
+    layers = flat['segment_layers']
+    # the segments of each layer are contiguous
+    segment_offsets = np.searchsorted(layers, np.arange(len(heights) + 1))
+    lows = np.minimum(flat['segment_starts'], flat['segment_ends'])
+    highs = np.maximum(flat['segment_starts'], flat['segment_ends'])
+    issues = {}
+    # only the travels no higher than what is already printed can hit it
+    for index in np.flatnonzero(travel_heights <= printed_before + TOLERANCE).tolist():
+        start, end = travel_starts[index], flat['starts'][index]
+        # the nozzle leaves a trace and reaches the next one: the width around both ends does not count
+        length = np.hypot(*(end - start))
+        if length <= 2*width:
+            continue
+        start, end = start + (end - start)*width/length, end - (end - start)*width/length
+        crossed_layers = np.flatnonzero(heights[:index] >= travel_heights[index] - TOLERANCE)
+        candidates = np.concatenate([np.arange(segment_offsets[layer], segment_offsets[layer + 1]) for layer in crossed_layers])
+        candidates = candidates[
+            np.all(highs[candidates] >= np.minimum(start, end) - width, axis=1)
+            & np.all(lows[candidates] <= np.maximum(start, end) + width, axis=1)
+        ]
+        distances = _segment_distances(
+            np.broadcast_to(start, (len(candidates), 2)),
+            np.broadcast_to(end, (len(candidates), 2)),
+            flat['segment_starts'][candidates],
+            flat['segment_ends'][candidates],
+        )
+        hit = layers[candidates[distances < width - TOLERANCE]]
+        for crossed in np.unique(flat['layer_labels'][hit]).tolist():
+            through = (heights[hit[flat['layer_labels'][hit] == crossed]] > travel_heights[index] + TOLERANCE).any()
+            key = ('errors' if through else 'warnings', int(flat['layer_labels'][index]), crossed, bool(flat['lifts'][index]))
+            issues.setdefault(key, []).append(heights[index])
+    for (level, target, crossed, lift), from_heights in issues.items():
+        parts = [flat['labels'][target], flat['labels'][crossed]]
+        many = len(from_heights) > 1
+        how = ('go through' if many else 'goes through') if level == 'errors' else ('drag over' if many else 'drags over')
+        count = f'{len(from_heights)} travels' if many else 'the travel'
+        _add(report, level, 'travel', parts, (
+            f"{count} to the {parts[0]} from z={from_heights[0]:g} {how} the printed {parts[1]}"
+            + ('' if lift else ', without lifting')
+        ))
+
+
+def _segment_distances(
+        a_start:np.ndarray,
+        a_end:np.ndarray,
+        b_start:np.ndarray,
+        b_end:np.ndarray,
+        ) -> np.ndarray:
+    """Returns the distance between each pair of segments, zero where they cross"""
+    def point_distances(points, starts, ends):
+        direction = ends - starts
+        squared = np.einsum('ij,ij->i', direction, direction)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(np.einsum('ij,ij->i', points - starts, direction)/squared, 0, 1)
+        t = np.where(squared > 0, t, 0)
+        return np.hypot(*(starts + t[:, None]*direction - points).T)
+
+    def orientation(p, q, r):
+        return np.sign((q[:, 0] - p[:, 0])*(r[:, 1] - p[:, 1]) - (q[:, 1] - p[:, 1])*(r[:, 0] - p[:, 0]))
+
+    distances = np.minimum.reduce([
+        point_distances(a_start, b_start, b_end),
+        point_distances(a_end, b_start, b_end),
+        point_distances(b_start, a_start, a_end),
+        point_distances(b_end, a_start, a_end),
+    ])
+    crossing = (
+        (orientation(a_start, a_end, b_start)*orientation(a_start, a_end, b_end) < 0)
+        & (orientation(b_start, b_end, a_start)*orientation(b_start, b_end, a_end) < 0)
+    )
+    return np.where(crossing, 0.0, distances)
+
+
+def _add(
+        report:dict,
+        level:str,
+        check:str,
+        parts:list[str],
+        message:str,
+        ) -> None:
+    report[level].append({'check': check, 'parts': parts, 'message': message})
@@ -1,18 +1,25 @@
-from matplotlib import pyplot as plt
+from functools import lru_cache
 from math import pi, sin, cos
+import numpy as np
 
+FIGURE_SIZE = 8
+DPI = 100
+# polylines with more vertices than this are decimated to the resolution of the figure
+DECIMATION_THRESHOLD = 2000
+
+@lru_cache(maxsize=16)
 def gen_plate_shape(
         plate_shape:str,
         plate_size:int
-        ) -> tuple[list,list]:
-    """generates the coordinates of the printing plate perimeter
+        ) -> tuple[tuple,tuple]:
+    """generates the coordinates of the printing plate perimeter. The result is cached for each shape and size
 
     Args:
         plate_shape (str): the shape of the printing plate (squared/rounded)
         plate_size (int): the size of the printing plate (edge if squared, diameter if rounded)
 
     Returns:
-        tuple[list,list]: the list of x and y coordinates of the printing plate perimeter
+        tuple[tuple,tuple]: the x and y coordinates of the printing plate perimeter
     """
     match plate_shape:
         case 'squared':
@@ -25,7 +32,7 @@ def gen_plate_shape(
         case _:
             x_coords = []
             y_coords = []
-    return x_coords,y_coords
+    return tuple(x_coords),tuple(y_coords)
 
 def gen_serpentine_area(
         info:list[float]
@@ -43,30 +50,116 @@ def gen_serpentine_area(
     y_coords = [y+i for i in [0,y_width,y_width,0,0]]
     return x_coords,y_coords
 
+def decimate(
+        x_coords:list[float],
+        y_coords:list[float],
+        pixel_size:float,
+        threshold:int=DECIMATION_THRESHOLD,
+        ) -> tuple[list,list]:
+    """reduces a polyline to what can be seen at the given resolution.
+    The consecutive vertices falling in the same pixel column are replaced by the first, lowest, highest and last of them,
+    which draws the same picture as long as the polyline moves along x (as the serpentine does)
+
+    Args:
+        x_coords (list[float]): the x coordinates of the polyline
+        y_coords (list[float]): the y coordinates of the polyline
+        pixel_size (float): the width of a pixel, in plot units
+        threshold (int): the polylines with fewer vertices are returned unchanged
+
+    Returns:
+        tuple[list,list]: the x and y coordinates of the decimated polyline
+    """
+    if len(x_coords) <= threshold or pixel_size <= 0:
+        return x_coords,y_coords
+    x = np.asarray(x_coords, dtype=float)
+    y = np.asarray(y_coords, dtype=float)
+    columns = np.floor((x - x.min())/pixel_size)
+    starts = np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+    ends = np.r_[starts[1:], len(x)] - 1
+    runs = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(x)]))
+    order = np.lexsort((y, runs))
+    lowest = order[starts]
+    highest = order[ends]
+    keep = np.unique(np.concatenate((starts, lowest, highest, ends)))
+    return x[keep],y[keep]
+
+class PlotRenderer:
+
+    def __init__(self) -> None:
+        """draws the top view of the sketch on a single figure, which is reused by every render call:
+        the line data are updated in place instead of building a new figure each time
+        """
+        self.figure = None
+        self.axes = None
+        self.lines = {}
+
+    def _create_figure(self) -> None:
+        # imported here so that the modules not plotting anything do not pay for loading matplotlib
+        from matplotlib.figure import Figure
+
+        # a bare Figure is not tracked by pyplot, so it is not kept alive once it is dropped
+        self.figure = Figure(figsize=(FIGURE_SIZE,FIGURE_SIZE), dpi=DPI)
+        self.axes = self.figure.subplots(nrows=1,ncols=1)
+        self.lines['x_axis'] = self.axes.axvline(0,c='g',lw=0.75)
+        self.lines['y_axis'] = self.axes.axhline(0,c='r',lw=0.75)
+        self.lines['plate'], = self.axes.plot([],[],ls='-.',c='xkcd:medium blue')
+        self.lines['serpentine_area'], = self.axes.plot([],[],ls='--',c='xkcd:light grey')
+        self.lines['serpentine'], = self.axes.plot([],[],c='xkcd:purple',ls='-')
+        self.lines['segment'], = self.axes.plot([],[],c='xkcd:purple',ls='-')
+        self.lines['purge_segment'], = self.axes.plot([],[],c='xkcd:black',ls='-',lw=4)
+        self.lines['nozzle_home'], = self.axes.plot([],[],'+', mec='xkcd:leaf green',ms='20',mew=2)
+        self.axes.set_xlabel('x',color='r')
+        self.axes.set_ylabel('y',color='g')
+
+    def render(
+        self,
+        plate:list[list[float]],
+        nozzle_home:list[float],
+        serpentine_area:list[float],
+        serpentine:list[list[float]],
+        segment:list[list[float]]|None=None,
+        purge_segment:list[list[float]]|None=None,
+        ):
+        """draws the plate, the nozzle home, the serpentine area, the serpentine and the optional segments
+
+        Args:
+            plate (list[list[float]]): the x and y coordinates of the plate perimeter
+            nozzle_home (list[float]): the x and y coordinates of the nozzle home
+            serpentine_area (list[float]): the x,y starting coordinates and x maximum width, y width of the serpentine
+            serpentine (list[list[float]]): the x and y coordinates of the serpentine
+            segment (list[list[float]] | None): the x and y coordinates of the suspended segment, if printed
+            purge_segment (list[list[float]] | None): the x and y coordinates of the purge segment, if printed
+
+        Returns:
+            the figure and its axes
+        """
+        if self.figure is None:
+            self._create_figure()
+        ax_min=min(plate[0])-25
+        ax_max=max(plate[0])+25
+        pixel_size = (ax_max-ax_min)/(FIGURE_SIZE*DPI)
+        self.lines['x_axis'].set_xdata([(ax_max+ax_min)/2]*2)
+        self.lines['y_axis'].set_ydata([(ax_max+ax_min)/2]*2)
+        self.lines['plate'].set_data(plate[0],plate[1])
+        self.lines['serpentine_area'].set_data(*gen_serpentine_area(serpentine_area))
+        self.lines['serpentine'].set_data(*decimate(serpentine[0],serpentine[1],pixel_size))
+        for name,coords in [('segment',segment),('purge_segment',purge_segment)]:
+            visible = coords is not None and len(coords) > 0
+            self.lines[name].set_visible(visible)
+            if visible:
+                self.lines[name].set_data(*decimate(coords[0],coords[1],pixel_size))
+        self.lines['nozzle_home'].set_data([nozzle_home[0]],[nozzle_home[1]])
+        self.axes.set_xlim(ax_min,ax_max)
+        self.axes.set_ylim(ax_min,ax_max)
+        return self.figure, self.axes
+
 def plot_data(
     plate:list[list[float]],
     nozzle_home:list[float],
     serpentine_area:list[float],
     serpentine:list[list[float]],
-    segment:list[list[float]]=[],
-    purge_segment:list[list[float]]=[],
+    segment:list[list[float]]|None=None,
+    purge_segment:list[list[float]]|None=None,
     ):
-    
-    ax_min=min(plate[0])-25
-    ax_max=max(plate[0])+25
-    figure, axes = plt.subplots(nrows=1,ncols=1, figsize=(8,8))  
-    axes.axvline((ax_max+ax_min)/2,c='g',lw=0.75)
-    axes.axhline((ax_max+ax_min)/2,c='r',lw=0.75)
-    axes.plot(plate[0],plate[1],ls='-.',c='xkcd:medium blue')
-    axes.plot(*gen_serpentine_area(serpentine_area),ls='--',c='xkcd:light grey')
-    axes.plot(serpentine[0],serpentine[1],c='xkcd:purple',ls='-')
-    if len(segment) > 0:
-        axes.plot(segment[0],segment[1],c='xkcd:purple',ls='-')
-    if len(purge_segment) > 0:
-        axes.plot(purge_segment[0],purge_segment[1],c='xkcd:black',ls='-',lw=4)
-    axes.plot(nozzle_home[0],nozzle_home[1],'+', mec='xkcd:leaf green',ms='20',mew=2)
-    axes.set_xlabel('x',color='r')
-    axes.set_ylabel('y',color='g')
-    axes.set_xlim(ax_min,ax_max)
-    axes.set_ylim(ax_min,ax_max)
-    return figure, axes
\ No newline at end of file
+    """draws the sketch on a new figure. Use a PlotRenderer to redraw the same figure repeatedly"""
+    return PlotRenderer().render(plate,nozzle_home,serpentine_area,serpentine,segment,purge_segment)
\ No newline at end of file
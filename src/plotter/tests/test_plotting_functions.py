@@ -0,0 +1,28 @@
+from src.plotter.plotting_functions import decimate, gen_plate_shape
+from src.shapes import Serpentine
+
+def test_gen_plate_shape_is_cached():
+    assert gen_plate_shape('rounded', 200) is gen_plate_shape('rounded', 200)
+    assert gen_plate_shape('squared', 200) == ((0,0,200,200,0), (0,200,200,0,0))
+
+def test_decimate_keeps_short_polylines():
+    x, y = [0, 1, 2], [0, 1, 0]
+    assert decimate(x, y, 0.5) == (x, y)
+
+def test_decimate_keeps_the_envelope():
+    serpentine = Serpentine(
+        x_pos=-50,
+        y_pos=-50,
+        x_width=100,
+        y_width=100,
+        constant_pitch=True,
+        min_pitch=0.01,
+        first_inlet_diameter=10,
+        last_inlet_diameter=20,
+    )
+    x, y = decimate(serpentine.x_coords, serpentine.y_coords, 0.25)
+    assert len(x) <= 4*(100/0.25 + 1)
+    assert (x[0], y[0]) == (serpentine.x_coords[0], serpentine.y_coords[0])
+    assert (x[-1], y[-1]) == (serpentine.x_coords[-1], serpentine.y_coords[-1])
+    assert min(y) == -50 and max(y) == 50
+    assert list(x) == sorted(x)
@@ -1,3 +1,6 @@
+from .instruction_buffer import InstructionBuffer
+from .fixed_point_nozzle import FixedPointNozzle
 from .printer import Nozzle,Printer
+from .travel_planner import plan_travels, reverse_trace, travel_summary
 
-__all__ = ['Nozzle','Printer']
\ No newline at end of file
+__all__ = ['FixedPointNozzle','InstructionBuffer','Nozzle','Printer','plan_travels','reverse_trace','travel_summary']
@@ -0,0 +1,323 @@
+from math import isqrt, pi
+import numpy as np
+from .instruction_buffer import InstructionBuffer
+from .nozzle import Nozzle
+
+# integer units per millimetre of position (micrometres)
+POSITION_SCALE = 1000
+# integer units per unit of extruded volume
+VOLUME_SCALE = 10**6
+# the extruded volume is emitted with 3 decimals
+EMITTED_VOLUME_STEP = VOLUME_SCALE//1000
+# fractional bits of the fixed-point volume per length factors
+FRACTION_BITS = 32
+
+
+class FixedPointNozzle(Nozzle):
+
+    def __init__(
+            self,
+            x_home:float,
+            y_home:float,
+            z_home:float,
+            layer_width:float,
+            layer_height:float,
+            retraction:float,
+            lift_distance:float,
+            moving_speed:float,
+            printing_speed:float,
+            ) -> None:
+        """Nozzle doing its bookkeeping in integers: the positions are kept in micrometres and the
+        extruded volume in millionths. Coordinates are converted once when they enter the nozzle and
+        values are rounded only when an instruction is emitted, so the hot loop is pure integer
+        arithmetic and the extruded volume cannot drift: the total is the exact sum of the integer
+        segment volumes, identical on every platform.
+
+        Each segment length is the nearest integer square root of the squared length in nanometres,
+        and its volume is the length times a per filament diameter factor stored with FRACTION_BITS
+        fractional bits, rounded to the nearest unit.
+
+        Args:
+            x_home (float): the home position of the nozzle along the x axis
+            y_home (float): the home position of the nozzle along the y axis
+            z_home (float): the home position of the nozzle along the z axis
+            layer_width (float): the width of the trace to be printed
+            layer_height (float): the height of the trace to be printed
+            retraction (float): the filament retraction after printing a trace
+            lift_distance (float): the distance to lift when moving without printing
+            moving_speed (float): the speed the nozzle moves when not printing
+            printing_speed (float): the speed the nozzle moves when printing
+        """
+        super().__init__(
+            x_home=x_home,
+            y_home=y_home,
+            z_home=z_home,
+            layer_width=layer_width,
+            layer_height=layer_height,
+            retraction=retraction,
+            lift_distance=lift_distance,
+            moving_speed=moving_speed,
+            printing_speed=printing_speed,
+        )
+        self._x = _to_micrometres(x_home)
+        self._y = _to_micrometres(y_home)
+        self._z = _to_micrometres(z_home)
+        self._lift = _to_micrometres(lift_distance)
+        self._retraction = round(retraction*VOLUME_SCALE)
+        self._volume = 0
+        self._factors = {}
+
+    @property
+    def current_x(self):
+        return self._x/POSITION_SCALE
+
+    @property
+    def current_y(self):
+        return self._y/POSITION_SCALE
+
+    @property
+    def current_z(self):
+        return self._z/POSITION_SCALE
+
+    @property
+    def extruded_volume(self):
+        return _emitted_volume(self._volume)
+
+    @property
+    def extruded_units(self) -> int:
+        """Returns the exact extruded volume, in millionths
+
+        Returns:
+            int: the extruded volume
+        """
+        return self._volume
+
+    def volume_factor(
+            self,
+            filament_diameter:float
+            ) -> int:
+        """Returns the volume to extrude per nanometre of trace, in millionths, with FRACTION_BITS fractional bits.
+
+        Args:
+            filament_diameter (float): the inlet filament diameter
+
+        Returns:
+            int: the fixed-point factor
+        """
+        factor = self._factors.get(filament_diameter)
+        if factor is None:
+            inlet_area = pi*filament_diameter**2/4
+            factor = round(self.layer_width*self.layer_height/inlet_area*(1 << FRACTION_BITS))
+            self._factors[filament_diameter] = factor
+        return factor
+
+    def length_to_extrude(
+            self,
+            x:float,
+            y:float
+            ) -> float:
+        """Calculates the length of the segment to be extruded.
+
+        Args:
+            x (float): x coordinate of the new position of the nozzle
+            y (float): y coordinate of the new position of the nozzle
+
+        Returns:
+            float: the lenght of the segment to extrude
+        """
+        return _length_nm(_to_micrometres(x) - self._x, _to_micrometres(y) - self._y)/(POSITION_SCALE*1000)
+
+    def move_to(
+            self,
+            x:float,
+            y:float,
+            z:float
+            ) -> None:
+        """Move the nozzle to the specified coordinates
+
+        Args:
+            x (float): x coordinate
+            y (float): y coordinate
+            z (float): z coordinate
+        """
+        self._volume += self._retraction
+        self.positions.append(InstructionBuffer.LIFT, z=(self._z + self._lift)/POSITION_SCALE, e=self.extruded_volume, f=self.moving_speed)
+        self._x = _to_micrometres(x)
+        self._y = _to_micrometres(y)
+        self._z = _to_micrometres(z)
+        self.positions.append(InstructionBuffer.TRAVEL, x=self.current_x, y=self.current_y, f=self.moving_speed)
+        self.positions.append(InstructionBuffer.LOWER, z=self.current_z, f=self.moving_speed)
+
+    def step_to(
+            self,
+            x:float,
+            y:float,
+            z:float
+            ) -> None:
+        """Move the nozzle to the specified coordinates without retracting and lifting
+
+        Args:
+            x (float): x coordinate
+            y (float): y coordinate
+            z (float): z coordinate
+        """
+        x = _to_micrometres(x)
+        y = _to_micrometres(y)
+        self._z = _to_micrometres(z)
+        self.positions.append(InstructionBuffer.LIFT, z=self.current_z, f=self.moving_speed)
+        if (x, y) != (self._x, self._y):
+            self._x = x
+            self._y = y
+            self.positions.append(InstructionBuffer.TRAVEL, x=self.current_x, y=self.current_y, f=self.moving_speed)
+
+    def print(
+            self,
+            point:dict[str,float]
+            ) -> None:
+        """Generate the instruction to print a segment
+
+        Args:
+            point (dict[str,float]): the end coordinates and filament diameter of the segment to be printed
+        """
+        x = _to_micrometres(point['x'])
+        y = _to_micrometres(point['y'])
+        length = _length_nm(x - self._x, y - self._y)
+        self._volume += _scale(length, self.volume_factor(point['filament_diameter']))
+        self._x = x
+        self._y = y
+        self.positions.append(
+            InstructionBuffer.PRINT,
+            x=self.current_x,
+            y=self.current_y,
+            e=self.extruded_volume,
+            f=self.printing_speed,
+        )
+
+    def trace_volumes(
+            self,
+            x:np.ndarray,
+            y:np.ndarray,
+            filament_diameters:np.ndarray,
+            ) -> np.ndarray:
+        """Calculates the volume of each segment of a trace starting from the current position.
+
+        Args:
+            x (np.ndarray): x coordinates of the end of each segment
+            y (np.ndarray): y coordinates of the end of each segment
+            filament_diameters (np.ndarray): inlet filament diameter of each segment
+
+        Returns:
+            np.ndarray: the integer volume of each segment, in millionths
+        """
+        x = _to_micrometres_array(x)
+        y = _to_micrometres_array(y)
+        lengths = _lengths_nm(
+            np.diff(x, prepend=np.int64(self._x)),
+            np.diff(y, prepend=np.int64(self._y)),
+        )
+        factors = np.fromiter(
+            (self.volume_factor(diameter) for diameter in np.asarray(filament_diameters).tolist()),
+            dtype=np.int64,
+            count=len(lengths),
+        )
+        if len(lengths) and int(lengths.max())*int(factors.max()) >= 1 << 62:
+            # the products would overflow 64 bits: fall back to Python integers
+            return np.array([_scale(length, factor) for length, factor in zip(lengths.tolist(), factors.tolist())], dtype=np.int64)
+        return (lengths*factors + (1 << (FRACTION_BITS - 1))) >> FRACTION_BITS
+
+    def print_volumes(
+            self,
+            x:np.ndarray,
+            y:np.ndarray,
+            volumes:np.ndarray,
+            ) -> None:
+        """Generate the instructions to print a trace whose integer segment volumes are already known.
+
+        Args:
+            x (np.ndarray): x coordinates of the end of each segment
+            y (np.ndarray): y coordinates of the end of each segment
+            volumes (np.ndarray): the integer volume of each segment, in millionths
+        """
+        if len(x) == 0:
+            return
+        x = _to_micrometres_array(x)
+        y = _to_micrometres_array(y)
+        extruded_volumes = self._volume + np.cumsum(volumes, dtype=np.int64)
+        self.positions.extend(
+            InstructionBuffer.PRINT,
+            x=x/POSITION_SCALE,
+            y=y/POSITION_SCALE,
+            e=_emitted_volume(extruded_volumes),
+            f=self.printing_speed,
+        )
+        self._volume = int(extruded_volumes[-1])
+        self._x = int(x[-1])
+        self._y = int(y[-1])
+
+    def extrude(
+            self,
+            amount:float
+            ) -> None:
+        """Increase the current total extruded volume
+
+        Args:
+            amount (float): the amount of material extruded
+        """
+        self._volume += round(amount*VOLUME_SCALE)
+
+    def volume_to_extrude(
+            self,
+            point:dict
+            ) -> float:
+        """Calculates the volume of the segment to print.
+
+        Args:
+            point (dict): the end coordinates and filament diameter of the segment to be printed
+
+        Returns:
+            float: the volume of the segment to print
+        """
+        length = _length_nm(_to_micrometres(point['x']) - self._x, _to_micrometres(point['y']) - self._y)
+        return _scale(length, self.volume_factor(point['filament_diameter']))/VOLUME_SCALE
+
+
+def _to_micrometres(value:float) -> int:
+    return round(value*POSITION_SCALE)
+
+
+def _to_micrometres_array(values:np.ndarray) -> np.ndarray:
+    return np.rint(np.asarray(values, dtype=float)*POSITION_SCALE).astype(np.int64)
+
+
+def _length_nm(
+        dx:int,
+        dy:int
+        ) -> int:
+    """Returns the length of a shift given in micrometres, in nanometres rounded to the nearest integer"""
+    squared = (dx*dx + dy*dy)*1000*1000
+    root = isqrt(squared)
+    return root + (squared - root*root > root)
+
+
+def _lengths_nm(
+        dx:np.ndarray,
+        dy:np.ndarray
+        ) -> np.ndarray:
+    """Vectorized _length_nm: the float square root is corrected to the exact integer one"""
+    squared = (dx*dx + dy*dy)*1000*1000
+    root = np.sqrt(squared.astype(float)).astype(np.int64)
+    root -= root*root > squared
+    root += (root + 1)*(root + 1) <= squared
+    return root + (squared - root*root > root)
+
+
+def _scale(
+        length:int,
+        factor:int
+        ) -> int:
+    return (length*factor + (1 << (FRACTION_BITS - 1))) >> FRACTION_BITS
+
+
+def _emitted_volume(volume:int|np.ndarray) -> float|np.ndarray:
+    """Rounds an integer volume to the emitted 3 decimals, half up"""
+    return (volume + EMITTED_VOLUME_STEP//2)//EMITTED_VOLUME_STEP/(VOLUME_SCALE//EMITTED_VOLUME_STEP)
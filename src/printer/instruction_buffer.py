@@ -0,0 +1,200 @@
+from array import array
+from typing import Iterable, Iterator
+
+
+class InstructionBuffer:
+
+    WORDS = ('X', 'Y', 'Z', 'E', 'F')
+    BITS = {'X': 1, 'Y': 2, 'Z': 4, 'E': 8, 'F': 16}
+    HOME = 0
+    LIFT = 1
+    TRAVEL = 2
+    LOWER = 3
+    PRINT = 4
+    SET_POSITION = 5
+
+    def __init__(self) -> None:
+        """Class representing a compact, columnar set of printer instructions.
+        Each instruction is a row spread over typed arrays: one column per word (X, Y, Z, E, F),
+        a presence bitmask telling which words the instruction carries, and a move kind code
+        (HOME, LIFT, TRAVEL, LOWER, PRINT, and SET_POSITION for the G92 lines of a parsed file).
+        The words an instruction does not carry are stored as 0.
+
+        Iterating the buffer yields one dictionary per instruction, built on demand, so that it can be
+        used wherever the former list of dictionaries was expected.
+        """
+        self.x = array('d')
+        self.y = array('d')
+        self.z = array('d')
+        self.e = array('d')
+        self.f = array('d')
+        self.mask = array('B')
+        self.kind = array('B')
+
+    @property
+    def columns(self) -> dict[str,array]:
+        """Returns the value columns, indexed by word
+
+        Returns:
+            dict[str,array]: the X, Y, Z, E, F columns
+        """
+        return {'X': self.x, 'Y': self.y, 'Z': self.z, 'E': self.e, 'F': self.f}
+
+    def append(
+            self,
+            kind:int,
+            x:float|None=None,
+            y:float|None=None,
+            z:float|None=None,
+            e:float|None=None,
+            f:float|None=None,
+            ) -> None:
+        """Appends an instruction.
+
+        Args:
+            kind (int): the move kind code
+            x (float | None): the x coordinate, if the instruction carries it
+            y (float | None): the y coordinate, if the instruction carries it
+            z (float | None): the z coordinate, if the instruction carries it
+            e (float | None): the extruder position, if the instruction carries it
+            f (float | None): the feedrate, if the instruction carries it
+        """
+        mask = 0
+        if x is None:
+            x = 0.0
+        else:
+            mask |= 1
+        if y is None:
+            y = 0.0
+        else:
+            mask |= 2
+        if z is None:
+            z = 0.0
+        else:
+            mask |= 4
+        if e is None:
+            e = 0.0
+        else:
+            mask |= 8
+        if f is None:
+            f = 0.0
+        else:
+            mask |= 16
+        self.x.append(x)
+        self.y.append(y)
+        self.z.append(z)
+        self.e.append(e)
+        self.f.append(f)
+        self.mask.append(mask)
+        self.kind.append(kind)
+
+    def extend(
+            self,
+            kind:int,
+            x:Iterable[float]|None=None,
+            y:Iterable[float]|None=None,
+            z:Iterable[float]|None=None,
+            e:Iterable[float]|None=None,
+            f:Iterable[float]|None=None,
+            ) -> None:
+        """Appends a run of instructions of the same kind carrying the same words, column by column.
+        Every given column must have the same length; a scalar feedrate is repeated on every row.
+
+        Args:
+            kind (int): the move kind code
+            x (Iterable[float] | None): the x coordinates
+            y (Iterable[float] | None): the y coordinates
+            z (Iterable[float] | None): the z coordinates
+            e (Iterable[float] | None): the extruder positions
+            f (Iterable[float] | float | None): the feedrates
+        """
+        given = {word: values for word, values in zip(self.WORDS, (x, y, z, e, f)) if values is not None}
+        rows = None
+        for values in given.values():
+            if not isinstance(values, (int, float)):
+                rows = len(values)
+                break
+        if rows is None:
+            raise ValueError('at least one column must be a sequence')
+        mask = 0
+        for word, column in self.columns.items():
+            values = given.get(word)
+            if values is None:
+                column.extend(array('d', [0.0])*rows)
+            elif isinstance(values, (int, float)):
+                column.extend(array('d', [values])*rows)
+                mask |= self.BITS[word]
+            else:
+                if len(values) != rows:
+                    raise ValueError('all the columns must have the same length')
+                if getattr(values, 'dtype', None) == 'float64':
+                    # numpy arrays are copied as raw doubles
+                    column.frombytes(values.tobytes())
+                else:
+                    column.extend(values)
+                mask |= self.BITS[word]
+        self.mask.extend(array('B', [mask])*rows)
+        self.kind.extend(array('B', [kind])*rows)
+
+    def extend_buffer(
+            self,
+            other:'InstructionBuffer'
+            ) -> None:
+        """Appends all the instructions of another buffer.
+
+        Args:
+            other (InstructionBuffer): the buffer to append
+        """
+        self.x.extend(other.x)
+        self.y.extend(other.y)
+        self.z.extend(other.z)
+        self.e.extend(other.e)
+        self.f.extend(other.f)
+        self.mask.extend(other.mask)
+        self.kind.extend(other.kind)
+
+    def clear(self) -> None:
+        """Removes all the instructions"""
+        for column in (self.x, self.y, self.z, self.e, self.f, self.mask, self.kind):
+            del column[:]
+
+    def row(
+            self,
+            index:int
+            ) -> dict[str,float]:
+        """Returns an instruction as a dictionary holding only the words it carries.
+
+        Args:
+            index (int): the index of the instruction
+
+        Returns:
+            dict[str,float]: the instruction
+        """
+        mask = self.mask[index]
+        return {word: column[index] for word, column in self.columns.items() if mask & self.BITS[word]}
+
+    @property
+    def nbytes(self) -> int:
+        """Returns the size in bytes of the stored instructions
+
+        Returns:
+            int: the size of the columns
+        """
+        return sum(column.itemsize*len(column) for column in (self.x, self.y, self.z, self.e, self.f, self.mask, self.kind))
+
+    def __len__(self) -> int:
+        return len(self.mask)
+
+    def __getitem__(
+            self,
+            index:int
+            ) -> dict[str,float]:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('instruction index out of range')
+        return self.row(index)
+
+    def __iter__(self) -> Iterator[dict[str,float]]:
+        for index in range(len(self)):
+            yield self.row(index)
@@ -0,0 +1,78 @@
+from math import pi
+import numpy as np
+from src.numeric import py_round
+
+
+def trace_arrays(trace:list[dict[str,float]]) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """Converts a trace to coordinate and filament diameter arrays.
+
+    Args:
+        trace (list[dict[str,float]]): the 'x', 'y' and 'filament_diameter' value of each trace point
+
+    Returns:
+        tuple[np.ndarray,np.ndarray,np.ndarray]: the x, y coordinates and the filament diameters
+    """
+    x = np.fromiter((point['x'] for point in trace), dtype=float, count=len(trace))
+    y = np.fromiter((point['y'] for point in trace), dtype=float, count=len(trace))
+    diameters = np.fromiter((point['filament_diameter'] for point in trace), dtype=float, count=len(trace))
+    return x, y, diameters
+
+
+def segment_lengths(
+        x:np.ndarray,
+        y:np.ndarray,
+        start_x:float,
+        start_y:float,
+        ) -> np.ndarray:
+    """Calculates the length of each segment of a trace, as Nozzle.length_to_extrude does:
+    the segment starts from the previous point rounded to 2 decimals and its length is rounded to 3 decimals.
+
+    Args:
+        x (np.ndarray): x coordinates of the end of each segment
+        y (np.ndarray): y coordinates of the end of each segment
+        start_x (float): x coordinate of the nozzle before the first segment
+        start_y (float): y coordinate of the nozzle before the first segment
+
+    Returns:
+        np.ndarray: the lengths of the segments
+    """
+    previous_x = py_round(np.concatenate(([start_x], x[:-1])), 2)
+    previous_y = py_round(np.concatenate(([start_y], y[:-1])), 2)
+    return py_round(np.sqrt((x - previous_x)**2 + (y - previous_y)**2), 3)
+
+
+def segment_volumes(
+        lengths:np.ndarray,
+        diameters:np.ndarray,
+        layer_width:float,
+        layer_height:float,
+        ) -> np.ndarray:
+    """Calculates the amount to extrude for each segment of a trace, as Nozzle.volume_to_extrude does.
+
+    Args:
+        lengths (np.ndarray): the lengths of the segments
+        diameters (np.ndarray): the inlet filament diameter of each segment
+        layer_width (float): the width of the trace
+        layer_height (float): the height of the trace
+
+    Returns:
+        np.ndarray: the amount to extrude for each segment
+    """
+    inlet_area = pi*diameters**2/4
+    return lengths*layer_width*layer_height/inlet_area
+
+
+def cumulative_extrusion(
+        volumes:np.ndarray,
+        start_volume:float,
+        ) -> np.ndarray:
+    """Accumulates the amounts to extrude on top of the current one, adding them one after the other as Nozzle.extrude does.
+
+    Args:
+        volumes (np.ndarray): the amount to extrude for each segment
+        start_volume (float): the extruded volume before the first segment
+
+    Returns:
+        np.ndarray: the extruded volume after each segment, not rounded
+    """
+    return np.cumsum(np.concatenate(([start_volume], volumes)))[1:]
@@ -1,4 +1,8 @@
 from math import sqrt, pi
+import numpy as np
+from .instruction_buffer import InstructionBuffer
+from .kinematics import cumulative_extrusion, segment_lengths, segment_volumes
+from src.numeric import py_round
 
 class Nozzle:   
     def __init__(
@@ -37,15 +41,15 @@ class Nozzle:
         self._current_y = y_home
         self._current_z = z_home
         self._extruded_volume = 0.0
-        self.positions = [
-            {
-                'X': self._current_x,
-                'Y': self._current_x,
-                'Z': self._current_x,
-                'E': 0,
-                'F': 0,
-            },
-        ]
+        self.positions = InstructionBuffer()
+        self.positions.append(
+            InstructionBuffer.HOME,
+            x=self._current_x,
+            y=self._current_y,
+            z=self._current_z,
+            e=0,
+            f=0,
+        )
 
     @property
     def current_x(self):
@@ -96,13 +100,34 @@ class Nozzle:
             z (float): z coordinate
         """
         self.extrude(self.retraction)
-        self.positions.append({'Z': self.current_z + self.lift_distance, 'E': self.extruded_volume, 'F': self.moving_speed,})
-        self.positions.append({'X': x,'Y': y,'F': self.moving_speed,})
-        self.positions.append({'Z': z, 'F': self.moving_speed,})
+        self.positions.append(InstructionBuffer.LIFT, z=self.current_z + self.lift_distance, e=self.extruded_volume, f=self.moving_speed)
+        self.positions.append(InstructionBuffer.TRAVEL, x=x, y=y, f=self.moving_speed)
+        self.positions.append(InstructionBuffer.LOWER, z=z, f=self.moving_speed)
         self._current_x = x
         self._current_y = y 
         self._current_z = z
 
+    def step_to(
+            self,
+            x:float,
+            y:float,
+            z:float
+            ) -> None:
+        """Move the nozzle to the specified coordinates without retracting and lifting:
+        the nozzle goes to the new height first, then travels to x, y if it is not already there
+
+        Args:
+            x (float): x coordinate
+            y (float): y coordinate
+            z (float): z coordinate
+        """
+        self.positions.append(InstructionBuffer.LIFT, z=z, f=self.moving_speed)
+        if (x, y) != (self._current_x, self._current_y):
+            self.positions.append(InstructionBuffer.TRAVEL, x=x, y=y, f=self.moving_speed)
+        self._current_x = x
+        self._current_y = y
+        self._current_z = z
+
     def print(
             self,
             point:dict[str,float]
@@ -115,16 +140,78 @@ class Nozzle:
         volume = self.volume_to_extrude(point)
         self.extrude(volume)
         self.positions.append(
-                        {
-                'X': point['x'],
-                'Y': point['y'],
-                'E': self.extruded_volume,
-                'F': self.printing_speed,
-            }
+            InstructionBuffer.PRINT,
+            x=point['x'],
+            y=point['y'],
+            e=self.extruded_volume,
+            f=self.printing_speed,
         )
         self._current_x = point['x']
         self._current_y = point['y']
 
+    def print_trace(
+            self,
+            x:np.ndarray,
+            y:np.ndarray,
+            filament_diameters:np.ndarray,
+            ) -> None:
+        """Generate the instructions to print a whole trace at once.
+        The result is identical to calling print on each point of the trace, which stays the reference.
+
+        Args:
+            x (np.ndarray): x coordinates of the end of each segment
+            y (np.ndarray): y coordinates of the end of each segment
+            filament_diameters (np.ndarray): inlet filament diameter of each segment
+        """
+        self.print_volumes(x, y, self.trace_volumes(x, y, filament_diameters))
+
+    def trace_volumes(
+            self,
+            x:np.ndarray,
+            y:np.ndarray,
+            filament_diameters:np.ndarray,
+            ) -> np.ndarray:
+        """Calculates the volume of each segment of a trace starting from the current position.
+
+        Args:
+            x (np.ndarray): x coordinates of the end of each segment
+            y (np.ndarray): y coordinates of the end of each segment
+            filament_diameters (np.ndarray): inlet filament diameter of each segment
+
+        Returns:
+            np.ndarray: the volume of each segment
+        """
+        lengths = segment_lengths(x, y, self._current_x, self._current_y)
+        return segment_volumes(lengths, filament_diameters, self.layer_width, self.layer_height)
+
+    def print_volumes(
+            self,
+            x:np.ndarray,
+            y:np.ndarray,
+            volumes:np.ndarray,
+            ) -> None:
+        """Generate the instructions to print a trace whose segment volumes are already known.
+        The volumes are added one after the other on top of the current extruded volume.
+
+        Args:
+            x (np.ndarray): x coordinates of the end of each segment
+            y (np.ndarray): y coordinates of the end of each segment
+            volumes (np.ndarray): the volume of each segment
+        """
+        if len(x) == 0:
+            return
+        extruded_volumes = cumulative_extrusion(volumes, self._extruded_volume)
+        self.positions.extend(
+            InstructionBuffer.PRINT,
+            x=x,
+            y=y,
+            e=py_round(extruded_volumes, 3),
+            f=self.printing_speed,
+        )
+        self._extruded_volume = float(extruded_volumes[-1])
+        self._current_x = float(x[-1])
+        self._current_y = float(y[-1])
+
     def extrude(
             self,
             amount:float
@@ -1,4 +1,8 @@
+from typing import Iterable, Iterator
+from .instruction_buffer import InstructionBuffer
+from .kinematics import trace_arrays
 from .nozzle import Nozzle
+from src.profiling import profiler
 
 class Printer:
     
@@ -13,27 +17,90 @@ class Printer:
         """
         self.nozzle = nozzle
 
+    @profiler.profiled('print_cad')
     def print_cad(
             self,
             sketch_coordinates:list[dict]
-            ) -> list[dict]:
+            ) -> InstructionBuffer:
         """Prints the instruction contained in a sketch.
+        The segment volumes of the layers sharing a template are computed once: each repeat only
+        changes the height it is printed at and the extruded volume it starts from.
+        The layers flagged with 'lift': False (see plan_travels) are reached without retracting and lifting.
 
         Args:
             sketch_coordinates (dict[float,list[float]]): _description_Dictionary containing the heigth and x,y,filament diameter of each sketch point
 
         Returns:
-            list[dict]: the instructions to be converted in g-code language
+            InstructionBuffer: the instructions to be converted in g-code language
         """
+        templates = {}
+        moves = len(self.instructions)
         for layer in sketch_coordinates:
-            layer_x_home = layer['trace'][0]['x']
-            layer_y_home = layer['trace'][0]['y']
-            self.nozzle.move_to(layer_x_home,layer_y_home,layer['z'])
-            for point in layer['trace'][1:]:
-                self.nozzle.print(point)
+            self._print_layer(layer, templates)
+        profiler.count('moves', len(self.instructions) - moves)
         return self.instructions
     
+    def iter_cad(
+            self,
+            sketch_coordinates:Iterable[dict]
+            ) -> Iterator[InstructionBuffer]:
+        """Prints the layers of a sketch as print_cad does, yielding the instructions of each layer once printed.
+        The nozzle starts a new buffer after each layer, so that only one layer of instructions is held at a time
+        whatever the number of layers. The sketch is consumed lazily, e.g. from Sketch.iter_coordinates.
+        Chaining iter_cad over several sketches with the same printer streams them as one job.
+
+        Args:
+            sketch_coordinates (Iterable[dict]): the layers of the sketch, as in Sketch.coordinates
+
+        Returns:
+            Iterator[InstructionBuffer]: the instructions of each layer, the first one preceded by those left in the nozzle (e.g. its home position)
+        """
+        return profiler.iter_stage('print_cad', self._iter_cad(sketch_coordinates))
+
+    def _iter_cad(
+            self,
+            sketch_coordinates:Iterable[dict]
+            ) -> Iterator[InstructionBuffer]:
+        templates = {}
+        for layer in sketch_coordinates:
+            self._print_layer(layer, templates)
+            instructions = self.nozzle.positions
+            self.nozzle.positions = InstructionBuffer()
+            profiler.count('moves', len(instructions))
+            yield instructions
+
+    def _print_layer(
+            self,
+            layer:dict,
+            templates:dict[int,tuple],
+            ) -> None:
+        """Moves to the first point of a layer and prints its trace, computing the volumes of its template if not in templates yet"""
+        profiler.count('layers')
+        profiler.count('points', len(layer['trace']))
+        layer_x_home = layer['trace'][0]['x']
+        layer_y_home = layer['trace'][0]['y']
+        if layer.get('lift', True):
+            self.nozzle.move_to(layer_x_home,layer_y_home,layer['z'])
+        else:
+            self.nozzle.step_to(layer_x_home,layer_y_home,layer['z'])
+        template = layer.get('template')
+        if template is None:
+            self.nozzle.print_trace(*trace_arrays(layer['trace'][1:]))
+            return
+        if template not in templates:
+            # after move_to the nozzle sits on the first point of the trace, so the segment
+            # volumes of a template are the same for every layer repeating it
+            x, y, filament_diameters = trace_arrays(layer['trace'][1:])
+            templates[template] = x, y, self.nozzle.trace_volumes(x, y, filament_diameters)
+        self.nozzle.print_volumes(*templates[template])
+
     @property
-    def instructions(self):
+    def instructions(self) -> InstructionBuffer:
+        """Returns the instructions accumulated by the nozzle.
+        Iterating them yields one dictionary per instruction.
+
+        Returns:
+            InstructionBuffer: the instructions
+        """
         return self.nozzle.positions
     
\ No newline at end of file
@@ -0,0 +1,179 @@
+import numpy as np
+from src.printer import FixedPointNozzle, InstructionBuffer, Nozzle, Printer, plan_travels, reverse_trace, travel_summary
+from src.printer.kinematics import trace_arrays
+from src.shapes import Segment, Serpentine
+from src.sketch import Sketch
+import pytest
+
+@pytest.fixture
+def nozzle() -> Nozzle:
+    return Nozzle(
+        x_home=0,
+        y_home=0,
+        z_home=20,
+        layer_width=1,
+        layer_height=0.5,
+        retraction=0,
+        lift_distance=5,
+        moving_speed=4200,
+        printing_speed=3600,
+    )
+
+SKETCH_COORDINATES = [
+    {
+        'z': 0.5,
+        'trace': [
+            {'x': -50.0, 'y': -50.0, 'filament_diameter': 10},
+            {'x': -50.0, 'y': 50.0, 'filament_diameter': 10},
+            {'x': -41.0, 'y': 50.0, 'filament_diameter': 11.5},
+        ],
+    },
+]
+
+def test_instruction_buffer_rows():
+    buffer = InstructionBuffer()
+    buffer.append(InstructionBuffer.TRAVEL, x=1, y=2, f=4200)
+    buffer.extend(InstructionBuffer.PRINT, x=[3, 4], y=[5, 6], e=[0.1, 0.2], f=3600)
+    assert len(buffer) == 3
+    assert buffer[0] == {'X': 1, 'Y': 2, 'F': 4200}
+    assert list(buffer)[1:] == [
+        {'X': 3, 'Y': 5, 'E': 0.1, 'F': 3600},
+        {'X': 4, 'Y': 6, 'E': 0.2, 'F': 3600},
+    ]
+    assert list(buffer.kind) == [InstructionBuffer.TRAVEL, InstructionBuffer.PRINT, InstructionBuffer.PRINT]
+
+def test_print_cad(nozzle: Nozzle):
+    instructions = Printer(nozzle).print_cad(SKETCH_COORDINATES)
+    assert isinstance(instructions, InstructionBuffer)
+    assert list(instructions) == [
+        {'X': 0, 'Y': 0, 'Z': 20, 'E': 0, 'F': 0},
+        {'Z': 25, 'E': 0, 'F': 4200},
+        {'X': -50, 'Y': -50, 'F': 4200},
+        {'Z': 0.5, 'F': 4200},
+        {'X': -50, 'Y': 50, 'E': 0.637, 'F': 3600},
+        {'X': -41, 'Y': 50, 'E': 0.68, 'F': 3600},
+    ]
+
+def test_print_trace_matches_print(nozzle: Nozzle):
+    serpentine = Serpentine(-50.0, -50.0, 100, 100, False, 0.3, 10, 20)
+    purge = Segment(-70, -50, 50, 30, is_vertical=True)
+    reference = Nozzle(0, 0, 20, 1, 0.5, 0.1, 5, 4200, 3600)
+    batch = Nozzle(0, 0, 20, 1, 0.5, 0.1, 5, 4200, 3600)
+    for z, trace in [(0.5, purge.trace_info), (0.5, serpentine.trace_info), (1.0, serpentine.trace_info)]:
+        reference.move_to(trace[0]['x'], trace[0]['y'], z)
+        for point in trace[1:]:
+            reference.print(point)
+        batch.move_to(trace[0]['x'], trace[0]['y'], z)
+        batch.print_trace(*trace_arrays(trace[1:]))
+    assert list(batch.positions) == list(reference.positions)
+    assert batch._extruded_volume == reference._extruded_volume
+
+def test_print_cad_reuses_templates():
+    serpentine = Serpentine(-50.0, -50.0, 100, 100, False, 0.7, 10, 20)
+    segment = Segment(-50.0, 0.0, serpentine.width, 10)
+    sketch = Sketch(layer_height=0.5, number_of_layers=6)
+    sketch.gen_serpentine_layers(serpentine.trace_info)
+    sketch.gen_segment_layer(segment.trace_info)
+    sketch.gen_coordinates()
+    assert [layer['template'] for layer in sketch.coordinates] == [0]*6 + [1]
+    reference = Nozzle(0, 0, 20, 1, 0.5, 0, 5, 4200, 3600)
+    for layer in sketch.coordinates:
+        reference.move_to(layer['trace'][0]['x'], layer['trace'][0]['y'], layer['z'])
+        for point in layer['trace'][1:]:
+            reference.print(point)
+    instructions = Printer(Nozzle(0, 0, 20, 1, 0.5, 0, 5, 4200, 3600)).print_cad(sketch.coordinates)
+    assert list(instructions) == list(reference.positions)
+
+def test_iter_cad_streams_layers():
+    serpentine = Serpentine(-50.0, -50.0, 100, 100, False, 0.7, 10, 20)
+    purge = Segment(-70, -50, 50, 30, is_vertical=True)
+    purge_sketch = Sketch(layer_height=0.5, number_of_layers=1)
+    purge_sketch.gen_segment_layer(purge.trace_info)
+    purge_sketch.gen_coordinates()
+    sketch = Sketch(layer_height=0.5, number_of_layers=50)
+    sketch.gen_serpentine_layers(serpentine.trace_info)
+    sketch.gen_coordinates()
+    assert list(sketch.iter_coordinates()) == sketch.coordinates
+    reference = Printer(Nozzle(0, 0, 20, 1, 0.5, 0.1, 5, 4200, 3600))
+    reference.print_cad(purge_sketch.coordinates)
+    reference.print_cad(sketch.coordinates)
+    printer = Printer(Nozzle(0, 0, 20, 1, 0.5, 0.1, 5, 4200, 3600))
+    chunks = [*printer.iter_cad(purge_sketch.iter_coordinates()), *printer.iter_cad(sketch.iter_coordinates())]
+    assert len(chunks) == 51
+    assert [instruction for chunk in chunks for instruction in chunk] == list(reference.instructions)
+    # one layer at a time, whatever the number of layers
+    assert max(len(chunk) for chunk in chunks[1:]) == len(serpentine.trace_info) + 2
+    assert len(printer.instructions) == 0
+
+def test_fixed_point_print_cad():
+    instructions = Printer(FixedPointNozzle(0, 0, 20, 1, 0.5, 0, 5, 4200, 3600)).print_cad(SKETCH_COORDINATES)
+    assert list(instructions) == [
+        {'X': 0, 'Y': 0, 'Z': 20, 'E': 0, 'F': 0},
+        {'Z': 25, 'E': 0, 'F': 4200},
+        {'X': -50, 'Y': -50, 'F': 4200},
+        {'Z': 0.5, 'F': 4200},
+        {'X': -50, 'Y': 50, 'E': 0.637, 'F': 3600},
+        {'X': -41, 'Y': 50, 'E': 0.68, 'F': 3600},
+    ]
+
+def test_fixed_point_trace_matches_print():
+    serpentine = Serpentine(-50.0, -50.0, 100, 100, False, 0.3, 10, 20)
+    purge = Segment(-70, -50, 50, 30, is_vertical=True)
+    reference = FixedPointNozzle(0, 0, 20, 1, 0.5, 0.1, 5, 4200, 3600)
+    batch = FixedPointNozzle(0, 0, 20, 1, 0.5, 0.1, 5, 4200, 3600)
+    floating = Nozzle(0, 0, 20, 1, 0.5, 0.1, 5, 4200, 3600)
+    for z, trace in [(0.5, purge.trace_info), (0.5, serpentine.trace_info), (1.0, serpentine.trace_info)]:
+        for nozzle in (reference, batch, floating):
+            nozzle.move_to(trace[0]['x'], trace[0]['y'], z)
+        for point in trace[1:]:
+            reference.print(point)
+        batch.print_trace(*trace_arrays(trace[1:]))
+        floating.print_trace(*trace_arrays(trace[1:]))
+    assert list(batch.positions) == list(reference.positions)
+    assert batch.extruded_units == reference.extruded_units
+    assert abs(batch.extruded_units/10**6 - floating._extruded_volume) < 1e-3
+
+def test_fixed_point_volumes_are_exact():
+    nozzle = FixedPointNozzle(0, 0, 20, 1, 0.5, 0, 5, 4200, 3600)
+    x = np.arange(1, 10001)*0.1
+    segment = nozzle.volume_to_extrude({'x': 0.1, 'y': 0, 'filament_diameter': 10})
+    volumes = nozzle.trace_volumes(x, np.zeros_like(x), np.full_like(x, 10))
+    nozzle.print_volumes(x, np.zeros_like(x), volumes)
+    assert volumes.dtype == np.int64
+    assert nozzle.extruded_units == sum(volumes.tolist())
+    assert nozzle.extruded_units == 10000*round(segment*10**6)
+    assert nozzle.extruded_volume == 6.37
+
+def test_reverse_trace_keeps_segment_diameters():
+    trace = SKETCH_COORDINATES[0]['trace']
+    reversed_trace = reverse_trace(trace)
+    assert [(point['x'], point['y']) for point in reversed_trace] == [(-41.0, 50.0), (-50.0, 50.0), (-50.0, -50.0)]
+    # the segment from (-41, 50) to (-50, 50) was printed with 11.5, the one from (-50, 50) to (-50, -50) with 10
+    assert [point['filament_diameter'] for point in reversed_trace[1:]] == [11.5, 10]
+
+def test_plan_travels_alternates_layers():
+    serpentine = Serpentine(-50.0, -50.0, 100, 100, False, 0.7, 10, 20)
+    sketch = Sketch(layer_height=0.5, number_of_layers=4)
+    sketch.gen_serpentine_layers(serpentine.trace_info)
+    sketch.gen_coordinates()
+    planned = plan_travels(sketch.coordinates, 0, 0)
+    assert [layer['template'] for layer in planned] == [0, (0, 'reversed'), 0, (0, 'reversed')]
+    assert [layer['lift'] for layer in planned] == [True, False, False, False]
+    assert planned[1]['trace'] is planned[3]['trace']
+    lifted = plan_travels(sketch.coordinates, 0, 0, alternate=False, unlifted_travel=1)
+    assert [layer['lift'] for layer in lifted] == [True]*4
+    before = travel_summary(sketch.coordinates, 0, 0, 20, 5, 4200)
+    after = travel_summary(planned, 0, 0, 20, 5, 4200)
+    assert after['lifts'] == 1 and before['lifts'] == 4
+    assert after['distance'] < before['distance']
+
+def test_print_planned_layers():
+    serpentine = Serpentine(-50.0, -50.0, 100, 100, False, 0.7, 10, 20)
+    sketch = Sketch(layer_height=0.5, number_of_layers=2)
+    sketch.gen_serpentine_layers(serpentine.trace_info)
+    sketch.gen_coordinates()
+    straight = Printer(Nozzle(0, 0, 20, 1, 0.5, 0, 5, 4200, 3600)).print_cad(sketch.coordinates)
+    planned = Printer(Nozzle(0, 0, 20, 1, 0.5, 0, 5, 4200, 3600)).print_cad(plan_travels(sketch.coordinates, 0, 0))
+    assert len(planned) == len(straight) - 2
+    assert planned.e[-1] == pytest.approx(straight.e[-1], abs=0.01)
+    assert [row for row in planned if 'E' not in row and 'Z' in row][-1] == {'Z': 1, 'F': 4200}
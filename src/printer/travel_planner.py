@@ -0,0 +1,119 @@
+from math import hypot
+
+
+def plan_travels(
+        sketch_coordinates:list[dict],
+        x_home:float,
+        y_home:float,
+        alternate:bool=True,
+        unlifted_travel:float=0.0,
+        ) -> list[dict]:
+    """Plans the travels between the layers of a sketch.
+
+    When alternate is set, each layer after the first is printed in the direction whose first point
+    is the closest to the end of the previous layer: for stacked serpentines, the odd layers are
+    printed backwards and start right where the previous one ended. A reversed trace keeps the filament
+    diameter of each segment, so the diameter gradient follows the segments and not the direction.
+    A layer starting within unlifted_travel of the end of the previous one is flagged with
+    'lift': False, telling the printer to step to it without retracting and lifting.
+
+    Args:
+        sketch_coordinates (list[dict]): the layers of the sketch, as in Sketch.coordinates
+        x_home (float): x coordinate of the nozzle before the first layer
+        y_home (float): y coordinate of the nozzle before the first layer
+        alternate (bool): whether layers may be printed backwards
+        unlifted_travel (float): the longest travel made without lifting the nozzle
+
+    Returns:
+        list[dict]: the planned layers, with their 'trace', 'template' and 'lift' updated. The template
+            of a reversed layer is (template, 'reversed')
+    """
+    planned = []
+    reversed_traces = {}
+    x, y = x_home, y_home
+    for layer in sketch_coordinates:
+        trace = layer['trace']
+        template = layer.get('template')
+        if alternate and planned and _distance(x, y, trace[-1]) < _distance(x, y, trace[0]):
+            if template is None:
+                trace = reverse_trace(trace)
+            else:
+                if template not in reversed_traces:
+                    reversed_traces[template] = reverse_trace(trace)
+                trace = reversed_traces[template]
+                template = (template, 'reversed')
+        planned.append(layer | {
+            'trace': trace,
+            'template': template,
+            'lift': len(planned) == 0 or _distance(x, y, trace[0]) > unlifted_travel,
+        })
+        x, y = trace[-1]['x'], trace[-1]['y']
+    return planned
+
+
+def reverse_trace(trace:list[dict[str,float]]) -> list[dict[str,float]]:
+    """Reverses a trace. The filament diameter of a point applies to the segment ending on it,
+    so each point of the reversed trace takes the diameter of the point following it in the original one.
+
+    Args:
+        trace (list[dict[str,float]]): the 'x', 'y' and 'filament_diameter' value of each trace point
+
+    Returns:
+        list[dict[str,float]]: the reversed trace
+    """
+    reversed_trace = [dict(trace[-1])]
+    for index in range(len(trace) - 2, -1, -1):
+        reversed_trace.append({
+            'x': trace[index]['x'],
+            'y': trace[index]['y'],
+            'filament_diameter': trace[index + 1]['filament_diameter'],
+        })
+    return reversed_trace
+
+
+def travel_summary(
+        sketch_coordinates:list[dict],
+        x_home:float,
+        y_home:float,
+        z_home:float,
+        lift_distance:float,
+        moving_speed:float,
+        ) -> dict[str,float]:
+    """Sums the moves made without printing between the layers of a sketch.
+
+    Args:
+        sketch_coordinates (list[dict]): the layers of the sketch, optionally with a 'lift' flag
+        x_home (float): x coordinate of the nozzle before the first layer
+        y_home (float): y coordinate of the nozzle before the first layer
+        z_home (float): z coordinate of the nozzle before the first layer
+        lift_distance (float): the distance the nozzle is lifted by before travelling
+        moving_speed (float): the speed of the nozzle when not printing, mm/min
+
+    Returns:
+        dict[str,float]: the 'distance' travelled, the number of 'lifts' and the estimated 'seconds'
+    """
+    x, y, z = x_home, y_home, z_home
+    distance = 0.0
+    lifts = 0
+    for layer in sketch_coordinates:
+        start = layer['trace'][0]
+        distance += _distance(x, y, start)
+        if layer.get('lift', True):
+            lifts += 1
+            distance += lift_distance + abs(z + lift_distance - layer['z'])
+        else:
+            distance += abs(layer['z'] - z)
+        x, y, z = layer['trace'][-1]['x'], layer['trace'][-1]['y'], layer['z']
+    return {
+        'distance': distance,
+        'lifts': lifts,
+        'seconds': distance/moving_speed*60 if moving_speed else 0.0,
+    }
+
+
+def _distance(
+        x:float,
+        y:float,
+        point:dict[str,float]
+        ) -> float:
+    return hypot(point['x'] - x, point['y'] - y)
@@ -0,0 +1,3 @@
+from src.profiling.profiling import PROFILE_VARIABLE, Profiler, environment_profile, format_report, profiler, report_file, save_report
+
+__all__ = ['PROFILE_VARIABLE', 'Profiler', 'environment_profile', 'format_report', 'profiler', 'report_file', 'save_report']
@@ -0,0 +1,294 @@
+from contextlib import contextmanager, nullcontext
+import functools
+import json
+import os
+import time
+from typing import Any, Callable, ContextManager, Iterable, Iterator
+
+PROFILE_VARIABLE = 'GCODE_PROFILE'
+
+_DISABLED = nullcontext()
+
+
+class Profiler:
+
+    def __init__(self) -> None:
+        """Collects the time, the calls and the peak memory of each stage of the generation, and counters of the work
+        done (points, moves, lines, bytes). Disabled, stage returns a shared no-op context and count returns at once,
+        so the instrumented code pays one attribute check per call.
+
+        The time of a stage excludes the stages run inside it, so that the lazily chained stages (the writing pulls
+        the lines, which pull the layers from the printer) are told apart. The peak memory of a stage is the highest
+        traced memory, above the one at the start of the profile, while it was the innermost running stage.
+        """
+        self.enabled = False
+        self.trace_memory = False
+        self._started_tracing = False
+        self.reset()
+
+    def enable(
+            self,
+            trace_memory:bool=True,
+            ) -> None:
+        """Starts a new profile.
+
+        Args:
+            trace_memory (bool): measure the peak memory of the stages with tracemalloc, which slows them down
+        """
+        self.disable()
+        self.trace_memory = trace_memory
+        if trace_memory:
+            # imported on use: the pipeline modules import the profiler, and most runs never trace the memory
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+        self.enabled = True
+        self.reset()
+
+    def disable(self) -> None:
+        """Stops profiling, keeping what was collected so far"""
+        self.enabled = False
+        if self._started_tracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.trace_memory = False
+
+    def reset(self) -> None:
+        """Forgets what was collected so far"""
+        self.stages = {}
+        self.counters = {}
+        self._stack = []
+        self._start = time.perf_counter()
+        self._origin = 0
+        self._peak = 0
+        if self.trace_memory:
+            import tracemalloc
+            self._origin = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+    def stage(self, name:str) -> ContextManager:
+        """Returns a context timing the code it runs as a stage.
+
+        Args:
+            name (str): the name of the stage
+
+        Returns:
+            ContextManager: the context
+        """
+        if not self.enabled:
+            return _DISABLED
+        return self._stage(name)
+
+    def iter_stage(
+            self,
+            name:str,
+            iterable:Iterable,
+            ) -> Iterable:
+        """Times the production of each item of a lazy iterable as a stage, e.g. a generator.
+
+        Args:
+            name (str): the name of the stage
+            iterable (Iterable): the items
+
+        Returns:
+            Iterable: the same items, or the iterable itself if disabled
+        """
+        if not self.enabled:
+            return iterable
+        return self._iter_stage(name, iterable)
+
+    def profiled(self, name:str) -> Callable[[Callable],Callable]:
+        """Returns a decorator timing each call of a function as a stage.
+
+        Args:
+            name (str): the name of the stage
+
+        Returns:
+            Callable[[Callable],Callable]: the decorator
+        """
+        def decorate(function:Callable) -> Callable:
+            @functools.wraps(function)
+            def profiled_function(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self._stage(name):
+                    return function(*args, **kwargs)
+            return profiled_function
+        return decorate
+
+    def count(
+            self,
+            name:str,
+            amount:int=1,
+            ) -> None:
+        """Adds to a counter.
+
+        Args:
+            name (str): the name of the counter
+            amount (int): the amount added
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self) -> dict[str,Any]:
+        """Returns what was collected since the profile started.
+
+        Returns:
+            dict[str,Any]: the elapsed 'seconds', the overall 'peak_bytes' (None without memory tracing), the 'seconds',
+            'calls' and 'peak_bytes' of each stage in 'stages', in running order, and the 'counters'
+        """
+        if self.trace_memory and self._stack:
+            self._sample()
+        return {
+            'seconds': time.perf_counter() - self._start,
+            'peak_bytes': self._peak if self.trace_memory else None,
+            'stages': {name: dict(stats) for name, stats in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+    @contextmanager
+    def _stage(self, name:str) -> Iterator[None]:
+        self._push(name)
+        try:
+            yield
+        finally:
+            self._pop()
+
+    def _iter_stage(
+            self,
+            name:str,
+            iterable:Iterable,
+            ) -> Iterator:
+        iterator = iter(iterable)
+        self._stats(name)['calls'] += 1
+        while True:
+            self._push(name, call=False)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._pop()
+            yield item
+
+    def _stats(self, name:str) -> dict[str,Any]:
+        """Returns the measures of a stage, added if new"""
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = {'seconds': 0.0, 'calls': 0, 'peak_bytes': 0 if self.trace_memory else None}
+        return stats
+
+    def _push(
+            self,
+            name:str,
+            call:bool=True,
+            ) -> None:
+        """Enters a stage, counting a call unless call is False (the items of an iterated stage)"""
+        if self.trace_memory:
+            self._sample()
+        stats = self._stats(name)
+        if call:
+            stats['calls'] += 1
+        self._stack.append([stats, time.perf_counter(), 0.0])
+
+    def _pop(self) -> None:
+        """Leaves the innermost stage, adding its time without the stages run inside it"""
+        if self.trace_memory:
+            self._sample()
+        stats, start, inner = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        stats['seconds'] += elapsed - inner
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def _sample(self) -> None:
+        """Charges the peak memory since the last sample to the innermost running stage"""
+        import tracemalloc
+        peak = max(tracemalloc.get_traced_memory()[1] - self._origin, 0)
+        tracemalloc.reset_peak()
+        self._peak = max(self._peak, peak)
+        if self._stack:
+            stats = self._stack[-1][0]
+            stats['peak_bytes'] = max(stats['peak_bytes'], peak)
+
+
+profiler = Profiler()
+
+
+def environment_profile() -> str|None:
+    """Reads the GCODE_PROFILE environment variable: unset, empty or 0 leaves profiling off, a file name ending in
+    .json turns it on and saves the report there, any other value just turns it on.
+
+    Returns:
+        str | None: None if profiling is off, else the value of the variable
+    """
+    value = os.environ.get(PROFILE_VARIABLE, '')
+    if value in ('', '0'):
+        return None
+    return value
+
+
+def report_file(profile:str) -> str|None:
+    """Returns the JSON file a profile setting (GCODE_PROFILE or --profile) saves the report to.
+
+    Args:
+        profile (str): the setting
+
+    Returns:
+        str | None: the file, if the setting ends with .json
+    """
+    return profile if profile.lower().endswith('.json') else None
+
+
+def format_report(report:dict[str,Any]) -> str:
+    """Formats a report of Profiler.report as a table of the stages followed by the counters.
+
+    Args:
+        report (dict[str,Any]): the report
+
+    Returns:
+        str: the report, one line per stage
+    """
+    staged = sum(stats['seconds'] for stats in report['stages'].values())
+    lines = []
+    for name, stats in report['stages'].items():
+        share = stats['seconds']/staged*100 if staged > 0 else 0.0
+        line = f"{name:<12} {stats['seconds']*1000:10.1f} ms {share:5.1f}% {stats['calls']:8} calls"
+        if stats['peak_bytes'] is not None:
+            line += f" peak {_format_bytes(stats['peak_bytes'])}"
+        lines.append(line)
+    total = f"{'total':<12} {report['seconds']*1000:10.1f} ms"
+    if report['peak_bytes'] is not None:
+        total += f" peak {_format_bytes(report['peak_bytes'])}"
+    lines.append(total)
+    if report['counters']:
+        lines.append(' '.join(f'{name}={value}' for name, value in report['counters'].items()))
+    return '\n'.join(lines)
+
+
+def save_report(
+        report:dict[str,Any],
+        path:str,
+        ) -> None:
+    """Saves a report of Profiler.report as JSON.
+
+    Args:
+        report (dict[str,Any]): the report
+        path (str): the JSON file
+    """
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+
+
+def _format_bytes(size:int) -> str:
+    if size < 1 << 10:
+        return f'{size} B'
+    if size < 1 << 20:
+        return f'{size/(1 << 10):.1f} KiB'
+    return f'{size/(1 << 20):.1f} MiB'
+
+
+if environment_profile() is not None:
+    profiler.enable()
@@ -0,0 +1,67 @@
+import io
+import time
+from src.pipeline import build_serpentine, build_sketch, job_layers, write_layers
+from src.profiling import Profiler, environment_profile, format_report, profiler, report_file
+from src.settings import SettingsManager
+import pytest
+
+@pytest.fixture
+def enabled():
+    profiler.enable()
+    yield profiler
+    profiler.disable()
+
+def test_disabled_profiler_does_nothing():
+    disabled = Profiler()
+    items = [1, 2]
+    assert disabled.stage('a') is disabled.stage('b')
+    assert disabled.iter_stage('a', items) is items
+    with disabled.stage('a'):
+        disabled.count('points', 3)
+    assert disabled.report()['stages'] == {}
+    assert disabled.report()['counters'] == {}
+
+def test_nested_stages_exclude_inner_time():
+    timer = Profiler()
+    timer.enable(trace_memory=False)
+
+    def inner():
+        for item in range(3):
+            time.sleep(0.01)
+            yield item
+
+    with timer.stage('outer'):
+        time.sleep(0.01)
+        assert list(timer.iter_stage('inner', inner())) == [0, 1, 2]
+    stages = timer.report()['stages']
+    assert stages['inner']['calls'] == 1
+    assert stages['inner']['seconds'] >= 0.03
+    assert 0.01 <= stages['outer']['seconds'] < 0.03
+    assert stages['outer']['peak_bytes'] is None
+    timer.disable()
+
+def test_profile_pipeline(enabled:Profiler):
+    settings = SettingsManager('defaults/settings.ini', 'defaults/gcode_head.ini', 'defaults/gcode_tail.ini').as_dict()
+    settings |= {'purge_nozzle': True, 'number_of_layers': 5}
+    layers = job_layers(settings, build_sketch(settings, build_serpentine(settings)))
+    enabled.reset()
+    written = write_layers(settings, layers, '', '', output=io.StringIO())
+    report = enabled.report()
+    assert list(report['stages']) == ['validation', 'write', 'gen_gcode', 'print_cad']
+    assert all(stats['peak_bytes'] > 0 for stats in report['stages'].values())
+    counters = report['counters']
+    assert counters['layers'] == 6
+    assert counters['points'] == sum(len(layer['trace']) for coordinates in layers for layer in coordinates)
+    # one line per move, the home position included
+    assert counters['lines'] == counters['moves']
+    assert counters['bytes'] == written
+    assert 'print_cad' in format_report(report)
+
+def test_environment_profile(monkeypatch):
+    monkeypatch.delenv('GCODE_PROFILE', raising=False)
+    assert environment_profile() is None
+    monkeypatch.setenv('GCODE_PROFILE', '0')
+    assert environment_profile() is None
+    monkeypatch.setenv('GCODE_PROFILE', 'report.json')
+    assert report_file(environment_profile()) == 'report.json'
+    assert report_file('1') is None
@@ -0,0 +1,5 @@
+from src.sender.sender import SerialSender, checksum, format_line, format_stats, iter_commands, send_gcode
+from src.sender.serial_port import SerialPort
+from src.sender.virtual_printer import VirtualPrinter
+
+__all__ = ['SerialPort', 'SerialSender', 'VirtualPrinter', 'checksum', 'format_line', 'format_stats', 'iter_commands', 'send_gcode']
@@ -0,0 +1,3 @@
+from src.sender.sender import main
+
+main()
@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+from collections import deque
+from functools import reduce
+import re
+import sys
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator
+from src.sender.serial_port import SerialPort
+
+DEFAULT_WINDOW = 4
+DEFAULT_TIMEOUT = 10.0
+HISTORY = 1024
+RESEND = re.compile(r'^(?:resend|rs)\s*:?\s*n?(\d+)', re.IGNORECASE)
+
+
+def checksum(text:str) -> int:
+    """Returns the checksum of a numbered line: the exclusive or of all its bytes.
+
+    Args:
+        text (str): the line, without the checksum
+
+    Returns:
+        int: the checksum, from 0 to 255
+    """
+    return reduce(lambda total, byte: total ^ byte, text.encode('ascii'), 0)
+
+
+def format_line(
+        number:int,
+        command:str,
+        ) -> bytes:
+    """Numbers a command and appends its checksum, as in N12 G1 X10*97.
+
+    Args:
+        number (int): the line number
+        command (str): the command, without comment
+
+    Returns:
+        bytes: the line to send, end of line included
+    """
+    line = f'N{number} {command}'
+    return f'{line}*{checksum(line)}\n'.encode('ascii')
+
+
+def iter_commands(pieces:Iterable[str]) -> Iterator[str]:
+    """Splits g-code text, given piece by piece as GCodeGenerator.iter_gcode yields it, into commands.
+    The comments and the empty lines are left out.
+
+    Args:
+        pieces (Iterable[str]): the g-code text, in pieces of any length
+
+    Yields:
+        str: the next command
+    """
+    rest = ''
+    for piece in pieces:
+        commands, rest = _split_commands(rest + piece)
+        yield from commands
+    yield from _split_commands(rest + '\n')[0]
+
+
+class SerialSender:
+
+    def __init__(
+            self,
+            port:SerialPort,
+            window:int=DEFAULT_WINDOW,
+            timeout:float=DEFAULT_TIMEOUT,
+            ) -> None:
+        """Streams g-code to a printer over a serial port, with line numbers and checksums.
+        Up to window commands are sent ahead of the acknowledgements (ok), to keep the command buffer of the
+        controller full instead of waiting for each command. The lines asked again by the printer (Resend: N)
+        are sent again from a history of the last HISTORY lines.
+
+        Args:
+            port (SerialPort): the port of the printer
+            window (int): the number of commands sent but not acknowledged yet, at most. Should match the command buffer of the firmware
+            timeout (float): the seconds without any answer (busy messages included) after which the printer is deemed lost
+        """
+        if window < 1:
+            raise ValueError('the window must hold at least one command')
+        self.port = port
+        self.window = window
+        self.timeout = timeout
+
+    async def send(
+            self,
+            source:Iterable[str]|AsyncIterable[str],
+            ) -> dict[str,Any]:
+        """Sends g-code to the printer and waits until every command is acknowledged.
+        The line numbers are reset first (M110). The source is read only as the window frees up, so it can be
+        produced on the fly, e.g. by GCodeGenerator.iter_gcode.
+
+        Args:
+            source (Iterable[str] | AsyncIterable[str]): the g-code text, in pieces of any length
+
+        Returns:
+            dict[str,Any]: the number of 'commands' sent, the 'resends' asked by the printer, the 'lines_resent',
+            the 'bytes' written, the elapsed 'seconds' and the seconds 'stalled' with a full window
+
+        Raises:
+            TimeoutError: if the printer does not answer for timeout seconds
+            ValueError: if the printer asks for a line no longer kept
+        """
+        self._history = deque(maxlen=HISTORY)
+        self._in_flight = deque()
+        self._next_line = 0
+        self._sent_line = 0
+        self._ignored_resends = 0
+        self._progress = asyncio.Event()
+        self._error = None
+        stats = {'commands': 0, 'resends': 0, 'lines_resent': 0, 'bytes': 0, 'seconds': 0.0, 'stalled': 0.0}
+        self._stats = stats
+        start = time.perf_counter()
+        reader = asyncio.create_task(self._read())
+        try:
+            commands = _aiter_commands(source)
+            pending = 'M110 N0'
+            exhausted = False
+            while True:
+                # cleared before looking at the window, so that no answer read meanwhile is missed
+                self._progress.clear()
+                while len(self._in_flight) < self.window:
+                    if self._sent_line < self._next_line:
+                        line = self._line(self._sent_line)
+                        stats['lines_resent'] += 1
+                    elif exhausted:
+                        break
+                    else:
+                        if pending is None:
+                            pending = await anext(commands, None)
+                            if pending is None:
+                                exhausted = True
+                                break
+                            stats['commands'] += 1
+                        line = format_line(self._next_line, pending)
+                        self._history.append(line)
+                        self._next_line += 1
+                        pending = None
+                    self._in_flight.append(self._sent_line)
+                    self._sent_line += 1
+                    stats['bytes'] += len(line)
+                    await self.port.write(line)
+                if exhausted and not self._in_flight and self._sent_line == self._next_line:
+                    break
+                full = len(self._in_flight) >= self.window
+                waiting = time.perf_counter()
+                try:
+                    await asyncio.wait_for(self._progress.wait(), self.timeout)
+                except TimeoutError:
+                    raise TimeoutError(f'no answer from the printer for {self.timeout:g} s') from None
+                if full:
+                    stats['stalled'] += time.perf_counter() - waiting
+                if self._error is not None:
+                    raise self._error
+        finally:
+            reader.cancel()
+            stats['seconds'] = time.perf_counter() - start
+        return stats
+
+    def _line(self, number:int) -> bytes:
+        """Returns a line of the history"""
+        index = number - (self._next_line - len(self._history))
+        if index < 0:
+            raise ValueError(f'the printer asked for line {number}, no longer kept')
+        return self._history[index]
+
+    async def _read(self) -> None:
+        """Reads the answers of the printer, acknowledging the lines in flight and rewinding on resend requests"""
+        while True:
+            answer = await self.port.readline()
+            if not answer:
+                self._error = ConnectionError('the printer closed the connection')
+                self._progress.set()
+                return
+            answer = answer.decode('ascii', 'replace').strip()
+            resend = RESEND.match(answer)
+            if answer.startswith('ok'):
+                if self._in_flight:
+                    self._in_flight.popleft()
+            elif resend is not None:
+                self._resend(int(resend.group(1)))
+            self._progress.set()
+
+    def _resend(self, number:int) -> None:
+        """Rewinds to the line asked by the printer. The printer rejects the lines sent after it until it gets it
+        again, asking for it each time: those requests are ignored"""
+        if self._ignored_resends:
+            self._ignored_resends -= 1
+            return
+        if number >= self._next_line:
+            self._error = ValueError(f'the printer asked for line {number}, not sent yet')
+            return
+        try:
+            self._line(number)
+        except ValueError as error:
+            self._error = error
+            return
+        self._stats['resends'] += 1
+        self._ignored_resends = sum(1 for line in self._in_flight if line > number)
+        self._sent_line = number
+
+
+async def send_gcode(
+        path:str,
+        source:Iterable[str]|AsyncIterable[str],
+        baudrate:int=115200,
+        window:int=DEFAULT_WINDOW,
+        timeout:float=DEFAULT_TIMEOUT,
+        ) -> dict[str,Any]:
+    """Opens a serial port and sends g-code to the printer (see SerialSender.send).
+
+    Args:
+        path (str): the serial device
+        source (Iterable[str] | AsyncIterable[str]): the g-code text, in pieces of any length
+        baudrate (int): the speed of the port
+        window (int): the number of commands sent but not acknowledged yet, at most
+        timeout (float): the seconds without any answer after which the printer is deemed lost
+
+    Returns:
+        dict[str,Any]: the statistics of the transfer
+    """
+    port = SerialPort.open(path, baudrate)
+    try:
+        return await SerialSender(port, window, timeout).send(source)
+    finally:
+        port.close()
+
+
+def format_stats(stats:dict[str,Any]) -> str:
+    """Formats the statistics of a transfer as a single line.
+
+    Args:
+        stats (dict[str,Any]): the statistics returned by SerialSender.send
+
+    Returns:
+        str: the statistics
+    """
+    rate = stats['commands']/stats['seconds'] if stats['seconds'] > 0 else 0.0
+    return (
+        f"{stats['commands']} commands in {stats['seconds']:.2f} s ({rate:.0f} commands/s), "
+        f"{stats['bytes']} bytes, stalled {stats['stalled']:.2f} s, "
+        f"{stats['resends']} resends ({stats['lines_resent']} lines sent again)"
+    )
+
+
+def _split_commands(text:str) -> tuple[list[str],str]:
+    """Splits the complete lines of g-code text into commands, returning the commands and the unfinished last line"""
+    lines = text.split('\n')
+    rest = lines.pop()
+    commands = [command for command in (line.split(';', 1)[0].strip() for line in lines) if command]
+    return commands, rest
+
+
+async def _aiter_commands(source:Iterable[str]|AsyncIterable[str]) -> AsyncIterator[str]:
+    """Yields the commands of a synchronous or asynchronous source of g-code text"""
+    if not hasattr(source, '__aiter__'):
+        for command in iter_commands(source):
+            yield command
+        return
+    rest = ''
+    async for piece in source:
+        commands, rest = _split_commands(rest + piece)
+        for command in commands:
+            yield command
+    for command in _split_commands(rest + '\n')[0]:
+        yield command
+
+
+def main(argv:list[str]|None=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m src.sender',
+        description='Sends a g-code file to a printer over a serial port, or to a virtual printer to measure the throughput',
+    )
+    parser.add_argument('gcode', help='the g-code file')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--port', help='the serial device of the printer, e.g. /dev/ttyACM0')
+    target.add_argument('--virtual', action='store_true', help='send to a virtual printer on a pseudo-terminal')
+    parser.add_argument('--baudrate', type=int, default=115200, help='the speed of the port (default: 115200)')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help=f'the commands sent ahead of the acknowledgements (default: {DEFAULT_WINDOW})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help=f'the seconds without answer before giving up (default: {DEFAULT_TIMEOUT:g})')
+    parser.add_argument('--latency', type=float, default=0.001, help='with --virtual, the seconds the printer takes per command (default: 0.001)')
+    parser.add_argument('--buffer-size', type=int, default=4, help='with --virtual, the command buffer of the printer (default: 4)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='with --virtual, the fraction of lines received corrupted (default: 0)')
+    arguments = parser.parse_args(argv)
+    if arguments.window < 1:
+        parser.error('the window must hold at least one command')
+
+    def read_gcode() -> Iterator[str]:
+        with open(arguments.gcode) as gcode_file:
+            yield from gcode_file
+
+    async def run() -> dict[str,Any]:
+        if not arguments.virtual:
+            return await send_gcode(arguments.port, read_gcode(), arguments.baudrate, arguments.window, arguments.timeout)
+        # the virtual printer needs the pty module, POSIX only
+        from src.sender.virtual_printer import VirtualPrinter
+        async with VirtualPrinter(arguments.latency, arguments.buffer_size, arguments.error_rate) as printer:
+            return await send_gcode(printer.path, read_gcode(), arguments.baudrate, arguments.window, arguments.timeout)
+
+    try:
+        stats = asyncio.run(run())
+    except (OSError, TimeoutError, ValueError) as error:
+        print(f'error: {error}', file=sys.stderr)
+        sys.exit(1)
+    print(format_stats(stats))
@@ -0,0 +1,116 @@
+import asyncio
+import os
+
+
+class SerialPort:
+
+    def __init__(
+            self,
+            fd:int,
+            ) -> None:
+        """Asynchronous line-oriented access to a serial port (or to the master side of a pseudo-terminal),
+        through the file descriptor watched by the event loop. POSIX only.
+
+        Args:
+            fd (int): the open file descriptor. It is made non-blocking, and closed by close
+        """
+        self.fd = fd
+        os.set_blocking(fd, False)
+        self._buffer = bytearray()
+        self._write_lock = asyncio.Lock()
+
+    @classmethod
+    def open(
+            cls,
+            path:str,
+            baudrate:int=115200,
+            ) -> 'SerialPort':
+        """Opens a serial device in raw mode (no echo, no line editing, 8 data bits).
+
+        Args:
+            path (str): the device, e.g. /dev/ttyUSB0 or /dev/ttyACM0
+            baudrate (int): the speed of the port
+
+        Returns:
+            SerialPort: the port
+
+        Raises:
+            ValueError: if the platform does not support the baudrate
+        """
+        # termios and tty only exist on POSIX systems: the rest of the package does not need them
+        import termios
+        import tty
+        speed = getattr(termios, f'B{baudrate}', None)
+        if speed is None:
+            raise ValueError(f'unsupported baudrate {baudrate}')
+        fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            tty.setraw(fd)
+            attributes = termios.tcgetattr(fd)
+            attributes[2] |= termios.CLOCAL | termios.CREAD
+            attributes[4] = attributes[5] = speed
+            termios.tcsetattr(fd, termios.TCSANOW, attributes)
+        except BaseException:
+            os.close(fd)
+            raise
+        return cls(fd)
+
+    async def readline(self) -> bytes:
+        """Reads the next line, end of line included.
+
+        Returns:
+            bytes: the line, or what is left before the end of the stream (b'' once exhausted)
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            index = self._buffer.find(b'\n')
+            if index >= 0:
+                line = bytes(self._buffer[:index + 1])
+                del self._buffer[:index + 1]
+                return line
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                await _ready(loop, loop.add_reader, loop.remove_reader, self.fd)
+                continue
+            except OSError:
+                # the other side of a pseudo-terminal was closed
+                data = b''
+            if not data:
+                line = bytes(self._buffer)
+                self._buffer.clear()
+                return line
+            self._buffer += data
+
+    async def write(
+            self,
+            data:bytes,
+            ) -> None:
+        """Writes the whole data, waiting while the output buffer of the port is full.
+        Concurrent writes are not interleaved.
+
+        Args:
+            data (bytes): the data
+        """
+        loop = asyncio.get_running_loop()
+        view = memoryview(data)
+        async with self._write_lock:
+            while view:
+                try:
+                    view = view[os.write(self.fd, view):]
+                except BlockingIOError:
+                    await _ready(loop, loop.add_writer, loop.remove_writer, self.fd)
+
+    def close(self) -> None:
+        """Closes the file descriptor"""
+        os.close(self.fd)
+
+
+async def _ready(loop, add, remove, fd:int) -> None:
+    """Waits until the file descriptor is readable (add_reader) or writable (add_writer)"""
+    future = loop.create_future()
+    add(fd, lambda: None if future.done() else future.set_result(None))
+    try:
+        await future
+    finally:
+        remove(fd)
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from src.cli import main
+from src.sender import SerialPort, SerialSender, VirtualPrinter, checksum, format_line, iter_commands
+import pytest
+
+COMMANDS = [f'G1 X{i} Y{i % 7} E{i*0.01:.2f} F3600' for i in range(200)]
+
+def test_format_line():
+    assert checksum('N0 M110 N0') == 125
+    assert format_line(0, 'M110 N0') == b'N0 M110 N0*125\n'
+
+def test_iter_commands():
+    pieces = ['G28 ; home\n', '\n', 'G1 X', '10 Y5\nM104 S0', '']
+    assert list(iter_commands(pieces)) == ['G28', 'G1 X10 Y5', 'M104 S0']
+
+async def _send(commands:list[str], window:int, **printer_options) -> tuple[dict,VirtualPrinter]:
+    async with VirtualPrinter(latency=0, **printer_options) as printer:
+        port = SerialPort.open(printer.path)
+        try:
+            stats = await SerialSender(port, window, timeout=5).send(f'{command}\n' for command in commands)
+        finally:
+            port.close()
+    return stats, printer
+
+@pytest.mark.parametrize('window', [1, 4, 16])
+def test_send(window:int):
+    stats, printer = asyncio.run(_send(COMMANDS, window))
+    assert printer.executed == ['M110 N0', *COMMANDS]
+    assert stats['commands'] == len(COMMANDS) and stats['resends'] == 0
+
+@pytest.mark.parametrize('window', [1, 4, 16])
+def test_send_resends_corrupted_lines(window:int):
+    stats, printer = asyncio.run(_send(COMMANDS, window, error_rate=0.1, seed=1))
+    assert printer.executed == ['M110 N0', *COMMANDS]
+    assert stats['resends'] > 0 and stats['lines_resent'] >= stats['resends']
+    assert printer.errors >= stats['resends']
+
+def test_send_times_out():
+    async def send() -> None:
+        # the printer is never started: nothing answers
+        printer = VirtualPrinter()
+        port = SerialPort.open(printer.path)
+        try:
+            await SerialSender(port, timeout=0.1).send(COMMANDS)
+        finally:
+            port.close()
+            printer.port.close()
+    with pytest.raises(TimeoutError):
+        asyncio.run(send())
+
+def test_main_send(capsys):
+    printer = VirtualPrinter(latency=0)
+    loop = asyncio.new_event_loop()
+    stop = asyncio.Event()
+    started = threading.Event()
+    async def serve():
+        async with printer:
+            started.set()
+            await stop.wait()
+    thread = threading.Thread(target=loop.run_until_complete, args=(serve(),))
+    thread.start()
+    started.wait(5)
+    try:
+        main(['--settings', 'defaults/settings.ini', '--head', 'defaults/gcode_head.ini', '--tail', 'defaults/gcode_tail.ini', '--send', printer.path, '--set', 'number_of_layers=2'])
+    finally:
+        loop.call_soon_threadsafe(stop.set)
+        thread.join(5)
+        loop.close()
+    assert 'resends' in capsys.readouterr().err
+    assert printer.executed[:2] == ['M110 N0', 'G90']
+    assert any(command.startswith('G1 ') for command in printer.executed)
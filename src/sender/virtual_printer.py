@@ -0,0 +1,98 @@
+import asyncio
+import os
+import random
+import re
+from src.sender.sender import checksum
+from src.sender.serial_port import SerialPort
+
+NUMBERED_LINE = re.compile(r'^N(\d+) (.*)\*(\d+)$')
+
+
+class VirtualPrinter:
+
+    def __init__(
+            self,
+            latency:float=0.001,
+            buffer_size:int=4,
+            error_rate:float=0.0,
+            seed:int=0,
+            ) -> None:
+        """Stand-in for a printer on a pseudo-terminal, answering as Marlin does: ok once a command is executed,
+        and Error/Resend for the lines with a wrong checksum or line number. Open its path with SerialPort.open.
+        The commands wait in a buffer of buffer_size commands: once it is full, the printer stops reading,
+        as a real controller does. Use it as an async context manager. POSIX only.
+
+        Args:
+            latency (float): the seconds taken to execute each command
+            buffer_size (int): the number of commands received but not executed yet, at most
+            error_rate (float): the fraction of the lines received corrupted, to exercise the resends
+            seed (int): the seed of the corruptions, for reproducible runs
+        """
+        # pty and tty only exist on POSIX systems
+        import pty
+        import tty
+        if buffer_size < 1:
+            raise ValueError('the buffer must hold at least one command')
+        if not 0 <= error_rate < 1:
+            raise ValueError('the error rate must be at least 0 and less than 1')
+        self.latency = latency
+        self.buffer_size = buffer_size
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        master, self._slave = pty.openpty()
+        # no echo and no line editing, before the other side opens it
+        tty.setraw(self._slave)
+        self.path = os.ttyname(self._slave)
+        self.port = SerialPort(master)
+        self.executed = []
+        self.errors = 0
+        self._last_line = 0
+        self._tasks = []
+
+    async def __aenter__(self) -> 'VirtualPrinter':
+        self._commands = asyncio.Queue(self.buffer_size)
+        self._tasks = [asyncio.create_task(self._receive()), asyncio.create_task(self._execute())]
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.port.close()
+        os.close(self._slave)
+
+    async def _receive(self) -> None:
+        """Reads the lines, checks them and queues the commands"""
+        while True:
+            line = (await self.port.readline()).decode('ascii', 'replace').strip()
+            if not line:
+                continue
+            command, error = self._check(line)
+            if error is None:
+                await self._commands.put(command)
+            else:
+                # ask for the line following the last one accepted
+                self.errors += 1
+                await self.port.write(f'Error:{error}\nResend: {self._last_line + 1}\nok\n'.encode('ascii'))
+
+    def _check(self, line:str) -> tuple[str,str|None]:
+        """Returns the command of a line, and the error if it is corrupted or out of order"""
+        match = NUMBERED_LINE.match(line)
+        if match is None:
+            return line, None
+        number, command, received = int(match.group(1)), match.group(2), int(match.group(3))
+        corrupted = self.error_rate and self._random.random() < self.error_rate
+        if corrupted or checksum(line[:line.rindex('*')]) != received:
+            return command, f'checksum mismatch, Last Line: {self._last_line}'
+        if not command.startswith('M110') and number != self._last_line + 1:
+            return command, f'Line Number is not Last Line Number+1, Last Line: {self._last_line}'
+        self._last_line = number
+        return command, None
+
+    async def _execute(self) -> None:
+        """Executes the queued commands, acknowledging each one"""
+        while True:
+            command = await self._commands.get()
+            await asyncio.sleep(self.latency)
+            self.executed.append(command)
+            await self.port.write(b'ok\n')
@@ -0,0 +1,3 @@
+from src.service.service import GCodeService, parse_payload, render_gcode
+
+__all__ = ['GCodeService', 'parse_payload', 'render_gcode']
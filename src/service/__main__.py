@@ -0,0 +1,3 @@
+from src.service.service import main
+
+main()
@@ -0,0 +1,403 @@
+import argparse
+import asyncio
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+import json
+import os
+import tempfile
+import time
+from typing import Any, AsyncIterator, BinaryIO
+from src.pipeline import ValidationError, generate_gcode, stage_key
+from src.pipeline.pipeline import INSTRUCTION_INPUTS
+from src.settings import SettingsManager
+from src.settings.settings_file_model import settings_index, settings_model
+
+CHUNK_SIZE = 1 << 16
+MAX_BODY_SIZE = 1 << 20
+LATENCY_WINDOW = 1000
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    422: 'Unprocessable Content',
+    500: 'Internal Server Error',
+}
+
+
+def render_gcode(
+        settings:dict[str,Any],
+        gcode_head:str,
+        gcode_tail:str,
+        path:str,
+        ) -> int:
+    """Runs the whole pipeline and writes the g-code to a file, layer by layer. Runs in the worker processes of the
+    service, which only hand the size of the file back.
+
+    Args:
+        settings (dict[str,Any]): the settings
+        gcode_head (str): the head of the g-code
+        gcode_tail (str): the tail of the g-code
+        path (str): the file to write, in UTF-8
+
+    Returns:
+        int: the size of the file, bytes
+
+    Raises:
+        ValidationError: if the validation of the job finds errors
+    """
+    with open(path, 'w', encoding='utf-8') as output:
+        generate_gcode(settings, gcode_head, gcode_tail, output=output)
+        return output.tell()
+
+
+def parse_payload(
+        payload:Any,
+        settings:SettingsManager,
+        ) -> dict[str,Any]:
+    """Reads the settings of a request: a JSON object of settings, either flat ({"number_of_layers": 4})
+    or by section of the settings model ({"SKETCH": {"number_of_layers": 4}}). The settings left out
+    keep the values of the settings file of the service.
+
+    Args:
+        payload (Any): the decoded JSON payload
+        settings (SettingsManager): the settings the payload overrides
+
+    Returns:
+        dict[str,Any]: the settings of the request
+
+    Raises:
+        ValueError: if the payload is not an object, or a setting is unknown or not valid
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('the payload must be a JSON object of settings')
+    values = settings.as_dict()
+    for key, value in payload.items():
+        items = value.items() if key in settings_model and isinstance(value, dict) else [(key, value)]
+        for option, option_value in items:
+            if option not in settings_index:
+                raise ValueError(f'unknown setting {option}')
+            if isinstance(option_value, (dict, list)) or option_value is None:
+                raise ValueError(f'{option} must be a single value')
+            values[option] = settings.parse_value(option, str(option_value))
+    return values
+
+
+class GCodeService:
+
+    def __init__(
+            self,
+            settings:SettingsManager,
+            executor:Executor|None=None,
+            max_workers:int|None=None,
+            ) -> None:
+        """HTTP service generating the g-code of the settings posted to /gcode, with its metrics on /metrics.
+        The generation runs in a pool of worker processes, so the event loop keeps serving meanwhile.
+        Concurrent requests for the same g-code share a single generation.
+
+        Args:
+            settings (SettingsManager): the settings files, whose values the requests override, and the g-code head and tail
+            executor (Executor | None): the pool running the generations. Defaults to a ProcessPoolExecutor, shut down by close
+            max_workers (int | None): the number of worker processes of the default pool. Defaults to the number of CPUs
+        """
+        self.settings = settings
+        self._own_executor = executor is None
+        self.executor = executor or ProcessPoolExecutor(max_workers=max_workers)
+        self._pending = {}
+        self._started = time.monotonic()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._statuses = Counter()
+        self._counters = Counter()
+        self._generation_seconds = 0.0
+
+    async def start(
+            self,
+            host:str='127.0.0.1',
+            port:int=8765,
+            ) -> asyncio.Server:
+        """Starts listening.
+
+        Args:
+            host (str): the address to listen on
+            port (int): the port to listen on, 0 for any free one
+
+        Returns:
+            asyncio.Server: the server
+        """
+        # start the worker processes before any connection is open: forked later, they would inherit the sockets and keep them open
+        await asyncio.wrap_future(self.executor.submit(int))
+        return await asyncio.start_server(self._handle, host, port)
+
+    def close(self) -> None:
+        """Shuts the default pool down"""
+        if self._own_executor:
+            self.executor.shutdown(cancel_futures=True)
+
+    @asynccontextmanager
+    async def generate(
+            self,
+            values:dict[str,Any],
+            ) -> AsyncIterator[BinaryIO]:
+        """Opens the g-code of the settings, joining the generation already running for the same settings if any.
+        The file name does not change the g-code, so it does not keep requests apart. A worker writes the g-code to a
+        temporary file, removed once the generation is done and every request sharing it has left the context.
+
+        Args:
+            values (dict[str,Any]): the settings
+
+        Yields:
+            BinaryIO: the g-code file, open for reading
+
+        Raises:
+            ValidationError: if the validation of the job finds errors
+        """
+        key = stage_key(values, INSTRUCTION_INPUTS)
+        generation = self._pending.get(key)
+        if generation is None:
+            self._counters['generations'] += 1
+            generation = self._start_generation(key, values)
+        else:
+            self._counters['coalesced'] += 1
+        generation.users += 1
+        try:
+            # a client hanging up must not cancel the generation the others wait for
+            await asyncio.shield(generation.future)
+            with open(generation.path, 'rb') as gcode:
+                yield gcode
+        finally:
+            generation.users -= 1
+            if generation.users == 0:
+                if self._pending.get(key) is generation:
+                    # nobody is left waiting: the next request for these settings starts over
+                    del self._pending[key]
+                generation.future.add_done_callback(lambda _: _remove(generation.path))
+
+    def _start_generation(
+            self,
+            key:tuple,
+            values:dict[str,Any],
+            ) -> '_Generation':
+        """Submits the generation of the settings to the pool, rendering to a new temporary file"""
+        descriptor, path = tempfile.mkstemp(prefix='gcode-', suffix='.gcode')
+        os.close(descriptor)
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, render_gcode, values, self.settings.gcode_head, self.settings.gcode_tail, path)
+        generation = _Generation(future, path)
+        self._pending[key] = generation
+
+        def done(_) -> None:
+            if self._pending.get(key) is generation:
+                del self._pending[key]
+            self._generation_seconds += time.perf_counter() - start
+        future.add_done_callback(done)
+        return generation
+
+    def metrics(self) -> dict[str,Any]:
+        """Returns the metrics of the service: the requests served, by status, the latency of the last LATENCY_WINDOW
+        requests, the throughput since the start, the generations run and the requests coalesced into them.
+
+        Returns:
+            dict[str,Any]: the metrics
+        """
+        uptime = time.monotonic() - self._started
+        latencies = sorted(self._latencies)
+        requests = sum(self._statuses.values())
+        generations = self._counters['generations']
+        return {
+            'uptime_seconds': uptime,
+            'requests': requests,
+            'responses': {str(status): count for status, count in sorted(self._statuses.items())},
+            'in_flight': self._counters['in_flight'],
+            'generations': generations,
+            'generations_running': len(self._pending),
+            'coalesced': self._counters['coalesced'],
+            'generation_seconds_mean': self._generation_seconds/generations if generations else 0.0,
+            'latency_ms': {
+                'mean': 1000*sum(latencies)/len(latencies) if latencies else 0.0,
+                'p50': 1000*_percentile(latencies, 0.5),
+                'p95': 1000*_percentile(latencies, 0.95),
+                'p99': 1000*_percentile(latencies, 0.99),
+                'max': 1000*latencies[-1] if latencies else 0.0,
+            },
+            'requests_per_second': requests/uptime if uptime > 0 else 0.0,
+            'bytes_sent': self._counters['bytes_sent'],
+            'bytes_per_second': self._counters['bytes_sent']/uptime if uptime > 0 else 0.0,
+        }
+
+    async def _handle(
+            self,
+            reader:asyncio.StreamReader,
+            writer:asyncio.StreamWriter,
+            ) -> None:
+        """Serves one request per connection"""
+        self._counters['in_flight'] += 1
+        start = time.perf_counter()
+        status = 500
+        try:
+            status = await self._serve(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            status = 400
+        finally:
+            self._counters['in_flight'] -= 1
+            self._statuses[status] += 1
+            self._latencies.append(time.perf_counter() - start)
+            writer.close()
+
+    async def _serve(
+            self,
+            reader:asyncio.StreamReader,
+            writer:asyncio.StreamWriter,
+            ) -> int:
+        """Reads the request and answers it, returning the status"""
+        request_line = (await reader.readline()).decode('latin-1').split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if len(request_line) != 3:
+            return await self._send_json(writer, 400, {'error': 'malformed request'})
+        method, path, _ = request_line
+        path = path.split('?', 1)[0]
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return await self._send_json(writer, 400, {'error': 'malformed Content-Length'})
+        if length > MAX_BODY_SIZE:
+            return await self._send_json(writer, 413, {'error': f'the payload must be at most {MAX_BODY_SIZE} bytes'})
+        body = await reader.readexactly(length) if length > 0 else b''
+        if path == '/metrics':
+            if method != 'GET':
+                return await self._send_json(writer, 405, {'error': 'use GET'})
+            return await self._send_json(writer, 200, self.metrics())
+        if path != '/gcode':
+            return await self._send_json(writer, 404, {'error': f'no such endpoint {path}'})
+        if method != 'POST':
+            return await self._send_json(writer, 405, {'error': 'use POST'})
+        try:
+            values = parse_payload(json.loads(body or b'{}'), self.settings)
+        except ValueError as error:
+            return await self._send_json(writer, 400, {'error': str(error)})
+        async with AsyncExitStack() as stack:
+            try:
+                gcode = await stack.enter_async_context(self.generate(values))
+            except ValidationError as error:
+                return await self._send_json(writer, 422, {'error': str(error), 'report': error.report})
+            except Exception as error:
+                # e.g. a worker process killed: report it instead of hanging up
+                return await self._send_json(writer, 500, {'error': f'the generation failed: {error!r}'})
+            await self._send_head(writer, 200, {
+                'Content-Type': 'text/x-gcode; charset=utf-8',
+                'Content-Disposition': f'attachment; filename="{values["filename"]}.gcode"',
+                'Transfer-Encoding': 'chunked',
+            })
+            # copied from the file of the worker a chunk at a time
+            while chunk := gcode.read(CHUNK_SIZE):
+                writer.write(b'%x\r\n' % len(chunk))
+                writer.write(chunk)
+                writer.write(b'\r\n')
+                # wait for slow clients instead of buffering the whole file
+                await writer.drain()
+                self._counters['bytes_sent'] += len(chunk)
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return 200
+
+    async def _send_head(
+            self,
+            writer:asyncio.StreamWriter,
+            status:int,
+            headers:dict[str,str],
+            ) -> None:
+        """Writes the status line and the headers"""
+        lines = [f'HTTP/1.1 {status} {REASONS[status]}', *(f'{name}: {value}' for name, value in headers.items()), 'Connection: close', '', '']
+        writer.write('\r\n'.join(lines).encode('latin-1'))
+        await writer.drain()
+
+    async def _send_json(
+            self,
+            writer:asyncio.StreamWriter,
+            status:int,
+            content:dict[str,Any],
+            ) -> int:
+        """Writes a JSON response and returns its status"""
+        body = json.dumps(content).encode()
+        await self._send_head(writer, status, {'Content-Type': 'application/json', 'Content-Length': str(len(body))})
+        writer.write(body)
+        await writer.drain()
+        self._counters['bytes_sent'] += len(body)
+        return status
+
+
+class _Generation:
+
+    def __init__(
+            self,
+            future:asyncio.Future,
+            path:str,
+            ) -> None:
+        """A generation running in the pool, the temporary file it renders to, and the requests using it"""
+        self.future = future
+        self.path = path
+        self.users = 0
+
+
+def _remove(path:str) -> None:
+    """Removes a temporary file, if still there"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _percentile(
+        values:list[float],
+        fraction:float,
+        ) -> float:
+    """Returns the percentile of sorted values (nearest rank), 0 if there are none"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction*len(values)))]
+
+
+def main(argv:list[str]|None=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m src.service',
+        description=(
+            'Serves the g-code over HTTP: POST the settings to override, as JSON, to /gcode to get the g-code, '
+            'and GET /metrics for the latency and throughput of the service'
+        ),
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='the address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='the port to listen on (default: 8765)')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes (default: the number of CPUs)')
+    parser.add_argument('--settings', help='the settings file the requests override (default: settings.ini)')
+    parser.add_argument('--head', help='the g-code head file (default: gcode_head.ini)')
+    parser.add_argument('--tail', help='the g-code tail file (default: gcode_tail.ini)')
+    arguments = parser.parse_args(argv)
+    if arguments.workers is not None and arguments.workers < 1:
+        parser.error('--workers must be at least 1')
+    try:
+        settings = SettingsManager(arguments.settings, arguments.head, arguments.tail)
+    except ValueError as error:
+        parser.error(str(error))
+
+    async def serve() -> None:
+        service = GCodeService(settings, max_workers=arguments.workers)
+        try:
+            server = await service.start(arguments.host, arguments.port)
+            print(f'serving on http://{arguments.host}:{server.sockets[0].getsockname()[1]}', flush=True)
+            async with server:
+                await server.serve_forever()
+        finally:
+            service.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
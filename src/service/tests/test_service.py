@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+import pickle
+import tempfile
+from src.pipeline import ValidationError, generate_gcode
+from src.service import GCodeService, parse_payload, render_gcode
+from src.settings import SettingsManager
+import pytest
+
+@pytest.fixture
+def settings() -> SettingsManager:
+    return SettingsManager('defaults/settings.ini', 'defaults/gcode_head.ini', 'defaults/gcode_tail.ini')
+
+async def _request(port:int, method:str, path:str, body:bytes=b'') -> tuple[int,dict[str,str],bytes]:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b'\r\n\r\n')
+    status_line, *header_lines = head.decode().split('\r\n')
+    headers = {name.lower(): value.strip() for name, _, value in (line.partition(':') for line in header_lines)}
+    if headers.get('transfer-encoding') == 'chunked':
+        chunks = []
+        while True:
+            size, _, content = content.partition(b'\r\n')
+            if int(size, 16) == 0:
+                break
+            chunks.append(content[:int(size, 16)])
+            content = content[int(size, 16) + 2:]
+        content = b''.join(chunks)
+    return int(status_line.split()[1]), headers, content
+
+def test_parse_payload(settings:SettingsManager):
+    values = parse_payload({'number_of_layers': 4, 'SKETCH': {'print_segment': False}, 'plate_shape': 'squared'}, settings)
+    assert values['number_of_layers'] == 4 and values['print_segment'] is False and values['plate_shape'] == 'squared'
+    assert values['printing_speed'] == settings.value('printing_speed')
+    for payload in [[], {'unknown': 1}, {'number_of_layers': 0}, {'print_segment': 3}, {'x_width': None}]:
+        with pytest.raises(ValueError):
+            parse_payload(payload, settings)
+
+def test_validation_error_pickles(settings:SettingsManager):
+    report = {'valid': False, 'errors': [{'message': 'off the plate'}], 'warnings': []}
+    error = pickle.loads(pickle.dumps(ValidationError(report)))
+    assert error.report == report and str(error) == 'off the plate'
+
+def test_service(settings:SettingsManager):
+    async def run() -> None:
+        service = GCodeService(settings, max_workers=2)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            payload = json.dumps({'number_of_layers': 2}).encode()
+            status, headers, gcode = await _request(port, 'POST', '/gcode', payload)
+            assert status == 200 and headers['transfer-encoding'] == 'chunked'
+            assert headers['content-disposition'] == f'attachment; filename="{settings.value("filename")}.gcode"'
+            assert gcode.startswith(settings.gcode_head.encode()) and b'\nG1 ' in gcode
+            status, _, content = await _request(port, 'POST', '/gcode', b'{"purge_x": -700}')
+            assert status == 422 and not json.loads(content)['report']['valid']
+            assert (await _request(port, 'POST', '/gcode', b'{"number_of_layers": "many"}'))[0] == 400
+            assert (await _request(port, 'POST', '/gcode', b'not json'))[0] == 400
+            assert (await _request(port, 'GET', '/gcode'))[0] == 405
+            assert (await _request(port, 'GET', '/unknown'))[0] == 404
+            status, _, content = await _request(port, 'GET', '/metrics')
+            metrics = json.loads(content)
+            assert status == 200
+            assert metrics['requests'] == 6 and metrics['responses'] == {'200': 1, '400': 2, '404': 1, '405': 1, '422': 1}
+            assert metrics['generations'] == 2 and metrics['latency_ms']['max'] > 0
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+    asyncio.run(run())
+
+async def _read(service:GCodeService, values:dict) -> bytes:
+    async with service.generate(values) as gcode:
+        return gcode.read()
+
+def test_identical_requests_are_coalesced(settings:SettingsManager, tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    async def run() -> list[bytes]:
+        service = GCodeService(settings, max_workers=2)
+        try:
+            values = parse_payload({'number_of_layers': 2}, settings)
+            renamed = values | {'filename': 'other'}
+            different = values | {'number_of_layers': 3}
+            results = await asyncio.gather(*(_read(service, item) for item in [values, values, renamed, different]))
+            assert service.metrics()['generations'] == 2 and service.metrics()['coalesced'] == 2
+            # once done, a generation is not reused
+            await _read(service, values)
+            assert service.metrics()['generations'] == 3
+            with pytest.raises(ValidationError):
+                await _read(service, values | {'purge_x': -700})
+            await asyncio.sleep(0)
+            return results
+        finally:
+            service.close()
+    results = asyncio.run(run())
+    assert results[0] == results[1] == results[2] != results[3]
+    # the files of the workers are removed once sent
+    assert os.listdir(tmp_path) == []
+
+def test_render_gcode(settings:SettingsManager, tmp_path):
+    values = settings.as_dict() | {'number_of_layers': 2}
+    size = render_gcode(values, settings.gcode_head, settings.gcode_tail, str(tmp_path/'worker.gcode'))
+    generate_gcode(values, settings.gcode_head, settings.gcode_tail, output=str(tmp_path/'direct.gcode'))
+    assert (tmp_path/'worker.gcode').read_bytes() == (tmp_path/'direct.gcode').read_bytes()
+    assert size == os.path.getsize(tmp_path/'worker.gcode')
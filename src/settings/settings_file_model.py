@@ -1,45 +1,63 @@
+from typing import NamedTuple
+
+
+class Setting(NamedTuple):
+    """The declared type and range of a setting. The ranges are inclusive; a positive setting must be greater than 0."""
+    type: type
+    minimum: float|None = None
+    maximum: float|None = None
+    positive: bool = False
+    choices: tuple|None = None
+
+
 settings_model = {
-    'GCODE': [
-        'filename',
-        ],
-    'PRINTER': [
-        'plate_shape',
-        'plate_size',
-        'printing_speed',
-        'first_inlet_diameter',
-        'last_inlet_diameter',
-        'moving_speed',
-        'retraction',
-        'lift_distance',
-        'x_home',
-        'y_home',
-        'z_home',
-        'purge_nozzle',
-        ],
-    'PURGE SEGMENT': [
-        'purge_x',
-        'purge_y',
-        'is_vertical',
-        'length',
-        'purge_inlet_diameter',
-        ],
-    'SERPENTINE': [
-        'x_width',
-        'y_width',
-        'constant_pitch',
-        'min_pitch',
-        'centered_serpentine',
-        'x_pos',
-        'y_pos',
-        ],
-    'SEGMENT': [
-        'centered_segment',
-        'segment_y_pos',
-        ],
-    'SKETCH':[
-        'layer_height',
-        'layer_width',
-        'number_of_layers',
-        'print_segment',
-        ],
-}
\ No newline at end of file
+    'GCODE': {
+        'filename': Setting(str),
+        },
+    'PRINTER': {
+        'plate_shape': Setting(str, choices=('rounded', 'squared')),
+        'plate_size': Setting(float, positive=True),
+        'printing_speed': Setting(float, positive=True),
+        'first_inlet_diameter': Setting(float, positive=True),
+        'last_inlet_diameter': Setting(float, positive=True),
+        'moving_speed': Setting(float, positive=True),
+        'retraction': Setting(float, minimum=0),
+        'lift_distance': Setting(float, minimum=0),
+        'x_home': Setting(float),
+        'y_home': Setting(float),
+        'z_home': Setting(float, minimum=0),
+        'purge_nozzle': Setting(bool),
+        },
+    'PURGE SEGMENT': {
+        'purge_x': Setting(float),
+        'purge_y': Setting(float),
+        'is_vertical': Setting(bool),
+        'length': Setting(float, positive=True),
+        'purge_inlet_diameter': Setting(float, positive=True),
+        },
+    'SERPENTINE': {
+        'x_width': Setting(float, positive=True),
+        'y_width': Setting(float, positive=True),
+        'constant_pitch': Setting(bool),
+        'min_pitch': Setting(float, positive=True),
+        'centered_serpentine': Setting(bool),
+        'x_pos': Setting(float),
+        'y_pos': Setting(float),
+        },
+    'SEGMENT': {
+        'centered_segment': Setting(bool),
+        'segment_y_pos': Setting(float, minimum=0, maximum=1),
+        },
+    'SKETCH': {
+        'layer_height': Setting(float, positive=True),
+        'layer_width': Setting(float, positive=True),
+        'number_of_layers': Setting(int, minimum=1),
+        'print_segment': Setting(bool),
+        },
+}
+# the declaration of each setting, indexed by option name
+settings_index = {
+    option: setting
+    for options in settings_model.values()
+    for option, setting in options.items()
+}
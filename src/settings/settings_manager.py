@@ -1,7 +1,7 @@
 from ast import literal_eval
 import configparser
 import os
-from src.settings.settings_file_model import settings_model
+from src.settings.settings_file_model import settings_index, settings_model
 import shutil
 from typing import Any
 
@@ -12,14 +12,38 @@ class SettingsManager(configparser.ConfigParser):
     GCODE_HEAD_FILE_NAME = 'gcode_head.ini'
     GCODE_TAIL_FILE_NAME = 'gcode_tail.ini'
     
-    def __init__(self):
+    def __init__(
+            self,
+            settings_file_name:str|None=None,
+            gcode_head_file_name:str|None=None,
+            gcode_tail_file_name:str|None=None,
+            ):
+        """Class managing the settings, g-code head and g-code tail files.
+        The files missing from the working directory are copied from the defaults folder,
+        unless a different file name is given.
+
+        Args:
+            settings_file_name (str | None): the settings file to read instead of settings.ini
+            gcode_head_file_name (str | None): the g-code head file to read instead of gcode_head.ini
+            gcode_tail_file_name (str | None): the g-code tail file to read instead of gcode_tail.ini
+        """
+        self._values = {}
+        self._texts = {}
+        self._file_stamp = None
+        self._gcode_stamps = {}
         super().__init__(allow_no_value=True)
         self.settings_model = settings_model
         self.gcode_head=''
         self.gcode_tail=''
-        self.check_settings_file(self.SETTINGS_FILE_NAME)
-        self.check_settings_file(self.GCODE_HEAD_FILE_NAME)
-        self.check_settings_file(self.GCODE_TAIL_FILE_NAME)
+        for attribute, file_name in [
+                ('SETTINGS_FILE_NAME', settings_file_name),
+                ('GCODE_HEAD_FILE_NAME', gcode_head_file_name),
+                ('GCODE_TAIL_FILE_NAME', gcode_tail_file_name),
+                ]:
+            if file_name is None:
+                self.check_settings_file(getattr(self, attribute))
+            else:
+                setattr(self, attribute, file_name)
         self.load_settings()
 
     def check_settings_file(self,file_to_check) -> None:
@@ -30,28 +54,196 @@ class SettingsManager(configparser.ConfigParser):
 
     def load_settings(self) -> None:
         self.read(self.SETTINGS_FILE_NAME)
+        self._file_stamp = self._stamp(self.SETTINGS_FILE_NAME)
+        self._update_index()
+        self._gcode_stamps = {
+            'gcode_head': self._stamp(self.GCODE_HEAD_FILE_NAME),
+            'gcode_tail': self._stamp(self.GCODE_TAIL_FILE_NAME),
+        }
         with open(self.GCODE_HEAD_FILE_NAME,'r') as head_file:
             self.gcode_head+=head_file.read()
         with open(self.GCODE_TAIL_FILE_NAME,'r') as tail_file:
             self.gcode_tail+=tail_file.read()
 
+    def reload_if_changed(self) -> set[str]:
+        """Reads the settings file again if it changed on disk since it was last read.
+        Only the options whose text changed are converted again.
+
+        Returns:
+            set[str]: the options whose value changed, added or removed (empty if the file did not change)
+
+        Raises:
+            ValueError: if the file cannot be parsed, or a value does not match its declared type or range.
+                The settings read last are kept, and the file is read again on the next call
+        """
+        stamp = self._stamp(self.SETTINGS_FILE_NAME)
+        # a missing file is being replaced: keep the settings read last
+        if stamp is None or stamp == self._file_stamp:
+            return set()
+        with open(self.SETTINGS_FILE_NAME,'r') as settings_file:
+            text = settings_file.read()
+        # parsed aside first, so that an invalid file leaves the current settings untouched
+        parser = configparser.ConfigParser(allow_no_value=True)
+        try:
+            parser.read_string(text, self.SETTINGS_FILE_NAME)
+        except configparser.Error as error:
+            raise ValueError(str(error)) from None
+        changed = self._update_index(parser)
+        for section in self.sections():
+            self.remove_section(section)
+        self.read_string(text, self.SETTINGS_FILE_NAME)
+        self._file_stamp = stamp
+        return changed
+
+    def reload_gcode_if_changed(self) -> set[str]:
+        """Reads the g-code head and tail files again if they changed on disk since they were last read.
+
+        Returns:
+            set[str]: 'gcode_head' and/or 'gcode_tail', for the texts that changed (empty if no file changed)
+        """
+        changed = set()
+        for attribute, file_name in [
+                ('gcode_head', self.GCODE_HEAD_FILE_NAME),
+                ('gcode_tail', self.GCODE_TAIL_FILE_NAME),
+                ]:
+            stamp = self._stamp(file_name)
+            # a missing file is being replaced: keep the text read last
+            if stamp is None or stamp == self._gcode_stamps.get(attribute):
+                continue
+            self._gcode_stamps[attribute] = stamp
+            with open(file_name,'r') as gcode_file:
+                text = gcode_file.read()
+            if text != getattr(self, attribute):
+                setattr(self, attribute, text)
+                changed.add(attribute)
+        return changed
+
     def convert_type(self,value:Any) -> Any:
         """
         Convert the type of value from string to the correct type (int, float, etc.)
         """
         try:
             return literal_eval(value)
-        except ValueError:
+        except (ValueError, SyntaxError):
             return value
 
+    def parse_value(
+            self,
+            option:str,
+            text:str,
+            ) -> Any:
+        """Converts the text of a setting to the type declared in the settings model and checks its range.
+        The options out of the model are converted with convert_type.
+
+        Args:
+            option (str): the name of the setting
+            text (str): its text, as written in the settings file
+
+        Returns:
+            Any: the value
+
+        Raises:
+            ValueError: if the value does not match the declared type or range
+        """
+        setting = settings_index.get(option)
+        if setting is None:
+            return self.convert_type(text)
+        text = text.strip()
+        if setting.type is str:
+            value = text
+        elif setting.type is bool:
+            if text.lower() not in self.BOOLEAN_STATES:
+                raise ValueError(f'{option} must be True or False, got {text}')
+            value = self.BOOLEAN_STATES[text.lower()]
+        else:
+            value = self.convert_type(text)
+            # an integer is a valid float setting, and stays an integer
+            accepted = (int,) if setting.type is int else (int, float)
+            if isinstance(value, bool) or not isinstance(value, accepted):
+                raise ValueError(f'{option} must be {"an integer" if setting.type is int else "a number"}, got {text}')
+        if setting.choices is not None and value not in setting.choices:
+            raise ValueError(f'{option} must be one of {", ".join(setting.choices)}, got {text}')
+        if setting.positive and value <= 0:
+            raise ValueError(f'{option} must be greater than 0, got {text}')
+        if setting.minimum is not None and value < setting.minimum:
+            raise ValueError(f'{option} must be at least {setting.minimum:g}, got {text}')
+        if setting.maximum is not None and value > setting.maximum:
+            raise ValueError(f'{option} must be at most {setting.maximum:g}, got {text}')
+        return value
+
     def value(self,setting:str) -> Any:
-        setting_value = None
-        for section in self.sections():
-            for option in self.options(section):
-                if option == setting:
-                    setting_value = self.convert_type(self.get(section, option))
-                    break
-        if setting_value is not None:
-            return setting_value
+        try:
+            return self._values[setting]
+        except KeyError:
+            raise TypeError('Value not found') from None
+
+    def as_dict(self) -> dict[str,Any]:
+        """Returns the value of every setting of the settings model
+
+        Returns:
+            dict[str,Any]: the settings, indexed by option name
+        """
+        return {option: self.value(option) for option in settings_index}
+
+    def _stamp(self, file_name:str) -> tuple[int,int]|None:
+        try:
+            status = os.stat(file_name)
+        except OSError:
+            return None
+        return status.st_mtime_ns, status.st_size
+
+    def _update_index(
+            self,
+            parser:configparser.ConfigParser|None=None,
+            ) -> set[str]:
+        """Converts the options whose text changed since the last update, and indexes the values by option name.
+        Every option is converted before any value is replaced, so that an invalid one changes nothing.
+
+        Args:
+            parser (configparser.ConfigParser | None): the parsed settings file. Defaults to the settings manager itself
+
+        Returns:
+            set[str]: the options whose value changed, added or removed
+
+        Raises:
+            ValueError: if a value does not match its declared type or range
+        """
+        if parser is None:
+            parser = self
+        texts = {}
+        for section in parser.sections():
+            for option in parser.options(section):
+                text = parser.get(section, option)
+                if text is not None and option not in texts:
+                    texts[option] = text
+        values = {}
+        for option, text in texts.items():
+            if self._texts.get(option) != text:
+                values[option] = self.parse_value(option, text)
+        removed = {option for option in self._texts if option not in texts}
+        for option in removed:
+            self._values.pop(option, None)
+        self._values |= values
+        self._texts = texts
+        return removed | set(values)
+
+    def set(
+            self,
+            section:str,
+            option:str,
+            value:str|None=None,
+            ) -> None:
+        """Sets an option, as ConfigParser.set does, keeping the typed values up to date.
+
+        Raises:
+            ValueError: if the value does not match the declared type or range
+        """
+        option = self.optionxform(option)
+        parsed = None if value is None else self.parse_value(option, value)
+        super().set(section, option, value)
+        if value is None:
+            self._values.pop(option, None)
+            self._texts.pop(option, None)
         else:
-            raise TypeError('Value not found')
\ No newline at end of file
+            self._values[option] = parsed
+            self._texts[option] = value
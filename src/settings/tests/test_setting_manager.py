@@ -15,4 +15,79 @@ def test_value(settings: SettingsManager):
 
 def test_value_failed(settings: SettingsManager):
     with pytest.raises(TypeError):
-        settings.value('test')
\ No newline at end of file
+        settings.value('test')
+
+def test_typed_values(settings: SettingsManager):
+    assert settings.parse_value('filename', '/tmp/test') == '/tmp/test'
+    assert settings.parse_value('purge_nozzle', 'false') is False
+    assert settings.parse_value('number_of_layers', '3') == 3
+    assert type(settings.parse_value('x_width', '100')) is int
+    assert settings.parse_value('x_width', '99.5') == 99.5
+    for option, text in [
+            ('number_of_layers', '2.5'),
+            ('number_of_layers', '0'),
+            ('plate_shape', 'triangular'),
+            ('purge_nozzle', 'maybe'),
+            ('min_pitch', '0'),
+            ('segment_y_pos', '1.5'),
+            ('x_width', 'wide'),
+            ]:
+        with pytest.raises(ValueError):
+            settings.parse_value(option, text)
+
+def test_set_updates_values(settings: SettingsManager):
+    settings.set('SKETCH', 'number_of_layers', '7')
+    assert settings.value('number_of_layers') == 7
+    assert settings.as_dict()['number_of_layers'] == 7
+    with pytest.raises(ValueError):
+        settings.set('SKETCH', 'number_of_layers', '-1')
+    assert settings.value('number_of_layers') == 7
+
+def test_reload_if_changed(tmp_path):
+    settings_file = tmp_path/'settings.ini'
+    settings_file.write_text(open('defaults/settings.ini').read())
+    settings = SettingsManager(str(settings_file), 'defaults/gcode_head.ini', 'defaults/gcode_tail.ini')
+    assert settings.reload_if_changed() == set()
+    settings_file.write_text(settings_file.read_text().replace('number_of_layers = 10', 'number_of_layers = 4'))
+    assert settings.reload_if_changed() == {'number_of_layers'}
+    assert settings.value('number_of_layers') == 4
+    assert settings.reload_if_changed() == set()
+    lines = settings_file.read_text().splitlines()
+    settings_file.write_text('\n'.join(line for line in lines if not line.startswith('print_segment')))
+    assert settings.reload_if_changed() == {'print_segment'}
+    with pytest.raises(TypeError):
+        settings.value('print_segment')
+
+def test_reload_if_changed_after_invalid_edit(tmp_path):
+    settings_file = tmp_path/'settings.ini'
+    valid = open('defaults/settings.ini').read()
+    settings_file.write_text(valid)
+    settings = SettingsManager(str(settings_file), 'defaults/gcode_head.ini', 'defaults/gcode_tail.ini')
+    lines = valid.replace('number_of_layers = 10', 'number_of_layers = -3').splitlines()
+    settings_file.write_text('\n'.join(line for line in lines if not line.startswith('print_segment')))
+    with pytest.raises(ValueError):
+        settings.reload_if_changed()
+    # nothing was replaced, and the file is read again until it is fixed
+    assert settings.value('number_of_layers') == 10
+    assert settings.get('SKETCH', 'number_of_layers') == '10'
+    assert settings.value('print_segment') is False
+    with pytest.raises(ValueError):
+        settings.reload_if_changed()
+    settings_file.write_text(valid.replace('number_of_layers = 10', 'number_of_layers = 4'))
+    assert settings.reload_if_changed() == {'number_of_layers'}
+    assert settings.value('number_of_layers') == 4
+    settings_file.write_text('number_of_layers = 4')
+    with pytest.raises(ValueError):
+        settings.reload_if_changed()
+
+def test_reload_gcode_if_changed(settings: SettingsManager, tmp_path):
+    head_file = tmp_path/'gcode_head.ini'
+    head_file.write_text('G28')
+    settings = SettingsManager(settings.SETTINGS_FILE_NAME, str(head_file), settings.GCODE_TAIL_FILE_NAME)
+    assert settings.reload_gcode_if_changed() == set()
+    head_file.write_text('G28 X Y')
+    assert settings.reload_gcode_if_changed() == {'gcode_head'}
+    assert settings.gcode_head == 'G28 X Y'
+    head_file.unlink()
+    assert settings.reload_gcode_if_changed() == set()
+    assert settings.gcode_head == 'G28 X Y'
@@ -1,4 +1,6 @@
-from itertools import accumulate
+from math import floor, sqrt
+import numpy as np
+from src.numeric import py_round
 
 class Serpentine:
 
@@ -43,35 +45,62 @@ class Serpentine:
         Returns:
             list[float]: the distances along x
         """
-        delta = []
-        i=1
-        while sum(delta) + self.min_pitch*i <= self.x_width:
-            delta.append(self.min_pitch*i)
-            if self.constant_pitch is False:
-                i+=0.5
-        if len(delta) % 2 == 0:
+        step = 0 if self.constant_pitch is True else 0.5
+        n = self._count_segments(step)
+        if n % 2 == 0:
             # we want a serpentine that starts and ends at the same y position, so if the number of segments
             # is even, we just have to cut the last one
-            _ = delta.pop()
-        self.distances = list([*accumulate(list(reversed(delta)))])
+            n = max(n - 1, 0)
+        delta = self.min_pitch*(1 + step*np.arange(n))
+        self._distances = np.cumsum(delta[::-1])
+        self.distances = self._distances.tolist()
         return self.distances
 
+    def _count_segments(
+            self,
+            step:float
+            ) -> int:
+        """Counts the pitches fitting in x_width, where the k-th pitch is min_pitch*(1 + step*k).
+        The count is solved in closed form, then checked against the exact running sum, so that the
+        boundary case is decided exactly as when the pitches are added one by one.
+
+        Args:
+            step (float): the increase of the pitch multiplier from one segment to the next
+
+        Returns:
+            int: the number of pitches
+        """
+        ratio = self.x_width/self.min_pitch
+        if step == 0:
+            estimate = floor(ratio)
+        else:
+            # sum of the first k pitches plus the next one: min_pitch*(k**2 + 5*k + 4)/4 <= x_width
+            estimate = floor((-5 + sqrt(max(9 + 16*ratio, 0)))/2) + 1
+        n = max(estimate, 0)
+
+        def fits(k:int) -> bool:
+            delta = (self.min_pitch*(1 + step*np.arange(k))).tolist()
+            return sum(delta) + self.min_pitch*(1 + step*k) <= self.x_width
+
+        while n > 0 and not fits(n - 1):
+            n -= 1
+        while fits(n):
+            n += 1
+        return n
+
     def _gen_x_coords(self) -> None:
         """Generates the set of coordinates along the x axis
         """
         x_home = self.x_pos
-        distances = self._gen_distances()
+        self._gen_distances()
         self.x_coords = [x_home,x_home]
-        self.x_coords += [round(i + x_home,2) for i in distances for _ in range(2)]
+        self.x_coords += np.repeat(py_round(self._distances + x_home, 2), 2).tolist()
 
     def _gen_y_coords(self) -> None:
         """Generates the set of coordinates along the y axis
-        """        
-        coords = [self.y_width for i in range(len(self.x_coords))]
-        mask = [0,1,1,0]
-        self.y_coords = []
-        for i in range(len(self.x_coords)):
-            self.y_coords.append(self.y_pos + coords[i]*mask[i%4])
+        """
+        mask = np.resize(np.array([0,1,1,0]), len(self.x_coords))
+        self.y_coords = (self.y_pos + self.y_width*mask).tolist()
     
     def _gen_filament_diameters(self, first_inlet_diameter, last_inlet_diameter) -> None:
         """Generates the filament diameter for each point of the serpentine.
@@ -94,12 +123,9 @@ class Serpentine:
             self.filament_diameters = [first_inlet_diameter] * n_points
             return
 
-        self.filament_diameters = []
-        for i in range(n_points):
-            # Which vertical segment does this point belong to?
-            seg_index = i // 2
-            diameter = first_inlet_diameter + (last_inlet_diameter - first_inlet_diameter) * seg_index / (n_vertical - 1)
-            self.filament_diameters.append(round(diameter, 3))
+        seg_index = np.arange(n_vertical)
+        diameters = first_inlet_diameter + (last_inlet_diameter - first_inlet_diameter) * seg_index / (n_vertical - 1)
+        self.filament_diameters = np.repeat(py_round(diameters, 3), 2).tolist()
 
     def save_serpentine_info(
             self,
@@ -0,0 +1,46 @@
+from itertools import accumulate
+from src.shapes import Serpentine
+import pytest
+
+
+def reference_geometry(x_pos, y_pos, x_width, y_width, constant_pitch, min_pitch, first, last):
+    """Point by point construction of the serpentine, kept as the reference for the array based one"""
+    delta = []
+    i = 1
+    while sum(delta) + min_pitch*i <= x_width:
+        delta.append(min_pitch*i)
+        if constant_pitch is False:
+            i += 0.5
+    if len(delta) % 2 == 0 and len(delta) > 0:
+        delta.pop()
+    distances = list(accumulate(reversed(delta)))
+    x_coords = [x_pos, x_pos] + [round(i + x_pos, 2) for i in distances for _ in range(2)]
+    mask = [0, 1, 1, 0]
+    y_coords = [y_pos + y_width*mask[i % 4] for i in range(len(x_coords))]
+    n_vertical = len(x_coords)//2
+    if n_vertical <= 1:
+        diameters = [first]*len(x_coords)
+    else:
+        diameters = [round(first + (last - first)*(i//2)/(n_vertical - 1), 3) for i in range(len(x_coords))]
+    return distances, x_coords, y_coords, diameters
+
+
+@pytest.mark.parametrize('constant_pitch', [True, False])
+@pytest.mark.parametrize('min_pitch', [0.1, 0.3, 0.7, 1, 1.5, 2.2, 7, 33])
+@pytest.mark.parametrize('x_width', [1, 10, 99.9, 100, 137.5, 250])
+def test_matches_reference(constant_pitch, min_pitch, x_width):
+    args = (-50.0, -50.0, x_width, 100, constant_pitch, min_pitch, 10, 20.5)
+    serpentine = Serpentine(*args)
+    distances, x_coords, y_coords, diameters = reference_geometry(*args)
+    assert serpentine.distances == distances
+    assert serpentine.x_coords == x_coords
+    assert serpentine.y_coords == y_coords
+    assert serpentine.filament_diameters == diameters
+
+
+def test_vertical_segments_info():
+    serpentine = Serpentine(-50.0, -50.0, 100, 100, False, 1, 10, 20)
+    info = serpentine.vertical_segments_info
+    assert info[0] == {'n': 1, 'x position': -50.0, 'inlet diameter': 10, 'distance from previous': 0}
+    assert info[-1]['inlet diameter'] == 20
+    assert len(info) == serpentine.number_of_segments//2
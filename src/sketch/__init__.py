@@ -1,3 +1,3 @@
-from src.sketch.sketch import Sketch
+from src.sketch.sketch import Sketch, SketchLayers
 
-__all__ = ['Sketch']
+__all__ = ['Sketch', 'SketchLayers']
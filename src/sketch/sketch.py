@@ -1,3 +1,6 @@
+from typing import Iterator
+
+
 class Sketch:
     
     def __init__(
@@ -14,20 +17,32 @@ class Sketch:
         self.layer_height=layer_height
         self.number_of_layers=number_of_layers
         self.layer_sequence = []
+        self.layer_templates = []
+        self.templates = []
         self.coordinates = []
 
     def gen_coordinates(
             self
             ) -> None:
-        """Generates the coordinates and filament diameters of each point of the sketch"""
+        """Generates the coordinates and filament diameters of each point of the sketch.
+        Each layer also records the index of its template, the trace it repeats, in self.templates."""
+        self.coordinates.extend(self.iter_coordinates())
+
+    def iter_coordinates(
+            self
+            ) -> Iterator[dict]:
+        """Yields the layers of gen_coordinates one at a time, without storing them (see SketchLayers).
+
+        Yields:
+            dict: the 'z', 'trace' and 'template' of the next layer
+        """
         height = self.layer_height
-        for layer in self.layer_sequence:
-            self.coordinates.append(
-                {
-                    'z':height,
-                    'trace':layer,
-                }
-            )
+        for layer, template in zip(self.layer_sequence, self.layer_templates):
+            yield {
+                'z':height,
+                'trace':layer,
+                'template':template,
+            }
             height+=self.layer_height
     
     def gen_serpentine_layers(
@@ -39,8 +54,10 @@ class Sketch:
         Args:
             serpentine_trace_info (list[dict[float,float,float]]): List of dictionaries containing the 'x', 'y' and 'filament_diameter' value of each serpentine point
         """
+        template = self._add_template(serpentine_trace_info)
         for i in range(self.number_of_layers):
             self.layer_sequence.append(serpentine_trace_info)
+            self.layer_templates.append(template)
     
     def gen_segment_layer(
             self,
@@ -52,3 +69,41 @@ class Sketch:
             segment_trace_info (list[dict[float,float,float]]): List of dictionaries containing the 'x', 'y' and 'filament_diameter' value of each segment point
         """
         self.layer_sequence.append(segment_trace_info)
+        self.layer_templates.append(self._add_template(segment_trace_info))
+
+    def _add_template(
+            self,
+            trace_info
+            ) -> int:
+        """Registers a trace as a layer template
+
+        Args:
+            trace_info (list[dict[float,float,float]]): the trace repeated by one or more layers
+
+        Returns:
+            int: the index of the template
+        """
+        self.templates.append(trace_info)
+        return len(self.templates) - 1
+
+
+class SketchLayers:
+
+    def __init__(
+            self,
+            sketch:Sketch,
+            ) -> None:
+        """The layers of a sketch, as in Sketch.coordinates, yielded again by Sketch.iter_coordinates each time
+        they are iterated instead of being stored. Validating then printing a job takes two passes over its layers,
+        each holding one layer at a time.
+
+        Args:
+            sketch (Sketch): the sketch
+        """
+        self.sketch = sketch
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.sketch.iter_coordinates()
+
+    def __len__(self) -> int:
+        return len(self.sketch.layer_sequence)